@@ -45,11 +45,16 @@ dmanager = dumper.DumperManager(job_manager=job_manager)
 dmanager.register_sources(dataload_sources)
 dmanager.schedule_all()
 
+from hub.dataload.BiointeractParser import BiointeractParser
+from hub.dataload.BiointeractUploader import parse_profiles, memory_reports, pipeline_reports
+
 import biothings.hub.databuild.builder as builder
 from hub.databuild.builder import InteractionDataBuilder
+from hub.databuild.mapper import InteractorMapper
 mappers = [
 ]
-pbuilder = partial(InteractionDataBuilder, mappers=mappers)
+# sources without a mapper of their own get their interactors in '_id' order
+pbuilder = partial(InteractionDataBuilder, mappers=mappers, default_mapper_class=InteractorMapper)
 bmanager = builder.BuilderManager(
         job_manager=job_manager,
         builder_class=pbuilder,
@@ -86,6 +91,13 @@ EXTRA_NS = {
         "top" : job_manager.top,
         "pending" : pending,
         "done" : done,
+        # parse profiling reports of uploads run with PARSE_PROFILING in the config,
+        # and profiling of parsers run from the shell
+        "parse_profiles" : parse_profiles,
+        "memory_reports" : memory_reports,
+        "pipeline_reports" : pipeline_reports,
+        "enable_profiling" : BiointeractParser.enable_profiling,
+        "disable_profiling" : BiointeractParser.disable_profiling,
         }
 
 from biothings.utils.hub import start_server
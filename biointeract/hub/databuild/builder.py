@@ -1,9 +1,301 @@
-from biothings.utils.mongo import doc_feeder, get_target_db
+"""
+InteractionDataBuilder merges the interaction source collections into
+a target collection.
+
+With BUILD_MERGE_JOIN set in the hub config (or 'merge_join' set in the
+build configuration), a full build reads every source collection in
+'_id' order and k-way merge-joins them: the documents of all sources
+sharing an '_id' are merged in memory and the merged document is
+inserted once, in '_id' order, in a single sequential pass.  This
+replaces the per-source batches of upserts of DataBuilder, whose cost
+grows with random lookups into the target collection.  Sources uploaded
+with UPLOAD_SORTED_IDS are stored in '_id' order, so the '_id' ordered
+reads are sequential as well.
+
+Source documents are merged in the DataBuilder order (root sources
+first, then the other sources, each by name): top-level keys of a later
+source replace those of an earlier one, or are merged with merge_struct
+for sources registered with the 'merge_struct' merger.  When root
+sources are defined, only '_id's present in a root source are stored.
+
+With BUILD_INCREMENTAL set (or 'incremental' in the build configuration,
+or incremental=True passed to merge), a build of all sources patches the
+latest build of the configuration instead of creating a new target when
+every changed source was uploaded as a changeset on top of the release
+in that build (see hub.databuild.changeset).  The changed '_id's are
+removed from the target and re-merged from all sources, so updates,
+inserts and deletes give the same documents as a full build.  The
+changes of the target are recorded in its '<target>_changeset'
+collection so that the index can be patched.  A full build is done when
+no changeset applies, or when more than BUILD_INCREMENTAL_MAX_RATIO
+(default 0.2) of the target documents changed.
+
+Source Project:   biothings.interactions
+"""
+import biothings, config
+biothings.config_for_app(config)
+
+from functools import partial
+from biothings.utils.common import iter_n
+from biothings.utils.hub_db import get_source_fullname
+from biothings.utils.mongo import doc_feeder, get_src_db, get_target_db
 from biothings.hub.databuild.builder import DataBuilder
 from biothings.hub.dataload.storage import UpsertStorage
+from hub.databuild.changeset import changed_ids, existing_ids, source_changeset, target_changes
+from hub.databuild.mergejoin import merge_documents, merge_join
 
 # from hub.databuild.mapper import BiogridMapper
 
 
+def merge_join_worker(sources, target_name, root_sources=None, batch_size=10000):
+    """
+    Pickable job merge-joining the source collections into the target collection.
+    :param sources: list of (source name, collection name, query, mapper, cleaner, merger) tuples
+    :param target_name: the target collection name
+    :param root_sources: the root source names, all '_id's are stored if empty
+    :param batch_size: number of merged documents per insert
+    :return: dictionary of the number of documents merged per source, and in total
+    """
+    src_db = get_src_db()
+    target = get_target_db()[target_name]
+    root_sources = set(root_sources or [])
+
+    streams = []
+    mergers = {}
+    for (name, col_name, query, mapper, cleaner, merger) in sources:
+        docs = src_db[col_name].find(query or {}, no_cursor_timeout=True).sort('_id', 1)
+        if cleaner:
+            docs = map(cleaner, docs)
+        mapper.load()
+        streams.append((name, mapper.process(docs)))
+        mergers[name] = merger
+
+    counts = dict((name, 0) for (name, _, _, _, _, _) in sources)
+    total = 0
+    batch = []
+    for (_id, group) in merge_join(streams):
+        names = [name for (name, _) in group]
+        if root_sources and root_sources.isdisjoint(names):
+            continue
+        for name in names:
+            counts[name] += 1
+        batch.append(merge_documents(group, mergers))
+        if len(batch) >= batch_size:
+            target.insert_many(batch, ordered=False)
+            total += len(batch)
+            batch = []
+    if batch:
+        target.insert_many(batch, ordered=False)
+        total += len(batch)
+    counts['total'] = total
+    return counts
+
+
 class InteractionDataBuilder(DataBuilder):
-    pass
+
+    # Maximum fraction of the target documents re-merged by an incremental build
+    incremental_max_ratio = 0.2
+
+    # Changes applied by the current incremental build, None for a full build
+    incremental = None
+
+    def use_merge_join(self):
+        """
+        Return True if full builds merge-join the sorted source collections.
+        """
+        return bool(self.build_config.get('merge_join', getattr(config, 'BUILD_MERGE_JOIN', False)))
+
+    def use_incremental(self):
+        """
+        Return True if builds of all sources patch the latest build when possible.
+        """
+        return bool(self.build_config.get('incremental', getattr(config, 'BUILD_INCREMENTAL', False)))
+
+    def latest_build(self, target_name=None):
+        """
+        Return the src_build document of target_name, or of the latest successful
+        build of the configuration if None.
+        """
+        src_build = self.source_backend.build
+        if target_name:
+            return src_build.find_one({'_id': target_name})
+        builds = [b for b in src_build.find({'build_config.name': self.build_config['name'],
+                                             '_meta': {'$exists': True}})
+                  if b.get('jobs') and b['jobs'][-1].get('status') == 'success']
+        return max(builds, key=lambda b: b['started_at']) if builds else None
+
+    def incremental_changes(self, target_name=None):
+        """
+        Collect the changesets to apply to the latest build.
+        :param target_name: the target to patch, the latest build if None
+        :return: dictionary of the target name, the changesets by source and the
+                 changed '_id's, or None if a full build is needed
+        """
+        build = self.latest_build(target_name)
+        if not build or not build.get('_meta'):
+            self.logger.info("No previous build to patch, running a full build")
+            return None
+        target = get_target_db()[build['_id']]
+        target_count = target.count()
+        if not target_count:
+            self.logger.info("Target '%s' is empty, running a full build" % build['_id'])
+            return None
+
+        versions = build['_meta'].get('src', {})
+        src_dump = self.source_backend.dump
+        changesets = {}
+        for src_name in self.build_config['sources']:
+            main_name = get_source_fullname(src_name).split(".")[0]
+            src_doc = src_dump.find_one({'_id': main_name}) or {}
+            try:
+                changeset = source_changeset(src_doc, src_name, versions.get(main_name, {}).get('version'))
+            except ValueError as e:
+                self.logger.info("%s, running a full build" % e)
+                return None
+            if changeset:
+                changesets[src_name] = changeset
+
+        ids = changed_ids(get_src_db(), changesets.values())
+        max_ratio = getattr(config, 'BUILD_INCREMENTAL_MAX_RATIO', self.incremental_max_ratio)
+        if len(ids) > max_ratio * target_count:
+            self.logger.info("%d of %d documents of '%s' changed, running a full build"
+                             % (len(ids), target_count, build['_id']))
+            return None
+        return {'target': build['_id'], 'changesets': changesets, 'ids': ids}
+
+    def merge(self, sources=None, target_name=None, force=False, ids=None, steps=["merge", "post", "metadata"],
+              job_manager=None, incremental=None, *args, **kwargs):
+        """
+        Merge the sources as DataBuilder.merge, patching the latest build with the
+        source changesets if incremental (by default if enabled in the configuration)
+        and all sources are merged.
+        """
+        self.incremental = None
+        if incremental is None:
+            incremental = self.use_incremental()
+        if incremental and sources is None and ids is None:
+            self.incremental = self.incremental_changes(target_name)
+            if self.incremental:
+                target_name = self.incremental['target']
+                # the target is kept when the sources are given
+                sources = self.build_config['sources']
+                self.logger.info("Patching '%s' with %d changed documents of %s"
+                                 % (target_name, len(self.incremental['ids']), sorted(self.incremental['changesets'])))
+        return super(InteractionDataBuilder, self).merge(sources, target_name, force, ids, steps,
+                                                         job_manager, *args, **kwargs)
+
+    def remove_changed(self, ids, batch_size):
+        """
+        Remove the changed '_id's from the target before they are re-merged.
+        :return: set of the changed '_id's found in the target
+        """
+        target = get_target_db()[self.target_backend.target_name]
+        before = existing_ids(target, ids, batch_size)
+        for chunk in iter_n(ids, batch_size):
+            target.delete_many({'_id': {'$in': chunk}})
+        return before
+
+    def record_changes(self, ids, before, batch_size):
+        """
+        Record the changes of the patched target in its changeset collection.
+        :return: dictionary of the number of inserts, updates and deletes
+        """
+        db = get_target_db()
+        target_name = self.target_backend.target_name
+        after = existing_ids(db[target_name], ids, batch_size)
+        changes = db[target_name + '_changeset']
+        changes.drop()
+        counts = {}
+        for chunk in iter_n(target_changes(ids, before, after), batch_size):
+            changes.insert_many(chunk, ordered=False)
+            for change in chunk:
+                counts[change['op']] = counts.get(change['op'], 0) + 1
+        return counts
+
+    async def incremental_merge(self, source_names, steps, batch_size, job_manager):
+        """
+        Patch the target with the changed '_id's re-merged from all sources.
+        """
+        ids = self.incremental['ids']
+        summaries = dict((name, dict((k, v) for (k, v) in changeset.items() if k != 'timestamp'))
+                         for (name, changeset) in self.incremental['changesets'].items())
+        self.register_status("building", transient=True, init=True,
+                             job={"step": "incremental", "changesets": summaries})
+        pinfo = self.get_pinfo()
+        pinfo["step"] = "incremental"
+        id_batch_size = min(batch_size, 10000)
+        job = await job_manager.defer_to_thread(pinfo, partial(self.remove_changed, ids, id_batch_size))
+        before = await job
+
+        if ids:
+            await super(InteractionDataBuilder, self).merge_sources(
+                source_names, steps=steps, batch_size=batch_size, ids=ids, job_manager=job_manager)
+        else:
+            self.merge_stats = {}
+            if "post" in steps:
+                await super(InteractionDataBuilder, self).merge_sources(
+                    source_names, steps=["post"], batch_size=batch_size, job_manager=job_manager)
+
+        job = await job_manager.defer_to_thread(pinfo, partial(self.record_changes, ids, before, id_batch_size))
+        counts = await job
+        self.logger.info("Patched '%s': %s" % (self.target_backend.target_name, counts))
+        self.register_status("success", job={"step": "incremental", "changesets": summaries, "changes": counts})
+        return self.merge_stats
+
+    async def merge_sources(self, source_names, steps=["merge", "post"], batch_size=100000, ids=None,
+                            job_manager=None):
+        """
+        Merge the sources with a merge-join of the sorted source collections if
+        enabled, otherwise with the DataBuilder upserts.  Merges of specific
+        '_id's always use the upserts.  Incremental builds patch the target.
+        """
+        if type(steps) == str:
+            steps = [steps]
+        if self.incremental and "merge" in steps:
+            return await self.incremental_merge(source_names, steps, batch_size, job_manager)
+        if ids or "merge" not in steps or not self.use_merge_join():
+            return await super(InteractionDataBuilder, self).merge_sources(
+                source_names, steps=steps, batch_size=batch_size, ids=ids, job_manager=job_manager)
+
+        root_sources = sorted(set(source_names).intersection(self.get_root_document_sources()))
+        other_sources = sorted(set(source_names).difference(root_sources))
+        ordered_sources = root_sources + other_sources
+        self.logger.info("Merge-joining sources %s (root sources: %s)" % (ordered_sources, root_sources))
+
+        src_master = self.source_backend.master
+        sources = []
+        for src_name in ordered_sources:
+            meta = src_master.find_one({"_id": src_name}) or {}
+            sources.append((src_name,
+                            self.source_backend[src_name].name,
+                            self.generate_document_query(src_name),
+                            self.get_mapper_for_source(src_name, init=False),
+                            self.document_cleaner(src_name),
+                            meta.get("merger", "upsert")))
+
+        self.register_status("building", transient=True, init=True,
+                             job={"step": "merge-join", "sources": ordered_sources})
+        pinfo = self.get_pinfo()
+        pinfo["step"] = "merge-join"
+        job = await job_manager.defer_to_process(
+            pinfo,
+            partial(merge_join_worker,
+                    sources,
+                    self.target_backend.target_name,
+                    root_sources,
+                    min(batch_size, 10000)))
+        counts = await job
+        self.logger.info("Merge-join of %s: %s" % (ordered_sources, counts))
+        self.register_status("success", job={"step": "merge-join", "sources": ordered_sources})
+
+        self.register_status("building", transient=True, init=True, job={"step": "finalizing"})
+        self.target_backend.finalize()
+        self.register_status("success", job={"step": "finalizing"})
+
+        if "post" in steps:
+            await super(InteractionDataBuilder, self).merge_sources(
+                source_names, steps=["post"], batch_size=batch_size, job_manager=job_manager)
+
+        # DataBuilder reports the number of merged documents per source
+        self.merge_stats = dict((name, counts[name]) for name in ordered_sources)
+        return self.merge_stats
@@ -0,0 +1,86 @@
+"""
+Changesets of the source uploads, applied to an existing target by the
+incremental builds of InteractionDataBuilder.
+
+A ReleaseDiffUploader registers with its upload job the summary of the
+changes between the previous and the new release of a source, and the
+'_id's of the changed documents in the changeset collection.  A target
+built from the previous release of every changed source can be patched
+by re-merging the changed '_id's only; any other case (a full load, a
+changeset on top of another release than the built one) needs a full
+build.
+
+Source Project:   biothings.interactions
+"""
+from biothings.utils.common import iter_n
+from hub.dataload.ReleaseDiff import ReleaseDiff
+
+
+def source_changeset(src_doc, src_name, built_version):
+    """
+    Return the changeset to apply to a target built from release built_version
+    of the source.
+    :param src_doc: the src_dump document of the main source
+    :param src_name: the source (upload job) name
+    :param built_version: the release of the source in the target
+    :return: the changeset summary, None if the source is unchanged
+    :raise ValueError: if the source changed without a changeset applying to built_version
+    """
+    job = src_doc.get('upload', {}).get('jobs', {}).get(src_name) or {}
+    release = job.get('release')
+    if release == built_version:
+        return None
+    changeset = job.get('changeset')
+    if not changeset:
+        raise ValueError("Source '%s' was fully loaded since release '%s'" % (src_name, built_version))
+    if changeset.get('release') != release:
+        raise ValueError("Changeset of source '%s' is for release '%s', uploaded release is '%s'"
+                         % (src_name, changeset.get('release'), release))
+    if changeset.get('previous_release') != built_version:
+        raise ValueError("Changeset of source '%s' applies to release '%s', target was built from release '%s'"
+                         % (src_name, changeset.get('previous_release'), built_version))
+    return changeset
+
+
+def changed_ids(db, changesets):
+    """
+    Return the '_id's changed by the changesets.
+    :param db: the source database
+    :param changesets: iterable of changeset summaries
+    :return: sorted list of '_id's
+    """
+    ids = set()
+    for changeset in changesets:
+        for doc in db[changeset['collection']].find({}, {'_id': 1}):
+            ids.add(doc['_id'])
+    return sorted(ids)
+
+
+def existing_ids(collection, ids, batch_size=10000):
+    """
+    Return the '_id's found in the collection.
+    :param collection: the target collection
+    :param ids: list of '_id's
+    :param batch_size: number of '_id's per query
+    :return: set of '_id's
+    """
+    found = set()
+    for chunk in iter_n(ids, batch_size):
+        found.update(doc['_id'] for doc in collection.find({'_id': {'$in': chunk}}, {'_id': 1}))
+    return found
+
+
+def target_changes(ids, before, after):
+    """
+    Return the changes of the target documents patched by an incremental build,
+    as recorded in the changeset collection of the target for the indexer.
+    :param ids: the re-merged '_id's
+    :param before: set of the '_id's found in the target before the build
+    :param after: set of the '_id's found in the target after the build
+    :return: yields {'_id', 'op'} documents
+    """
+    for _id in ids:
+        if _id in after:
+            yield {'_id': _id, 'op': ReleaseDiff.UPDATE if _id in before else ReleaseDiff.INSERT}
+        elif _id in before:
+            yield {'_id': _id, 'op': ReleaseDiff.DELETE}
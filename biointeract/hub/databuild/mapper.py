@@ -5,5 +5,31 @@ import biothings.utils.mongo as mongo
 import biothings.hub.databuild.mapper as mapper
 from hub.dataload.sources.ConsensusPathDB import ConsensusPathDBUploader
 from hub.dataload.sources.biogrid import BiogridUploader
+from hub.dataload.BiointeractParser import BiointeractParser
 
 import logging
+
+
+class InteractorMapper(mapper.BaseMapper):
+    """
+    Default mapper of the interaction builds.  The interactors of the documents
+    of every source are put in the order of their '_id' (see
+    BiointeractParser.canonical_interactors), so that interactor_a and
+    interactor_b of a merged document describe the same interactors in all
+    sources.  The attributes of the interactors (uniprot, symbol, alias,
+    synonyms, ...) are then unioned by the 'merge_struct' merger of the
+    uploaders while the documents are merged.
+    """
+
+    def __init__(self, name=None, *args, **kwargs):
+        super(InteractorMapper, self).__init__(name=name)
+
+    def need_load(self):
+        return False
+
+    def load(self):
+        pass
+
+    def process(self, docs):
+        for doc in docs:
+            yield BiointeractParser.canonical_interactors(doc)
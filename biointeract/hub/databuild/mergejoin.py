@@ -0,0 +1,60 @@
+"""
+K-way merge-join of source document streams sorted by '_id', used by
+the merge-join build of InteractionDataBuilder.
+
+Source Project:   biothings.interactions
+"""
+import heapq
+import itertools
+import operator
+
+from biothings.utils.dataload import merge_struct
+
+
+def sorted_source(name, docs):
+    """
+    Key the documents of a source for merge_join, checking their order.
+    :param name: the source name
+    :param docs: iterable of documents sorted by '_id'
+    :return: yields (_id, source name, document) tuples
+    """
+    previous = None
+    for doc in docs:
+        _id = doc['_id']
+        if previous is not None and _id < previous:
+            raise ValueError("Documents of source '%s' are not sorted by _id: '%s' after '%s'"
+                             % (name, _id, previous))
+        previous = _id
+        yield _id, name, doc
+
+
+def merge_join(sources):
+    """
+    K-way merge-join of sources sorted by '_id'.
+    :param sources: list of (source name, iterable of documents sorted by '_id') tuples
+    :return: yields (_id, list of (source name, document) tuples) in '_id' order, the
+             documents of an '_id' in the order of the sources list
+    """
+    streams = [sorted_source(name, docs) for (name, docs) in sources]
+    # heapq.merge is stable: documents with the same '_id' keep the order of the streams
+    merged = heapq.merge(*streams, key=operator.itemgetter(0))
+    for (_id, group) in itertools.groupby(merged, key=operator.itemgetter(0)):
+        yield _id, [(name, doc) for (_, name, doc) in group]
+
+
+def merge_documents(group, mergers=None):
+    """
+    Merge the documents of the sources sharing an '_id'.  As with the
+    DataBuilder mergers, the source documents may be modified.
+    :param group: list of (source name, document) tuples
+    :param mergers: source name to merger ('upsert' or 'merge_struct') dictionary
+    :return: the merged document
+    """
+    mergers = mergers or {}
+    merged = {}
+    for (name, doc) in group:
+        if merged and mergers.get(name) == 'merge_struct':
+            merged = merge_struct(merged, doc)
+        else:
+            merged.update(doc)
+    return merged
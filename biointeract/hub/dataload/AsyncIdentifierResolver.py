@@ -0,0 +1,262 @@
+"""
+AsyncIdentifierResolver translates identifiers through a web service
+with the MyGene.info 'querymany' contract (a POST of comma-separated
+'q' identifiers with 'scopes', 'fields' and 'species', answered by a
+JSON list of hits carrying the original 'query').
+
+Identifiers are submitted while a source file is read.  Identifiers
+found in an optional IdentifierCache are resolved locally, the misses
+are split into fixed-size batches that are posted concurrently from an
+asyncio event loop running in a background thread, with a limit on the
+number of batches in flight and retries with exponential backoff.  A
+lookup only blocks until the batch holding its identifier has returned,
+so parsing overlaps with the remote queries.
+
+The cache is only accessed from the thread that submits identifiers,
+as SQLite connections can not be shared between threads.
+
+Source Project:   biothings.interactions
+"""
+import asyncio
+import concurrent.futures
+import json
+import logging
+import threading
+import urllib.parse
+import urllib.request
+
+from hub.dataload.IdentifierCache import IdentifierCache
+
+
+class AsyncIdentifierResolver(object):
+
+    # MyGene.info gene query service
+    URL = 'http://mygene.info/v3/query'
+    # Number of identifiers per request, the querymany maximum is 1000
+    BATCH_SIZE = 1000
+    # Number of requests in flight at the same time
+    MAX_IN_FLIGHT = 4
+    # Number of retries for a failed request and the initial delay in seconds
+    RETRIES = 3
+    RETRY_DELAY = 1.0
+    # Request timeout in seconds
+    TIMEOUT = 60
+
+    def __init__(self, scopes='uniprot', field='entrezgene', species='human', url=None,
+                 batch_size=None, max_in_flight=None, retries=None, retry_delay=None,
+                 timeout=None, id_cache=None, offline=False):
+        """
+        Create a resolver.
+        :param scopes: querymany scopes of the submitted identifiers
+        :param field: field of the hits to resolve the identifiers to
+        :param species: querymany species filter
+        :param url: querymany endpoint, defaults to MyGene.info
+        :param batch_size: number of identifiers per request
+        :param max_in_flight: maximum number of concurrent requests
+        :param retries: number of retries for a failed request
+        :param retry_delay: delay before the first retry in seconds, doubled for each retry
+        :param timeout: request timeout in seconds
+        :param id_cache: optional IdentifierCache used before querying and filled with the results
+        :param offline: only use the id_cache, do not query the endpoint
+        """
+        self.scopes = scopes
+        self.field = field
+        self.species = species
+        self.url = url or AsyncIdentifierResolver.URL
+        self.batch_size = batch_size or AsyncIdentifierResolver.BATCH_SIZE
+        self.max_in_flight = max_in_flight or AsyncIdentifierResolver.MAX_IN_FLIGHT
+        self.retries = AsyncIdentifierResolver.RETRIES if retries is None else retries
+        self.retry_delay = AsyncIdentifierResolver.RETRY_DELAY if retry_delay is None else retry_delay
+        self.timeout = timeout or AsyncIdentifierResolver.TIMEOUT
+        self.id_cache = id_cache
+        self.offline = offline
+
+        self.results = {}
+        self.seen = set()
+        # identifiers not yet looked up in the cache, and cache misses not yet sent
+        self.unchecked = []
+        self.pending = []
+        # identifier to (batch, future) of the request resolving it
+        self.inflight = {}
+        self.requests = 0
+        self.failures = 0
+
+        self.loop = None
+        self.thread = None
+        self.executor = None
+        self.semaphore = None
+
+    def _start(self):
+        """
+        Start the event loop thread used to run the requests.
+        :return:
+        """
+        started = threading.Event()
+
+        def run():
+            asyncio.set_event_loop(self.loop)
+            self.semaphore = asyncio.Semaphore(self.max_in_flight)
+            started.set()
+            self.loop.run_forever()
+
+        self.loop = asyncio.new_event_loop()
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=self.max_in_flight)
+        self.thread = threading.Thread(target=run, name='AsyncIdentifierResolver', daemon=True)
+        self.thread.start()
+        started.wait()
+
+    def close(self):
+        """
+        Stop the event loop thread.  Requests still in flight are abandoned.
+        :return:
+        """
+        if self.loop:
+            self.loop.call_soon_threadsafe(self.loop.stop)
+            self.thread.join()
+            self.executor.shutdown(wait=False)
+            self.loop.close()
+            self.loop = None
+
+    def submit(self, ids):
+        """
+        Submit identifiers to resolve.  Full batches are sent right away.
+        :param ids: iterable of identifiers
+        :return:
+        """
+        for id in ids:
+            if id in self.seen:
+                continue
+            self.seen.add(id)
+            self.unchecked.append(id)
+            if len(self.unchecked) >= self.batch_size:
+                self._check_cache()
+        while len(self.pending) >= self.batch_size:
+            self._dispatch(self.pending[:self.batch_size])
+            self.pending = self.pending[self.batch_size:]
+
+    def flush(self):
+        """
+        Send all submitted identifiers that are still waiting for a full batch.
+        :return:
+        """
+        self._check_cache()
+        while self.pending:
+            self._dispatch(self.pending[:self.batch_size])
+            self.pending = self.pending[self.batch_size:]
+
+    def _check_cache(self):
+        """
+        Resolve the unchecked identifiers from the cache and queue the misses.
+        :return:
+        """
+        if not self.unchecked:
+            return
+        misses = self.unchecked
+        if self.id_cache:
+            found, misses = self.id_cache.get_many(self.unchecked)
+            self.results.update(found)
+        self.unchecked = []
+        if not self.offline:
+            self.pending.extend(misses)
+
+    def _dispatch(self, batch):
+        """
+        Schedule a request for a batch of identifiers on the event loop.
+        :param batch: list of identifiers
+        :return:
+        """
+        if not self.loop:
+            self._start()
+        future = asyncio.run_coroutine_threadsafe(self._fetch(batch), self.loop)
+        for id in batch:
+            self.inflight[id] = (batch, future)
+        self.requests += 1
+
+    async def _fetch(self, batch):
+        """
+        Post a batch, retrying failed requests.  At most 'max_in_flight'
+        batches are posted at the same time.
+        :param batch: list of identifiers
+        :return: dictionary of resolved identifiers
+        """
+        async with self.semaphore:
+            for attempt in range(self.retries + 1):
+                try:
+                    return await self.loop.run_in_executor(self.executor, self.post, batch)
+                except (OSError, ValueError) as e:
+                    if attempt == self.retries:
+                        raise
+                    logging.warning("Identifier request failed (%s), retry %d of %d"
+                                    % (e, attempt + 1, self.retries))
+                    await asyncio.sleep(self.retry_delay * 2 ** attempt)
+
+    def post(self, batch):
+        """
+        Post a querymany request for a batch of identifiers.
+        :param batch: list of identifiers
+        :return: dictionary of resolved identifiers, numeric identifiers as integers
+        """
+        data = urllib.parse.urlencode({
+            'q': ','.join(batch),
+            'scopes': self.scopes,
+            'fields': self.field,
+            'species': self.species
+        }).encode('utf-8')
+        request = urllib.request.Request(self.url, data=data,
+                                         headers={'Content-Type': 'application/x-www-form-urlencoded'})
+        with urllib.request.urlopen(request, timeout=self.timeout) as response:
+            hits = json.loads(response.read().decode('utf-8'))
+
+        resolved = {}
+        for q in hits:
+            if 'query' in q and self.field in q:
+                resolved[q['query']] = IdentifierCache.normalize(q[self.field])
+        return resolved
+
+    def _collect(self, batch, future):
+        """
+        Wait for the request of a batch and record its results.  A batch
+        that still fails after its retries raises its error, as its
+        identifiers can not be told apart from identifiers without a match.
+        :param batch: list of identifiers
+        :param future: the future of the request
+        :return:
+        """
+        for id in batch:
+            self.inflight.pop(id, None)
+        try:
+            resolved = future.result()
+        except Exception as e:
+            self.failures += 1
+            logging.error("Identifier request for %d ids failed: %s" % (len(batch), e))
+            raise
+        self.results.update(resolved)
+        if self.id_cache:
+            self.id_cache.put_many(resolved, set(batch) - set(resolved.keys()))
+
+    def get(self, id, default=None):
+        """
+        Return the resolved identifier, waiting for its request if needed.
+        :param id: a submitted identifier
+        :param default: value returned for unresolved identifiers
+        :return:
+        """
+        if id in self.results:
+            return self.results[id]
+        if id in self.seen and id not in self.inflight:
+            self.flush()
+        if id in self.inflight:
+            self._collect(*self.inflight[id])
+        return self.results.get(id, default)
+
+    def resolve_all(self):
+        """
+        Wait for all submitted identifiers.
+        :return: dictionary of all resolved identifiers
+        """
+        self.flush()
+        while self.inflight:
+            self._collect(*next(iter(self.inflight.values())))
+        logging.info("%d identifiers resolved with %d requests (%d failed)"
+                     % (len(self.results), self.requests, self.failures))
+        return self.results
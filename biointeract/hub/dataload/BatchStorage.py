@@ -0,0 +1,123 @@
+"""
+BatchStorage stores documents handed over by load_data as lists.
+
+The uploaders of the interaction sources return their parsed documents
+in batches (see BiointeractParser.batched), each batch is inserted in a
+single unordered bulk insert instead of being regrouped document by
+document.
+
+With UPLOAD_WRITERS set in the hub config (a number, or a dictionary by
+collection name, without the '_temp_' suffix of the collection an
+upload is written to), the batches are fanned out to a pool of writer
+threads, each insert running on its own connection of the client
+connection pool.  At most UPLOAD_MAX_PENDING_BATCHES batches (twice the
+number of writers by default) wait for a writer: the parser is not read
+further until a writer is free, which bounds the memory held by queued
+batches.
+
+Source Project:   biothings.interactions
+"""
+import concurrent.futures
+import logging
+import re
+import time
+
+import biothings, config
+biothings.config_for_app(config)
+
+from biothings.hub.dataload.storage import BasicStorage
+from biothings.utils.common import timesofar
+
+
+class BatchStorage(BasicStorage):
+
+    # Suffix of the temporary collection an upload is written to
+    TEMP_SUFFIX = re.compile('_temp_\\w+$')
+
+    def __init__(self, db, dest_col_name, logger=logging, writers=None, max_pending=None):
+        """
+        Create the storage.
+        :param db: the database, or None for the source database
+        :param dest_col_name: the collection to insert into
+        :param logger: the logger
+        :param writers: number of concurrent writers (UPLOAD_WRITERS if None)
+        :param max_pending: maximum number of batches waiting for a writer
+        """
+        super(BatchStorage, self).__init__(db, dest_col_name, logger)
+        if writers is None:
+            writers = getattr(config, 'UPLOAD_WRITERS', None)
+            if isinstance(writers, dict):
+                writers = writers.get(BatchStorage.collection_name(dest_col_name))
+        self.writers = writers or 1
+        self.max_pending = max_pending or getattr(config, 'UPLOAD_MAX_PENDING_BATCHES', None) or 2 * self.writers
+
+    @staticmethod
+    def collection_name(dest_col_name):
+        """
+        Return the name of the source collection of a (temporary) collection.
+        """
+        return BatchStorage.TEMP_SUFFIX.sub('', dest_col_name)
+
+    def doc_iterator(self, batches, batch=True, batch_size=None):
+        """
+        Return the document batches, without the documents rejected by check_doc_func.
+        :param batches: iterable of lists of documents
+        :return: yields lists of documents
+        """
+        for doc_li in batches:
+            yield [d for d in doc_li if self.check_doc_func(d)]
+
+    def insert_batch(self, doc_li):
+        """
+        Insert a batch of documents with an unordered bulk insert.
+        :param doc_li: list of documents
+        :return: the number of inserted documents
+        """
+        if not doc_li:
+            return 0
+        self.temp_collection.insert_many(doc_li, ordered=False)
+        return len(doc_li)
+
+    def process(self, batches, batch_size=None):
+        """
+        Insert each batch of documents with a single bulk insert.
+        :param batches: iterable of lists of documents
+        :param batch_size: unused, batches are inserted as they were built
+        :return: the number of inserted documents
+        """
+        self.logger.info("Uploading to the DB with %d writer(s)..." % self.writers)
+        t0 = time.time()
+        if self.writers > 1:
+            total = self.process_parallel(self.doc_iterator(batches))
+        else:
+            total = 0
+            for doc_li in self.doc_iterator(batches):
+                total += self.insert_batch(doc_li)
+        self.logger.info('Done[%s]' % timesofar(t0))
+        return total
+
+    def process_parallel(self, batches):
+        """
+        Insert the batches from a pool of writer threads.  The batches are
+        read only when fewer than 'max_pending' inserts are pending.
+        :param batches: iterable of lists of documents
+        :return: the number of inserted documents
+        """
+        total = 0
+        with concurrent.futures.ThreadPoolExecutor(max_workers=self.writers) as executor:
+            pending = set()
+            try:
+                for doc_li in batches:
+                    # Wait for a writer before reading the next batch from the parser
+                    if len(pending) >= self.max_pending:
+                        done, pending = concurrent.futures.wait(
+                            pending, return_when=concurrent.futures.FIRST_COMPLETED)
+                        total += sum(d.result() for d in done)
+                    pending.add(executor.submit(self.insert_batch, doc_li))
+                total += sum(d.result() for d in concurrent.futures.as_completed(pending))
+            except Exception:
+                # do not start the inserts still queued after a failure
+                for d in pending:
+                    d.cancel()
+                raise
+        return total
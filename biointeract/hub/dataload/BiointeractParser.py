@@ -10,11 +10,204 @@ https://wiki.thebiogrid.org/doku.php/biogrid_tab_version_2.0
 Source Project:   biothings.interactions
 Author:  Greg Taylor:  greg.k.taylor@gmail.com
 """
+import itertools
+import pickle
 import re
+import threading
+import zlib
 from biothings.utils.dataload import dict_sweep
+from hub.dataload.ExternalSortGrouper import ExternalSortGrouper
+from hub.dataload.ParseProfiler import ParseProfiler
+
+
+class RecordSchema(object):
+    """
+    A per-source record layout compiled once from the tsv column header.
+
+    Every column is resolved ahead of time to its final field name, the group
+    it is stored under (e.g. 'interactor_a') and the function used to convert
+    its value.  Applying the schema to a split tsv line builds the final nested
+    record in one pass, replacing the rename_fields, parse_int_fields,
+    group_fields and sweep_record sequence used for header-keyed dictionaries.
+    """
+
+    def __init__(self, header, empty_field=None, rename_map=None, converters=None,
+                 groups=None, default_group=None):
+        """
+        Compile the schema.
+        :param header: list of column names in file order
+        :param empty_field: column value representing a missing entry
+        :param rename_map: column name to field name map, other columns are lower-cased
+        :param converters: field name to conversion function map
+        :param groups: list of (group name, {field name: grouped field name}) tuples
+        :param default_group: group for all fields not listed in 'groups' (None for top-level)
+        """
+        rename_map = rename_map or {}
+        converters = converters or {}
+
+        grouped = {}
+        for (group_name, fields) in groups or []:
+            for f in fields.keys():
+                grouped[f] = (group_name, fields[f])
+
+        self.header = list(header)
+        self.empty_field = empty_field
+        self.columns = []
+        for name in self.header:
+            if name in rename_map:
+                field = rename_map[name]
+            else:
+                field = name.lower().replace(' ', '_')
+            (group_name, key) = grouped.get(field, (default_group, field))
+            self.columns.append((group_name, key, converters.get(field)))
+
+    def build(self, values):
+        """
+        Build a record from the list of column values of a single tsv line.
+        Empty fields and None values are left out of the record, as are
+        groups without any values.
+        :param values: list of column values
+        :return: the nested record dictionary
+        """
+        r = {}
+        empty_field = self.empty_field
+        for ((group_name, key, convert), val) in zip(self.columns, values):
+            if val == empty_field:
+                continue
+            if convert:
+                val = convert(val)
+                if val is None:
+                    continue
+                if isinstance(val, list):
+                    val = [BiointeractParser.sweep_record(v) if isinstance(v, dict) else v
+                           for v in val if v is not None]
+                    if not val:
+                        continue
+            if group_name is None:
+                r[key] = val
+            elif group_name in r:
+                r[group_name][key] = val
+            else:
+                r[group_name] = {key: val}
+        return r
+
+
+class InteractorAccumulator(object):
+    """
+    Gathers the attributes of one interactor across all records of a group.
+
+    The values of each attribute are kept in insertion-ordered sets, so merging
+    a record costs a hash lookup per value instead of a list scan.  List values
+    are merged element-wise.  The final shape, a scalar for a single value and a
+    list otherwise, is only built once by emit().
+    """
+
+    def __init__(self):
+        self.values = {}
+
+    def add(self, interactor):
+        """
+        Merge the attributes of an interactor dictionary.
+        :param interactor: the interactor dictionary
+        :return:
+        """
+        for (k, v) in interactor.items():
+            if k not in self.values:
+                self.values[k] = {}
+            vals = self.values[k]
+            for x in (v if isinstance(v, list) else [v]):
+                key = BiointeractParser.freeze(x)
+                if key not in vals:
+                    vals[key] = x
+
+    def emit(self):
+        """
+        Build the merged interactor dictionary.
+        :return: the interactor dictionary
+        """
+        r = {}
+        for (k, vals) in self.values.items():
+            v = list(vals.values())
+            r[k] = v[0] if len(v) == 1 else v
+        return r
+
+
+# ParseProfiler recording the parse stages of each thread, see enable_profiling
+_profiling = threading.local()
 
 
 class BiointeractParser(object):
+    # Drop exact-duplicate evidence entries when collapsing duplicate keys
+    DEDUP_EVIDENCE = False
+    # Merge the interactor attributes of all records when collapsing duplicate keys
+    MERGE_INTERACTORS = False
+    # Version of the parsed document layout, bump it when a parser change alters
+    # its output so that cached parse results are not replayed
+    SCHEMA_VERSION = 1
+    # Default number of documents per batch returned by batched
+    BATCH_SIZE = 10000
+    @staticmethod
+    def current_profiler():
+        """
+        Return the ParseProfiler recording the parse stages of the calling thread, or None.
+        """
+        return getattr(_profiling, 'profiler', None)
+
+    @staticmethod
+    def enable_profiling():
+        """
+        Start recording the parse stages of the parsers run by the calling thread,
+        so that uploads parsed at the same time in other threads are profiled apart.
+        Only parsers started after this call are profiled.
+        :return: the ParseProfiler
+        """
+        _profiling.profiler = ParseProfiler()
+        return _profiling.profiler
+
+    @staticmethod
+    def disable_profiling():
+        """
+        Stop recording the parse stages of the calling thread.
+        :return: the ParseProfiler that was recording, or None
+        """
+        profiler = BiointeractParser.current_profiler()
+        _profiling.profiler = None
+        return profiler
+
+    @staticmethod
+    def profiled(stage, func):
+        """
+        Return 'func' recording its calls under 'stage' if profiling is enabled,
+        otherwise 'func' itself.
+        :param stage: the stage name
+        :param func: a function called once per row
+        :return:
+        """
+        profiler = BiointeractParser.current_profiler()
+        return func if profiler is None else profiler.wrap(stage, func)
+
+    @staticmethod
+    def profiled_iter(stage, iterable):
+        """
+        Return 'iterable' recording the time taken by each item under 'stage' if
+        profiling is enabled, otherwise 'iterable' itself.
+        :param stage: the stage name
+        :param iterable: an iterable, e.g. a file
+        :return:
+        """
+        profiler = BiointeractParser.current_profiler()
+        return iterable if profiler is None else profiler.iterate(stage, iterable)
+
+    @staticmethod
+    def decode_line(line):
+        """
+        Decode a line read from a file opened in binary mode.
+        :param line: bytes or str line
+        :return: the str line
+        """
+        if isinstance(line, (bytes, bytearray)):
+            return line.decode("utf-8")
+        return line
 
     @staticmethod
     def parse_list(entry, separator):
@@ -94,6 +287,67 @@ class BiointeractParser(object):
                 new_record[new_key] = r[f]
         return new_record
 
+    @staticmethod
+    def compile_schema(header, empty_field=None, separator='|', rename_map=None, int_fields=None,
+                       float_fields=None, list_fields=None, int_list_fields=None, groups=None,
+                       converters=None, default_group=None):
+        """
+        Compile a RecordSchema for a tsv file from its header row and the field
+        descriptions of a source parser.  All field names refer to the renamed
+        fields, as used by parse_int_fields and group_fields.
+        :param header: list of column names in file order
+        :param empty_field: column value representing a missing entry
+        :param separator: the deliminator for list fields
+        :param rename_map: column name to field name map
+        :param int_fields: fields converted with safe_int
+        :param float_fields: fields converted with safe_float
+        :param list_fields: fields converted with parse_list
+        :param int_list_fields: fields converted with parse_int_list
+        :param groups: list of (group name, fields) tuples, fields as given to group_fields
+        :param converters: additional field name to conversion function map
+        :param default_group: group for all ungrouped fields
+        :return: a RecordSchema
+        """
+        c = {}
+        for f in int_fields or []:
+            c[f] = BiointeractParser.safe_int
+        for f in float_fields or []:
+            c[f] = BiointeractParser.safe_float
+        for f in list_fields or []:
+            c[f] = lambda entry: BiointeractParser.parse_list(entry, separator)
+        for f in int_list_fields or []:
+            c[f] = lambda entry: BiointeractParser.parse_int_list(entry, separator)
+        c.update(converters or {})
+        return RecordSchema(header, empty_field=empty_field, rename_map=rename_map, converters=c,
+                            groups=groups, default_group=default_group)
+
+    @staticmethod
+    def pair_id(curie_a, id_a, curie_b, id_b):
+        """
+        Compute the id of the interaction between two identifiers given in any
+        order, as set by the set_id methods of the parsers.  Entrez gene pairs are
+        ordered by their integer identifier, an entrez gene comes before a mesh
+        identifier and other identifiers of the same curie are ordered as strings.
+        :param curie_a: curie of the first identifier, e.g. 'entrezgene'
+        :param id_a: the first identifier
+        :param curie_b: curie of the second identifier
+        :param id_b: the second identifier
+        :return: the id string
+        """
+        if curie_a == 'mesh' and curie_b == 'entrezgene':
+            (curie_a, id_a, curie_b, id_b) = (curie_b, id_b, curie_a, id_a)
+        if curie_a == 'entrezgene' and curie_b == 'mesh':
+            return 'entrezgene:{0}-mesh:{1}'.format(int(id_a), id_b)
+        if curie_a != curie_b:
+            raise ValueError("No interaction id for a '{0}' and a '{1}' identifier".format(curie_a, curie_b))
+        if curie_a == 'entrezgene':
+            (id_a, id_b) = (int(id_a), int(id_b))
+        else:
+            (id_a, id_b) = (str(id_a), str(id_b))
+        if id_b < id_a:
+            (id_a, id_b) = (id_b, id_a)
+        return '{0}:{1}-{2}:{3}'.format(curie_a, id_a, curie_b, id_b)
+
     @staticmethod
     def safe_int(str):
         """
@@ -134,30 +388,292 @@ class BiointeractParser(object):
         return dict_sweep(r, vals=[None])
 
     @staticmethod
-    def collapse_duplicate_keys(result_list, db_field):
+    def freeze(obj):
+        """
+        Convert a nested record into a canonical, hashable form.  Dictionaries
+        become frozensets of their items, so the result does not depend on the
+        key order, while lists become tuples and keep their order.  Scalars are
+        tagged with their type, so that 1, 1.0 and True stay distinct.
+        :param obj: a record, list or scalar value
+        :return: a hashable value
+        """
+        if isinstance(obj, dict):
+            return frozenset([(k, BiointeractParser.freeze(v)) for (k, v) in obj.items()])
+        elif isinstance(obj, list):
+            return tuple([BiointeractParser.freeze(v) for v in obj])
+        return (type(obj).__name__, obj)
+
+    @staticmethod
+    def fingerprint(obj):
+        """
+        Compute an order-independent hash of a nested record.  The value is only
+        stable within a single process.
+        :param obj: a record, list or scalar value
+        :return: an integer hash
+        """
+        return hash(BiointeractParser.freeze(obj))
+
+    @staticmethod
+    def unique_evidence(entries, seen=None):
+        """
+        Drop exact-duplicate evidence entries, keeping the first occurrence.
+        :param entries: list of evidence dictionaries
+        :param seen: optional set of frozen entries already kept, updated in place
+        :return: list of unique evidence entries
+        """
+        seen = set() if seen is None else seen
+        unique = []
+        for e in entries:
+            key = BiointeractParser.freeze(e)
+            if key not in seen:
+                seen.add(key)
+                unique.append(e)
+        return unique
+
+    @staticmethod
+    def record_direction(r, db_field):
+        """
+        Return the direction of a record with extracted interactors.  The direction
+        is either set on the record itself or on its evidence entry.
+        :param r: the record
+        :param db_field: the field holding the list of evidence entries
+        :return: 'A->B', 'B->A' or None
+        """
+        if 'direction' in r:
+            return r['direction']
+        if r.get(db_field):
+            return r[db_field][0].get('direction')
+        return None
+
+    @staticmethod
+    def has_id_prefix(r, interactor):
+        """
+        Return True if the id of a record starts with an identifier of an interactor.
+        :param r: the record
+        :param interactor: the interactor dictionary
+        :return:
+        """
+        curie = r['_id'].split(':', 1)[0]
+        values = interactor.get(curie)
+        for v in values if isinstance(values, list) else [values]:
+            if v is not None and r['_id'].startswith('{0}:{1}-'.format(curie, v)):
+                return True
+        return False
+
+    @staticmethod
+    def canonical_interactors(r):
+        """
+        Put the interactors of a record in the order of its id, as expected when
+        the records of several sources are merged.  The interactors are swapped
+        when interactor_b, not interactor_a, holds the first identifier of the id.
+        The direction of the source record is kept on its evidence entries and
+        the record direction becomes 'A->B'.
+        :param r: the record
+        :return: the modified record
+        """
+        if 'interactor_a' not in r or 'interactor_b' not in r or not r.get('_id'):
+            return r
+        if not BiointeractParser.has_id_prefix(r, r['interactor_a']) \
+                and BiointeractParser.has_id_prefix(r, r['interactor_b']):
+            r['interactor_a'], r['interactor_b'] = r['interactor_b'], r['interactor_a']
+        direction = r.pop('direction', None)
+        if direction is not None:
+            for (k, v) in r.items():
+                if isinstance(v, list) and v and isinstance(v[0], dict):
+                    for e in v:
+                        e.setdefault('direction', direction)
+            r['direction'] = 'A->B'
+        return r
+
+    @staticmethod
+    def merge_interactors(records, db_field):
+        """
+        Merge interactor_a and interactor_b of a group of records sharing the same id.
+        Records with direction 'B->A' contribute their interactors swapped, so that
+        interactor_a is always the first interactor of the id.
+        :param records: list of records with extracted interactors
+        :param db_field: the field holding the list of evidence entries
+        :return: tuple of the merged interactor_a and interactor_b dictionaries
+        """
+        int_a = InteractorAccumulator()
+        int_b = InteractorAccumulator()
+        for c in records:
+            if BiointeractParser.record_direction(c, db_field) == 'B->A':
+                int_a.add(c['interactor_b'])
+                int_b.add(c['interactor_a'])
+            else:
+                int_a.add(c['interactor_a'])
+                int_b.add(c['interactor_b'])
+        return int_a.emit(), int_b.emit()
+
+    @staticmethod
+    def collapse_group(records, db_field, dedup=False, merge_interactors=False):
+        """
+        Collapse a list of records sharing the same id into a single record.
+        The first record is kept and the 'db_field' lists of all records
+        are concatenated in order.
+        :param records: list of records with the same '_id'
+        :param db_field: the field holding the list of evidence entries
+        :param dedup: drop exact-duplicate evidence entries
+        :param merge_interactors: merge the interactors of groups of several records, see merge_interactors
+        :return: the collapsed record, a single record is returned as is
+        """
+        r = records[0]
+        if merge_interactors and len(records) > 1:
+            r['interactor_a'], r['interactor_b'] = BiointeractParser.merge_interactors(records, db_field)
+            if 'direction' in r:
+                r['direction'] = 'A->B'
+        if len(records) > 1:
+            evidence = []
+            for c in records:
+                evidence.extend(c[db_field])
+            r[db_field] = evidence
+        if dedup:
+            r[db_field] = BiointeractParser.unique_evidence(r[db_field])
+        return r
+
+    @staticmethod
+    def collapse_duplicate_keys(result_list, db_field, dedup=False, merge_interactors=False):
         """
         Collapse duplicate keys
         :param result_list:
+        :param dedup: drop exact-duplicate evidence entries
+        :param merge_interactors: merge the interactors of all records with the same key
         :return:
         """
         # Add the id and record to the cache
         cache = {}
-        print(len(result_list))
-
         for r in result_list:
-            id = r['_id']
-            if id not in cache.keys():
-                cache[id] = r
-            else:
-                cache[id][db_field] = cache[id][db_field] + r[db_field]
+            cache.setdefault(r['_id'], []).append(r)
 
         # transforms the cache back to a list
         pruned_result = []
         for k in cache.keys():
-            pruned_result.append(cache[k])
+            pruned_result.append(BiointeractParser.collapse_group(cache[k], db_field, dedup, merge_interactors))
 
         return pruned_result
 
+    @staticmethod
+    def collapse_duplicate_keys_external(records, db_field, max_records=None, tmp_dir=None, dedup=False,
+                                         merge_interactors=False):
+        """
+        Collapse duplicate keys of a record stream using an external sort.  At most
+        'max_records' records are held in memory, the remainder is spilled to disk
+        in sorted runs that are merged back.  Collapsed records are yielded in '_id' order.
+        :param records: iterable of records
+        :param db_field: the field holding the list of evidence entries
+        :param max_records: in-memory record budget (ExternalSortGrouper.MAX_RECORDS if None)
+        :param tmp_dir: directory for the sorted runs
+        :param dedup: drop exact-duplicate evidence entries
+        :param merge_interactors: merge the interactors of all records with the same key
+        :return: yields collapsed records
+        """
+        grouper = ExternalSortGrouper(max_records=max_records, tmp_dir=tmp_dir)
+        add = BiointeractParser.profiled('sort', grouper.add)
+        collapse_group = BiointeractParser.profiled('collapse', BiointeractParser.collapse_group)
+        for r in records:
+            add(r)
+        for group in BiointeractParser.profiled_iter('merge_runs', grouper.groups()):
+            yield collapse_group(group, db_field, dedup, merge_interactors)
+
+    @staticmethod
+    def batched(docs, batch_size=None):
+        """
+        Group the documents returned by a parser into lists, e.g. to hand them
+        over to bulk inserts.
+        :param docs: iterable of documents
+        :param batch_size: number of documents per list (BATCH_SIZE if None)
+        :return: yields lists of documents, only the last one may be shorter
+        """
+        batch_size = batch_size or BiointeractParser.BATCH_SIZE
+        docs = iter(docs)
+        while True:
+            batch = list(itertools.islice(docs, batch_size))
+            if not batch:
+                break
+            yield batch
+
+    @staticmethod
+    def read_line_chunks(f, chunk_size):
+        """
+        Split the remainder of a file into line-aligned chunks of roughly
+        'chunk_size' bytes or characters.  Each chunk ends with a complete line.
+        :param f: file opened for reading in binary or text mode
+        :param chunk_size: approximate size of each chunk
+        :return: yields chunks of complete lines
+        """
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                break
+            # complete the last line of the chunk
+            chunk = chunk + f.readline()
+            yield chunk
+
+    @staticmethod
+    def partition(id, partitions):
+        """
+        Compute the partition of a record id.  The value is stable across
+        processes, unlike the builtin hash of a string.
+        :param id: the record '_id'
+        :param partitions: the number of partitions
+        :return: the partition number
+        """
+        return zlib.crc32(str(id).encode('utf-8')) % partitions
+
+    @staticmethod
+    def write_partitions(records, partitions, path_format):
+        """
+        Hash-partition records by '_id' and append them to one pickle file per
+        partition.
+        :param records: iterable of records
+        :param partitions: the number of partitions
+        :param path_format: file path format string taking the partition number
+        :return: dictionary of partition number to file path for all non-empty partitions
+        """
+        files = {}
+        try:
+            for r in records:
+                p = BiointeractParser.partition(r['_id'], partitions)
+                if p not in files:
+                    files[p] = open(path_format.format(p), 'wb')
+                pickle.dump(r, files[p], protocol=pickle.HIGHEST_PROTOCOL)
+        finally:
+            for p in files.keys():
+                files[p].close()
+        return {p: path_format.format(p) for p in files.keys()}
+
+    @staticmethod
+    def read_partition(paths):
+        """
+        Read back the records written by write_partitions.
+        :param paths: list of partition file paths, in the order they should be read
+        :return: yields records
+        """
+        for path in paths:
+            with open(path, 'rb') as f:
+                try:
+                    while True:
+                        yield pickle.load(f)
+                except EOFError:
+                    pass
+
+    @staticmethod
+    def extract_interactor(k, db_field):
+        """
+        Pull out interactor_a / interactor_b of a single record
+        :param k: the parsed record
+        :param db_field: the field the remaining record is stored under
+        :return: the new record
+        """
+        r = {}
+        r['interactor_a'] = k.pop('interactor_a')
+        r['interactor_b'] = k.pop('interactor_b')
+        if '_id' in k:
+            r['_id'] = k.pop('_id')
+        r[db_field] = [k]
+        return r
+
     @staticmethod
     def extract_interactors(result_list, db_field):
         """
@@ -165,16 +681,4 @@ class BiointeractParser(object):
         :param result_list:
         :return:
         """
-        mod_result = []
-        for k in result_list:
-            r = {}
-            r['interactor_a'] = k['interactor_a']
-            k.pop('interactor_a')
-            r['interactor_b'] = k['interactor_b']
-            k.pop('interactor_b')
-            if '_id' in k:
-                r['_id'] = k['_id']
-                k.pop('_id')
-            r[db_field] = [k]
-            mod_result.append(r)
-        return mod_result
+        return [BiointeractParser.extract_interactor(k, db_field) for k in result_list]
@@ -0,0 +1,320 @@
+"""
+BiointeractUploader is the base class of the interaction source
+uploaders, adding features shared by all sources to the biothings
+BaseSourceUploader.
+
+Batched uploads: load_data returns the parsed documents in lists of
+UPLOAD_BATCH_SIZE documents (a number, or a dictionary by source name,
+BiointeractParser.BATCH_SIZE by default), which BatchStorage inserts
+with one bulk insert each.
+
+Sorted uploads: with UPLOAD_SORTED_IDS set (True, or a dictionary by
+source name), documents are stored in '_id' order, so that the merge-join
+build (see InteractionDataBuilder) reads the source collections
+sequentially.  Parsers collapsing duplicate keys with an external sort
+already return their documents in '_id' order (sorted_by_id), the
+documents of the other sources are sorted with an ExternalSortGrouper.
+
+Pipelined uploads: with UPLOAD_PIPELINE set (True, or a dictionary by
+source name), the batches are parsed in a hub thread and written by
+BatchStorage writer coroutines on the hub event loop, joined by a queue
+of UPLOAD_QUEUE_SIZE batches (see UploadPipeline).  The pipeline metrics
+are registered with the upload job; see pipeline_reports().  As several
+pipelined uploads may share the hub process, their memory reports only
+hold the per-document size estimate, and parse profiling is recorded
+per parser thread.  Diff uploads of a stored release (see
+ReleaseDiffUploader) are not pipelined.
+
+Parse profiling: with PARSE_PROFILING set in the hub config, the parse
+stages of load_data are recorded (see ParseProfiler) and the report is
+logged and registered with the upload job in src_dump once all
+documents were read.  parse_profiles() returns the registered reports
+from the hub shell.
+
+Memory accounting: the resident memory and a per-document size estimate
+are measured during every upload (see MemoryTracker, tracemalloc is
+added with UPLOAD_TRACEMALLOC) and registered with the upload job; see
+memory_reports().  UPLOAD_MEMORY_BUDGET sets a memory budget in bytes,
+for all sources or as a dictionary by source name.  The budget bounds
+the records held by the external sort of the parsers, and parsers that
+group records in memory switch to their spill-to-disk mode when the
+memory projected from the previous upload (or from the size of the
+source file) exceeds it.
+
+Source Project:   biothings.interactions
+"""
+import biothings, config
+biothings.config_for_app(config)
+
+import biothings.hub.dataload.uploader as uploader
+import os
+
+from functools import partial
+
+from biothings.utils.mongo import get_src_dump
+from hub.dataload.BatchStorage import BatchStorage
+from hub.dataload.BiointeractParser import BiointeractParser
+from hub.dataload.ExternalSortGrouper import ExternalSortGrouper
+from hub.dataload.MemoryTracker import MemoryTracker
+from hub.dataload.ParseProfiler import ParseProfiler
+from hub.dataload.UploadPipeline import UploadPipeline
+
+
+def job_reports(key, name=None):
+    """
+    Return a report registered with the upload jobs of the last uploads.
+    :param key: the report key of the upload job
+    :param name: a source name, all sources if None
+    :return: dictionary of source name to report
+    """
+    reports = {}
+    query = {'_id': name} if name else {}
+    for src in get_src_dump().find(query):
+        for (job, info) in src.get('upload', {}).get('jobs', {}).items():
+            if info.get(key):
+                reports[job] = info[key]
+    return reports
+
+
+def parse_profiles(name=None):
+    """
+    Return the parse profiling reports of the last uploads.
+    :param name: a source name, all sources if None
+    :return: dictionary of source name to report
+    """
+    return job_reports('parse_profile', name)
+
+
+def memory_reports(name=None):
+    """
+    Return the memory reports of the last uploads.
+    :param name: a source name, all sources if None
+    :return: dictionary of source name to report
+    """
+    return job_reports('memory', name)
+
+
+def pipeline_reports(name=None):
+    """
+    Return the pipeline metrics of the last pipelined uploads.
+    :param name: a source name, all sources if None
+    :return: dictionary of source name to metrics
+    """
+    return job_reports('pipeline', name)
+
+
+class BiointeractUploader(uploader.BaseSourceUploader):
+
+    storage_class = BatchStorage
+
+    # Merge the documents of the sources with merge_struct, unioning the
+    # attributes of the interactors put in '_id' order by InteractorMapper
+    __metadata__ = {"merger": "merge_struct"}
+
+    # True when the parser of the source returns its documents in '_id' order
+    sorted_by_id = False
+
+    # True while the upload runs in an UploadPipeline of the hub process
+    pipelined = False
+
+    # Ratio of the in-memory size of the parsed documents to the size of the
+    # source file, used to project the memory of a first upload
+    memory_expansion = 10
+    # Size estimate of a parsed record when no upload was measured yet
+    record_bytes = 2048
+
+    def use_pipeline(self):
+        """
+        Return True if the upload overlaps parsing and storage with an UploadPipeline.
+        """
+        pipeline = getattr(config, 'UPLOAD_PIPELINE', False)
+        if isinstance(pipeline, dict):
+            pipeline = pipeline.get(self.name, False)
+        return pipeline is True
+
+    async def update_data(self, batch_size, job_manager):
+        """
+        Iterate over load_data() and store the batches, in a pipeline on the hub
+        event loop if enabled, otherwise in a worker process.
+        """
+        if not self.use_pipeline():
+            await super(BiointeractUploader, self).update_data(batch_size, job_manager)
+            return
+
+        self.pipelined = True
+        pinfo = self.get_pinfo()
+        pinfo["step"] = "update_data"
+        storage = self.__class__.storage_class(None, self.temp_collection_name, self.logger)
+        pipeline = UploadPipeline(lambda: storage.doc_iterator(self.load_data(self.data_folder)),
+                                  storage.insert_batch,
+                                  writers=storage.writers,
+                                  queue_size=getattr(config, 'UPLOAD_QUEUE_SIZE', None),
+                                  loop=job_manager.loop,
+                                  logger=self.logger)
+        try:
+            total = await pipeline.run(defer=partial(job_manager.defer_to_thread, pinfo))
+        finally:
+            self.pipelined = False
+            metrics = pipeline.metrics()
+            self.logger.info("Upload pipeline of '%s': %s" % (self.name, metrics))
+            self.src_dump.update_one({"_id": self.main_source},
+                                     {"$set": {"upload.jobs.%s.pipeline" % self.name: metrics}})
+        self.logger.info("Uploaded %d documents of '%s'" % (total, self.name))
+        self.switch_collection()
+
+    def instrument(self, docs):
+        """
+        Group the documents into batches, measuring the memory and profiling
+        the parse stages (if enabled) while they are read.
+        :param docs: the documents returned by the parser
+        :return: the lists of documents
+        """
+        batches = BiointeractParser.batched(self.sort_by_id(docs), self.upload_batch_size())
+        return self.track_memory(self.profile(batches))
+
+    def use_sorted_ids(self):
+        """
+        Return True if the documents are stored in '_id' order.
+        """
+        sorted_ids = getattr(config, 'UPLOAD_SORTED_IDS', False)
+        if isinstance(sorted_ids, dict):
+            sorted_ids = sorted_ids.get(self.name, False)
+        return sorted_ids is True
+
+    def is_sorted_by_id(self):
+        """
+        Return True if load_data returns the documents in '_id' order.
+        """
+        return self.sorted_by_id
+
+    def sort_by_id(self, docs):
+        """
+        Return the documents in '_id' order if sorted uploads are enabled.
+        :param docs: the documents returned by the parser
+        :return: the documents
+        """
+        if not self.use_sorted_ids() or self.is_sorted_by_id():
+            return docs
+        self.logger.info("Sorting the documents of '%s' by _id" % self.name)
+        return self.external_sort(docs)
+
+    def external_sort(self, docs):
+        """
+        Sort documents by '_id' with an ExternalSortGrouper bounded by sort_buffer_size.
+        :param docs: iterable of documents
+        :return: yields the documents in '_id' order
+        """
+        grouper = ExternalSortGrouper(max_records=self.sort_buffer_size(),
+                                      tmp_dir=getattr(config, 'SORT_TMP_DIR', None))
+        add = BiointeractParser.profiled('sort', grouper.add)
+        for doc in docs:
+            add(doc)
+        for doc in grouper.sorted_records():
+            yield doc
+
+    def upload_batch_size(self):
+        """
+        Return the number of documents per batch handed over to the storage.
+        """
+        batch_size = getattr(config, 'UPLOAD_BATCH_SIZE', None)
+        if isinstance(batch_size, dict):
+            batch_size = batch_size.get(self.name)
+        return batch_size or BiointeractParser.BATCH_SIZE
+
+    def memory_budget(self):
+        """
+        Return the memory budget of the source in bytes, or None.
+        """
+        budget = getattr(config, 'UPLOAD_MEMORY_BUDGET', None)
+        if isinstance(budget, dict):
+            budget = budget.get(self.name)
+        return budget
+
+    def previous_memory_report(self):
+        return self.src_doc.get('upload', {}).get('jobs', {}).get(self.name, {}).get('memory') or {}
+
+    def projected_memory(self, path):
+        """
+        Project the memory needed to hold all parsed documents, from the previous
+        upload if it was measured, otherwise from the size of the source file.
+        :param path: path of the source file
+        :return: size in bytes
+        """
+        report = self.previous_memory_report()
+        if report.get('docs') and report.get('doc_bytes'):
+            return report['docs'] * report['doc_bytes']
+        return os.path.getsize(path) * self.memory_expansion
+
+    def spill_to_disk(self, path):
+        """
+        Return True if parsers grouping records in memory should spill to disk.
+        :param path: path of the source file
+        :return:
+        """
+        budget = self.memory_budget()
+        if budget and self.projected_memory(path) > budget:
+            self.logger.info("Projected memory of '%s' exceeds its budget of %d bytes, spilling to disk"
+                             % (self.name, budget))
+            return True
+        return False
+
+    def sort_buffer_size(self):
+        """
+        Return the number of records the external sort of a parser may hold in
+        memory: SORT_BUFFER_SIZE, bounded by half of the memory budget.
+        :return: number of records, or None for the parser default
+        """
+        max_records = getattr(config, 'SORT_BUFFER_SIZE', None)
+        budget = self.memory_budget()
+        if budget:
+            record_bytes = self.previous_memory_report().get('doc_bytes') or self.record_bytes
+            budget_records = max(1000, budget // 2 // record_bytes)
+            max_records = min(max_records, budget_records) if max_records else budget_records
+        return max_records
+
+    def track_memory(self, batches):
+        """
+        Pass the document batches through, registering the memory report once they were read.
+        :param batches: lists of the documents returned by the parser
+        :return: yields the lists of documents
+        """
+        # pipelined uploads share the hub process, whose memory is not theirs alone
+        tracker = MemoryTracker(trace=getattr(config, 'UPLOAD_TRACEMALLOC', False), process=not self.pipelined)
+        try:
+            for batch in tracker.track_batches(batches):
+                yield batch
+        finally:
+            report = tracker.report()
+            budget = self.memory_budget()
+            self.logger.info("Memory of '%s': %s" % (self.name, report))
+            if budget and report['rss_peak_mb'] and report['rss_peak_mb'] * MemoryTracker.MB > budget:
+                self.logger.warning("Upload of '%s' exceeded its memory budget of %d bytes" % (self.name, budget))
+            self.src_dump.update_one({"_id": self.main_source},
+                                     {"$set": {"upload.jobs.%s.memory" % self.name: report}})
+
+    def profile(self, docs):
+        """
+        Profile the parse stages while the documents are read, if enabled.
+        :param docs: the documents returned by the parser
+        :return: the documents
+        """
+        if not getattr(config, 'PARSE_PROFILING', False):
+            return docs
+        return self.profile_docs(BiointeractParser.enable_profiling(), docs)
+
+    def profile_docs(self, profiler, docs):
+        """
+        Pass the documents through, registering the profiling report once they were read.
+        :param profiler: the recording ParseProfiler
+        :param docs: the documents returned by the parser
+        :return: yields the documents
+        """
+        try:
+            for doc in profiler.iterate('parse', docs):
+                yield doc
+        finally:
+            BiointeractParser.disable_profiling()
+            report = profiler.report()
+            self.logger.info("Parse profile of '%s':\n%s" % (self.name, ParseProfiler.format_report(report)))
+            self.src_dump.update_one({"_id": self.main_source},
+                                     {"$set": {"upload.jobs.%s.parse_profile" % self.name: report}})
@@ -0,0 +1,165 @@
+"""
+ExternalSortGrouper groups parsed records by their '_id' field using
+a bounded amount of memory.
+
+Records are buffered and sorted by '_id' in chunks of at most
+'max_records' entries.  Full chunks are spilled to local disk as
+sorted runs, and the runs are k-way merged when the records are read
+back, so records sharing an '_id' are returned next to each other
+without the whole source being held in memory.  Run files are closed
+once written, and at most 'max_fan_in' runs are opened by a merge: more
+runs are first merged in passes of 'max_fan_in' runs into longer runs.
+
+The budget counts records, not bytes.  Callers with a memory budget in
+bytes convert it with a per-record size estimate (see
+BiointeractUploader.sort_buffer_size and MemoryTracker).
+
+Source Project:   biothings.interactions
+"""
+import heapq
+import itertools
+import logging
+import os
+import pickle
+import shutil
+import tempfile
+
+
+class ExternalSortGrouper(object):
+
+    # Default number of records held in memory before a sorted run is spilled
+    MAX_RECORDS = 100000
+    # Default number of runs opened by a merge
+    MAX_FAN_IN = 64
+
+    def __init__(self, max_records=None, tmp_dir=None, max_fan_in=None):
+        """
+        Create a new grouper.
+        :param max_records: maximum number of records buffered in memory
+        :param tmp_dir: directory for the sorted run files (system default if None)
+        :param max_fan_in: maximum number of runs merged at once (at least 2)
+        """
+        self.max_records = max_records or ExternalSortGrouper.MAX_RECORDS
+        self.tmp_dir = tmp_dir
+        self.max_fan_in = max(2, max_fan_in or ExternalSortGrouper.MAX_FAN_IN)
+        self.run_dir = None
+        self.buffer = []
+        self.runs = []
+
+    @staticmethod
+    def sort_key(r):
+        """
+        Sort key for a record, records without an id are sorted last.
+        :param r:
+        :return:
+        """
+        return (r['_id'] is None, r['_id'] or '')
+
+    def add(self, record):
+        """
+        Add a record to the grouper, spilling a sorted run if the buffer is full.
+        :param record: a record dictionary with an '_id' field
+        :return:
+        """
+        self.buffer.append(record)
+        if len(self.buffer) >= self.max_records:
+            self.spill()
+
+    def spill(self):
+        """
+        Sort the buffered records and write them to a new run file.
+        :return:
+        """
+        if not self.buffer:
+            return
+        self.buffer.sort(key=ExternalSortGrouper.sort_key)
+        self.runs.append(self.write_run(self.buffer))
+        self.buffer = []
+        logging.debug("Spilled sorted run %d to disk" % len(self.runs))
+
+    def write_run(self, records):
+        """
+        Write sorted records to a new run file.
+        :param records: iterable of sorted records
+        :return: the path of the closed run file
+        """
+        if self.run_dir is None:
+            self.run_dir = tempfile.mkdtemp(dir=self.tmp_dir)
+        (fd, path) = tempfile.mkstemp(dir=self.run_dir)
+        with os.fdopen(fd, 'wb') as run:
+            for r in records:
+                pickle.dump(r, run, protocol=pickle.HIGHEST_PROTOCOL)
+        return path
+
+    @staticmethod
+    def read_run(path):
+        """
+        Read back all records of a run file, removing the file once read.
+        :param path: the path of a run file
+        :return: yields the records in sorted order
+        """
+        try:
+            with open(path, 'rb') as run:
+                while True:
+                    yield pickle.load(run)
+        except EOFError:
+            pass
+        finally:
+            os.remove(path)
+
+    @staticmethod
+    def merge(runs):
+        """
+        Merge run files, records with the same '_id' keep the order of the runs.
+        :param runs: paths of run files
+        :return: yields the merged records
+        """
+        return heapq.merge(*[ExternalSortGrouper.read_run(run) for run in runs],
+                           key=ExternalSortGrouper.sort_key)
+
+    @staticmethod
+    def merged_records(runs, run_dir):
+        """
+        Merge run files, removing their directory once all records were read.
+        :param runs: paths of run files
+        :param run_dir: the directory of the run files
+        :return: yields the merged records
+        """
+        try:
+            for r in ExternalSortGrouper.merge(runs):
+                yield r
+        finally:
+            shutil.rmtree(run_dir, ignore_errors=True)
+
+    def sorted_records(self):
+        """
+        Return all records added to the grouper, sorted by '_id'.  Records with
+        the same '_id' keep the order in which they were added.
+        :return: yields sorted records
+        """
+        if not self.runs:
+            # everything fit in memory
+            self.buffer.sort(key=ExternalSortGrouper.sort_key)
+            records = self.buffer
+            self.buffer = []
+            return iter(records)
+
+        self.spill()
+        runs = self.runs
+        # merge passes bounding the number of open run files
+        while len(runs) > self.max_fan_in:
+            logging.debug("Merging %d sorted runs by %d" % (len(runs), self.max_fan_in))
+            runs = [self.write_run(ExternalSortGrouper.merge(runs[i:i + self.max_fan_in]))
+                    for i in range(0, len(runs), self.max_fan_in)]
+        run_dir = self.run_dir
+        self.run_dir = None
+        self.runs = []
+        return ExternalSortGrouper.merged_records(runs, run_dir)
+
+    def groups(self):
+        """
+        Return the records added to the grouper as lists of records sharing an '_id'.
+        :return: yields lists of records
+        """
+        for (_, group) in itertools.groupby(self.sorted_records(), key=lambda r: r['_id']):
+            yield list(group)
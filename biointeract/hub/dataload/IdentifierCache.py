@@ -0,0 +1,133 @@
+"""
+IdentifierCache is a persistent, local store of identifier mappings,
+e.g. from UniProt accessions to Entrez gene ids.
+
+Mappings are kept in an SQLite database file, read through a memory
+map, so lookups do not need a remote service and repeated uploads of
+the same release resolve identically.  Identifiers that could not be
+resolved are recorded as negative entries, which expire after a TTL
+and are then resolved again.  The store can also be filled from a bulk
+mapping file so that uploads can run fully offline.
+
+Source Project:   biothings.interactions
+"""
+import logging
+import os
+import sqlite3
+import time
+
+
+class IdentifierCache(object):
+
+    # Negative results expire after 30 days
+    NEGATIVE_TTL = 30 * 24 * 3600
+    # Size of the memory map used to read the database file
+    MMAP_SIZE = 256 * 1024 * 1024
+    # Number of identifiers per SQL statement
+    BATCH_SIZE = 500
+
+    def __init__(self, path, namespace, negative_ttl=None):
+        """
+        Open (or create) an identifier cache.
+        :param path: path of the database file
+        :param namespace: name of the mapping, e.g. 'uniprot:entrezgene'
+        :param negative_ttl: lifetime of negative entries in seconds
+        """
+        folder = os.path.dirname(path)
+        if folder and not os.path.exists(folder):
+            os.makedirs(folder)
+        self.path = path
+        self.namespace = namespace
+        self.negative_ttl = IdentifierCache.NEGATIVE_TTL if negative_ttl is None else negative_ttl
+        self.db = sqlite3.connect(path)
+        self.db.execute("PRAGMA mmap_size = %d" % IdentifierCache.MMAP_SIZE)
+        self.db.execute("PRAGMA journal_mode = WAL")
+        # 'target' has no declared type so integer and string ids keep their type
+        self.db.execute("CREATE TABLE IF NOT EXISTS mapping ("
+                        "namespace TEXT NOT NULL, source TEXT NOT NULL, target, updated REAL NOT NULL, "
+                        "PRIMARY KEY (namespace, source)) WITHOUT ROWID")
+        self.db.commit()
+
+    def close(self):
+        self.db.close()
+
+    @staticmethod
+    def normalize(target):
+        """
+        Return a target identifier with numeric strings converted to integers, so
+        that identifiers from mapping files and from web services compare alike.
+        """
+        if isinstance(target, str) and target.isdigit():
+            return int(target)
+        return target
+
+    def get_many(self, ids):
+        """
+        Look up a collection of identifiers.
+        :param ids: iterable of source identifiers
+        :return: tuple of a dictionary of the resolved identifiers and the set of
+                 identifiers that are not cached (or whose negative entry expired)
+        """
+        ids = list(set(ids))
+        found = {}
+        known = set()
+        expired = time.time() - self.negative_ttl
+        for i in range(0, len(ids), IdentifierCache.BATCH_SIZE):
+            batch = ids[i:i + IdentifierCache.BATCH_SIZE]
+            rows = self.db.execute("SELECT source, target, updated FROM mapping "
+                                   "WHERE namespace = ? AND source IN (%s)" % ','.join('?' * len(batch)),
+                                   [self.namespace] + batch)
+            for (source, target, updated) in rows:
+                if target is not None:
+                    found[source] = IdentifierCache.normalize(target)
+                    known.add(source)
+                elif updated >= expired:
+                    known.add(source)
+        misses = set(ids) - known
+        return found, misses
+
+    def put_many(self, mapping, negatives=()):
+        """
+        Store resolved identifiers and record identifiers that could not be resolved.
+        Numeric targets are stored as integers.
+        :param mapping: dictionary of source to target identifiers
+        :param negatives: iterable of unresolved source identifiers
+        :return:
+        """
+        now = time.time()
+        rows = [(self.namespace, k, IdentifierCache.normalize(v), now) for (k, v) in mapping.items()]
+        rows.extend([(self.namespace, k, None, now) for k in negatives])
+        with self.db:
+            self.db.executemany("INSERT OR REPLACE INTO mapping (namespace, source, target, updated) "
+                                "VALUES (?, ?, ?, ?)", rows)
+
+    def load_mapping_file(self, path, id_type=None):
+        """
+        Bulk load mappings from a tab-separated file.  Lines either have two
+        columns (source, target) or follow the UniProt idmapping layout
+        (source, id type, target), in which case only lines of 'id_type'
+        are loaded.  Numeric targets are stored as integers.
+        :param path: path of the mapping file
+        :param id_type: id type to load from three-column files, e.g. 'GeneID'
+        :return: the number of mappings loaded
+        """
+        count = 0
+        mapping = {}
+        with open(path, 'r') as f:
+            for line in f:
+                cols = line.rstrip('\n').split('\t')
+                if len(cols) == 2:
+                    (source, target) = cols
+                elif len(cols) == 3 and cols[1] == id_type:
+                    (source, target) = (cols[0], cols[2])
+                else:
+                    continue
+                mapping[source] = target
+                if len(mapping) >= 100000:
+                    self.put_many(mapping)
+                    count += len(mapping)
+                    mapping = {}
+        self.put_many(mapping)
+        count += len(mapping)
+        logging.info("Loaded %d '%s' mappings from '%s'" % (count, self.namespace, path))
+        return count
@@ -0,0 +1,132 @@
+"""
+LineReader reads the lines of a tab-separated source file in large
+blocks.
+
+Each block read from the file (plain, gzip or zip member, in binary or
+text mode) is cut after its last line terminator, decoded in a single
+call and split into lines; the incomplete line at the end of a block is
+carried over to the next one.  Rows are returned already split into
+columns, a block at a time, which avoids decoding, stripping and
+splitting every line through a separate generator step.
+
+Source Project:   biothings.interactions
+"""
+from hub.dataload.BiointeractParser import BiointeractParser
+
+
+class LineReader(object):
+
+    # Default number of bytes (or characters in text mode) read at a time
+    BLOCK_SIZE = 1024 * 1024
+
+    def __init__(self, f, block_size=None, separator='\t', encoding='utf-8'):
+        """
+        Create a reader.
+        :param f: file opened for reading in binary or text mode
+        :param block_size: number of bytes (or characters) read at a time
+        :param separator: the column separator
+        :param encoding: encoding of a file opened in binary mode
+        """
+        self.f = f
+        self.block_size = block_size or LineReader.BLOCK_SIZE
+        self.separator = separator
+        self.encoding = encoding
+        self.lines = []
+        self.pos = 0
+        self.tail = None
+        self.read = BiointeractParser.profiled('read', f.read)
+        self.decode = BiointeractParser.profiled('decode', self.decode_block)
+        self.split = BiointeractParser.profiled('split', self.split_lines)
+
+    def decode_block(self, data):
+        if isinstance(data, (bytes, bytearray)):
+            return data.decode(self.encoding)
+        return data
+
+    def split_lines(self, lines):
+        """
+        Split lines into columns.
+        :param lines: list of lines
+        :return: list of column lists
+        """
+        separator = self.separator
+        return [line.split(separator) for line in lines]
+
+    def read_block(self):
+        """
+        Read the next complete lines from the file.
+        :return: list of lines without line terminators, None at the end of the file
+        """
+        while True:
+            block = self.read(self.block_size)
+            if not block:
+                # the last line of a file without a final line terminator
+                if self.tail:
+                    (tail, self.tail) = (self.tail, None)
+                    return [self.decode(tail)]
+                return None
+            if self.tail:
+                block = self.tail + block
+            end = block.rfind(b'\n' if isinstance(block, (bytes, bytearray)) else '\n')
+            if end < 0:
+                self.tail = block
+                continue
+            self.tail = block[end + 1:]
+            return self.decode(block[:end]).split('\n')
+
+    def readline(self):
+        """
+        Return the next line, e.g. a header line.
+        :return: the line without its line terminator, None at the end of the file
+        """
+        if self.pos >= len(self.lines):
+            self.lines = self.read_block()
+            self.pos = 0
+            if self.lines is None:
+                self.lines = []
+                return None
+        line = self.lines[self.pos]
+        self.pos += 1
+        return line
+
+    def skip(self, count):
+        """
+        Skip lines, e.g. comment lines before the rows.
+        :param count: number of lines to skip
+        :return:
+        """
+        for _ in range(count):
+            self.readline()
+
+    def line_blocks(self):
+        """
+        Read the remaining lines of the file.
+        :return: yields lists of lines
+        """
+        if self.pos < len(self.lines):
+            lines = self.lines[self.pos:]
+            self.lines = []
+            self.pos = 0
+            yield lines
+        while True:
+            lines = self.read_block()
+            if lines is None:
+                break
+            yield lines
+
+    def batches(self):
+        """
+        Read the remaining rows of the file split into columns.
+        :return: yields lists of column lists, one list per block
+        """
+        for lines in self.line_blocks():
+            yield self.split(lines)
+
+    def rows(self):
+        """
+        Read the remaining rows of the file split into columns.
+        :return: yields a column list for each row
+        """
+        for batch in self.batches():
+            for columns in batch:
+                yield columns
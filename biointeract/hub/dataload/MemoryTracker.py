@@ -0,0 +1,158 @@
+"""
+MemoryTracker measures the memory used while the documents of an
+upload are parsed.
+
+The resident set size of the process is sampled every SAMPLE_INTERVAL
+documents, and the deep size of the sampled documents gives a per-record
+memory estimate.  With 'trace' set, tracemalloc also records the peak
+of the Python heap, at the cost of a much slower parse.  The report is
+used to project the memory needed by the next upload of the source.
+
+Source Project:   biothings.interactions
+"""
+import resource
+import sys
+import tracemalloc
+
+
+class MemoryTracker(object):
+
+    # Number of documents between two samples
+    SAMPLE_INTERVAL = 1000
+    MB = 1024.0 * 1024.0
+
+    def __init__(self, trace=False, sample_interval=None, process=True):
+        """
+        Create a tracker.
+        :param trace: also record the Python heap peak with tracemalloc
+        :param sample_interval: number of documents between two samples
+        :param process: measure the memory of the process; False when the process
+                        runs other work at the same time, e.g. other pipelined uploads,
+                        only the per-document size estimate is then reported
+        """
+        self.process = process
+        self.trace = trace and process
+        self.sample_interval = sample_interval or MemoryTracker.SAMPLE_INTERVAL
+        self.docs = 0
+        self.sampled_docs = 0
+        self.sampled_bytes = 0
+        self.rss_start = self.rss_peak = MemoryTracker.rss() if process else None
+        self.heap_peak = None
+        self.started_trace = False
+
+    @staticmethod
+    def rss():
+        """
+        Return the current resident set size of the process in bytes, or the
+        peak resident set size where /proc is not available.
+        :return:
+        """
+        try:
+            with open('/proc/self/statm', 'r') as f:
+                return int(f.read().split()[1]) * resource.getpagesize()
+        except (IOError, OSError):
+            return MemoryTracker.peak_rss()
+
+    @staticmethod
+    def peak_rss():
+        """
+        Return the peak resident set size of the process since it started, in bytes.
+        :return:
+        """
+        # ru_maxrss is in kilobytes on Linux, in bytes on OS X
+        rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return rss if sys.platform == 'darwin' else rss * 1024
+
+    @staticmethod
+    def deep_size(obj):
+        """
+        Estimate the memory used by a document and all the objects it holds.
+        :param obj: a document
+        :return: size in bytes
+        """
+        size = sys.getsizeof(obj)
+        if isinstance(obj, dict):
+            for (k, v) in obj.items():
+                size += MemoryTracker.deep_size(k) + MemoryTracker.deep_size(v)
+        elif isinstance(obj, (list, tuple, set, frozenset)):
+            for v in obj:
+                size += MemoryTracker.deep_size(v)
+        return size
+
+    def sample(self, doc=None):
+        """
+        Sample the resident set size and the size of a document.
+        :param doc: a document or None
+        :return:
+        """
+        if self.process:
+            self.rss_peak = max(self.rss_peak, MemoryTracker.rss())
+        if doc is not None:
+            self.sampled_docs += 1
+            self.sampled_bytes += MemoryTracker.deep_size(doc)
+
+    def start(self):
+        if self.trace and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self.started_trace = True
+
+    def stop(self):
+        self.sample()
+        if self.trace:
+            self.heap_peak = tracemalloc.get_traced_memory()[1]
+            # a tracer started by the caller is left running
+            if self.started_trace:
+                tracemalloc.stop()
+                self.started_trace = False
+
+    def track(self, docs):
+        """
+        Pass documents through while measuring the memory.
+        :param docs: iterable of documents
+        :return: yields the documents
+        """
+        self.start()
+        try:
+            for doc in docs:
+                if self.docs % self.sample_interval == 0:
+                    self.sample(doc)
+                self.docs += 1
+                yield doc
+        finally:
+            self.stop()
+
+    def track_batches(self, batches):
+        """
+        Pass lists of documents through while measuring the memory.  The first
+        document of a batch is sampled once 'sample_interval' documents were
+        passed since the last sample.
+        :param batches: iterable of lists of documents
+        :return: yields the lists of documents
+        """
+        self.start()
+        next_sample = 0
+        try:
+            for batch in batches:
+                if batch and self.docs >= next_sample:
+                    self.sample(batch[0])
+                    next_sample = self.docs + self.sample_interval
+                self.docs += len(batch)
+                yield batch
+        finally:
+            self.stop()
+
+    def report(self):
+        """
+        Build the memory report.
+        :return: dictionary of the document count, the per-document size estimate
+                 and the memory peaks in MB, None when the process is not measured
+        """
+        mb = lambda size: round(size / MemoryTracker.MB, 1) if size is not None else None
+        return {
+            'docs': self.docs,
+            'doc_bytes': self.sampled_bytes // self.sampled_docs if self.sampled_docs else None,
+            'rss_start_mb': mb(self.rss_start),
+            'rss_peak_mb': mb(self.rss_peak),
+            'process_peak_mb': mb(MemoryTracker.peak_rss() if self.process else None),
+            'heap_peak_mb': mb(self.heap_peak)
+        }
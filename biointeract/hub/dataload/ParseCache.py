@@ -0,0 +1,158 @@
+"""
+ParseCache stores the documents parsed from a source file so that
+uploads of an unchanged file replay them instead of parsing it again.
+
+Entries are addressed by a hash of the source file contents, of the
+parser class, its SCHEMA_VERSION and collapse options, and of the parse
+options of the uploader that change the content or the order of the
+documents (e.g. a parallel parse returning them in partition order).  A cache file is
+a sequence of chunks, each a 4-byte big-endian length followed by the
+zlib-compressed concatenation of the pickled documents of the chunk.
+Documents are written while they are passed on to the uploader, and the
+file only becomes visible once the complete stream has been written, so
+an interrupted upload never leaves a partial entry behind.
+
+Source Project:   biothings.interactions
+"""
+import glob
+import hashlib
+import io
+import json
+import logging
+import os
+import pickle
+import struct
+import tempfile
+import zlib
+
+
+class ParseCache(object):
+
+    MAGIC = b'BIPC\x01'
+    SUFFIX = '.parsecache'
+    # Number of documents per compressed chunk
+    CHUNK_SIZE = 1000
+    COMPRESS_LEVEL = 6
+    # Size of the blocks used to hash source files
+    HASH_BLOCK_SIZE = 1024 * 1024
+    LENGTH = struct.Struct('>I')
+
+    def __init__(self, cache_dir, name, chunk_size=None):
+        """
+        Open a parse cache for a source.  Only the entry of the latest parsed
+        file is kept for each source name.
+        :param cache_dir: directory of the cache files
+        :param name: source name, used to prefix the cache files
+        :param chunk_size: number of documents per compressed chunk
+        """
+        if not os.path.exists(cache_dir):
+            os.makedirs(cache_dir)
+        self.cache_dir = cache_dir
+        self.name = name
+        self.chunk_size = chunk_size or ParseCache.CHUNK_SIZE
+
+    @staticmethod
+    def key(path, parser, options=None):
+        """
+        Compute the cache key of a source file and parser.
+        :param path: path of the source file
+        :param parser: the BiointeractParser class used to parse the file
+        :param options: dictionary of the parse options changing the documents or their order
+        :return: hexadecimal digest
+        """
+        h = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(ParseCache.HASH_BLOCK_SIZE), b''):
+                h.update(block)
+        h.update('\0{0}\0{1}\0{2}\0{3}'.format(parser.__name__, parser.SCHEMA_VERSION, parser.DEDUP_EVIDENCE,
+                                               parser.MERGE_INTERACTORS).encode('utf-8'))
+        h.update('\0{0}'.format(json.dumps(options or {}, sort_keys=True)).encode('utf-8'))
+        return h.hexdigest()
+
+    def entry_path(self, key):
+        """
+        Return the path of the cache file for a key.
+        :param key: the cache key
+        :return:
+        """
+        return os.path.join(self.cache_dir, '{0}-{1}{2}'.format(self.name, key, ParseCache.SUFFIX))
+
+    def load(self, path, parser, parse, options=None):
+        """
+        Return the documents of a source file, replayed from the cache if the
+        file was parsed before with the same options and parsed (and stored) otherwise.
+        :param path: path of the source file
+        :param parser: the BiointeractParser class used to parse the file
+        :param parse: function without arguments returning the parsed documents
+        :param options: dictionary of the parse options changing the documents or their order
+        :return: yields the parsed documents
+        """
+        entry = self.entry_path(ParseCache.key(path, parser, options))
+        if os.path.exists(entry):
+            logging.info("Replay parsed documents of '%s' from '%s'" % (path, entry))
+            return ParseCache.replay(entry)
+        logging.info("No parsed documents cached for '%s', parsing" % path)
+        return self.store(entry, parse())
+
+    @staticmethod
+    def replay(entry):
+        """
+        Read the documents of a cache file.
+        :param entry: path of the cache file
+        :return: yields the cached documents
+        """
+        with open(entry, 'rb') as f:
+            if f.read(len(ParseCache.MAGIC)) != ParseCache.MAGIC:
+                raise ValueError("'%s' is not a parse cache file" % entry)
+            while True:
+                header = f.read(ParseCache.LENGTH.size)
+                if not header:
+                    break
+                (length,) = ParseCache.LENGTH.unpack(header)
+                chunk = io.BytesIO(zlib.decompress(f.read(length)))
+                size = len(chunk.getbuffer())
+                while chunk.tell() < size:
+                    yield pickle.load(chunk)
+
+    @staticmethod
+    def write_chunk(f, chunk):
+        """
+        Compress and write a chunk of pickled documents.
+        :param f: the cache file
+        :param chunk: list of pickled documents
+        :return:
+        """
+        data = zlib.compress(b''.join(chunk), ParseCache.COMPRESS_LEVEL)
+        f.write(ParseCache.LENGTH.pack(len(data)))
+        f.write(data)
+
+    def store(self, entry, docs):
+        """
+        Pass documents through while writing them to a cache file.  The entry is
+        only created, replacing older entries of the source, after the last document.
+        :param entry: path of the cache file
+        :param docs: iterable of parsed documents
+        :return: yields the documents
+        """
+        (fd, tmp_path) = tempfile.mkstemp(dir=self.cache_dir, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(ParseCache.MAGIC)
+                chunk = []
+                for doc in docs:
+                    # pickle before yielding, the uploader may modify the document
+                    chunk.append(pickle.dumps(doc, protocol=pickle.HIGHEST_PROTOCOL))
+                    yield doc
+                    if len(chunk) >= self.chunk_size:
+                        ParseCache.write_chunk(f, chunk)
+                        chunk = []
+                if chunk:
+                    ParseCache.write_chunk(f, chunk)
+
+            for old in glob.glob(os.path.join(self.cache_dir, '{0}-*{1}'.format(self.name, ParseCache.SUFFIX))):
+                os.remove(old)
+            os.replace(tmp_path, entry)
+            logging.info("Stored parsed documents in '%s'" % entry)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
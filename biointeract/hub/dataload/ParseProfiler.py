@@ -0,0 +1,108 @@
+"""
+ParseProfiler records the wall time spent in each stage of a parser.
+
+Parsers obtain their per-row functions and iterators through
+BiointeractParser.profiled and BiointeractParser.profiled_iter once,
+before their main loop.  When profiling is disabled these return the
+function or iterator unchanged, so there is no per-row overhead.  When
+enabled, every call (or every item taken from an iterator) is timed.
+Stages nest: the time of a stage called from within another stage is
+subtracted from the 'self' time of the outer stage, so the self times
+of all stages add up to the profiled wall time.
+
+Only the stages run in the current process are recorded; work done in
+worker processes (e.g. the parallel BioGRID parser) is reported as part
+of the stage waiting for it.
+
+Source Project:   biothings.interactions
+"""
+import time
+from collections import OrderedDict
+
+
+class ParseProfiler(object):
+
+    def __init__(self):
+        # stage name to [calls, total time, self time]
+        self.stats = OrderedDict()
+        # [stage name, start time, time spent in nested stages] of the running stages
+        self.stack = []
+        self.started = time.time()
+
+    def enter(self, stage):
+        self.stack.append([stage, time.time(), 0.0])
+
+    def exit(self):
+        (stage, start, nested) = self.stack.pop()
+        elapsed = time.time() - start
+        if self.stack:
+            self.stack[-1][2] += elapsed
+        s = self.stats.get(stage)
+        if s is None:
+            s = self.stats[stage] = [0, 0.0, 0.0]
+        s[0] += 1
+        s[1] += elapsed
+        s[2] += elapsed - nested
+
+    def wrap(self, stage, func):
+        """
+        Return a function recording each call of 'func' under 'stage'.
+        :param stage: the stage name
+        :param func: the function to profile
+        :return:
+        """
+        def profiled(*args, **kwargs):
+            self.enter(stage)
+            try:
+                return func(*args, **kwargs)
+            finally:
+                self.exit()
+        return profiled
+
+    def iterate(self, stage, iterable):
+        """
+        Iterate over 'iterable', recording the time taken to produce each item under 'stage'.
+        :param stage: the stage name
+        :param iterable: the iterable to profile
+        :return: yields the items of the iterable
+        """
+        it = iter(iterable)
+        while True:
+            self.enter(stage)
+            try:
+                item = next(it)
+            except StopIteration:
+                return
+            finally:
+                self.exit()
+            yield item
+
+    def report(self):
+        """
+        Build the profiling report.
+        :return: dictionary with the profiled wall time and a list of stage statistics
+        """
+        stages = []
+        for (stage, (calls, total, own)) in self.stats.items():
+            stages.append({
+                'stage': stage,
+                'calls': calls,
+                'total_s': round(total, 3),
+                'self_s': round(own, 3),
+                'per_s': round(calls / total, 1) if total else None
+            })
+        return {'wall_s': round(time.time() - self.started, 3), 'stages': stages}
+
+    @staticmethod
+    def format_report(report):
+        """
+        Format a report as a text table.
+        :param report: a report returned by report()
+        :return: the table string
+        """
+        lines = ['%-24s %12s %10s %10s %12s' % ('stage', 'calls', 'total_s', 'self_s', 'per_s')]
+        for s in report['stages']:
+            lines.append('%-24s %12d %10.3f %10.3f %12s' % (s['stage'], s['calls'], s['total_s'], s['self_s'],
+                                                           s['per_s']))
+        lines.append('wall time: %.3f s' % report['wall_s'])
+        return '\n'.join(lines)
@@ -0,0 +1,89 @@
+"""
+ReleaseDiff compares the documents parsed from a new release of a
+source with the documents of the previous release.
+
+Documents are matched by '_id' and compared with a digest of their
+canonical JSON encoding, so only the digests of the previous release
+are held in memory.  The comparison yields the inserts, updates and
+deletes that turn the previous release into the new one.
+
+Source Project:   biothings.interactions
+"""
+import hashlib
+import json
+
+
+class ReleaseDiff(object):
+
+    INSERT = 'insert'
+    UPDATE = 'update'
+    DELETE = 'delete'
+
+    def __init__(self, previous=None):
+        """
+        Create a diff against the previous release.
+        :param previous: dictionary of '_id' to digest of the previous release documents
+        """
+        self.previous = previous or {}
+        self.counts = {ReleaseDiff.INSERT: 0, ReleaseDiff.UPDATE: 0, ReleaseDiff.DELETE: 0}
+        self.unchanged = 0
+
+    @staticmethod
+    def digest(doc):
+        """
+        Compute a content digest of a document that is stable across processes
+        and independent of the key order of its dictionaries.
+        :param doc: a document
+        :return: digest bytes
+        """
+        data = json.dumps(doc, sort_keys=True, separators=(',', ':'), default=str)
+        return hashlib.sha1(data.encode('utf-8')).digest()
+
+    def add_previous(self, doc):
+        """
+        Add a document of the previous release.
+        :param doc: a document
+        :return:
+        """
+        self.previous[doc['_id']] = ReleaseDiff.digest(doc)
+
+    def diff(self, docs):
+        """
+        Compare the documents of the new release with the previous release.
+        Deletes are yielded after all documents were read.
+        :param docs: iterable of new release documents
+        :return: yields (operation, document) tuples, deletes carry an '_id'-only document
+        """
+        for doc in docs:
+            previous = self.previous.pop(doc['_id'], None)
+            if previous is None:
+                op = ReleaseDiff.INSERT
+            elif previous != ReleaseDiff.digest(doc):
+                op = ReleaseDiff.UPDATE
+            else:
+                self.unchanged += 1
+                continue
+            self.counts[op] += 1
+            yield op, doc
+
+        for _id in self.previous.keys():
+            self.counts[ReleaseDiff.DELETE] += 1
+            yield ReleaseDiff.DELETE, {'_id': _id}
+        self.previous = {}
+
+    @staticmethod
+    def combine(first, second):
+        """
+        Combine the operations of two successive diffs of a document into the
+        operation of a single diff with the first previous release.
+        :param first: operation of the first diff
+        :param second: operation of the second diff
+        :return: the combined operation, None if the document is unchanged
+        """
+        if first == ReleaseDiff.INSERT:
+            if second == ReleaseDiff.DELETE:
+                return None
+            return ReleaseDiff.INSERT
+        if first == ReleaseDiff.DELETE and second == ReleaseDiff.INSERT:
+            return ReleaseDiff.UPDATE
+        return second
@@ -0,0 +1,208 @@
+"""
+ReleaseDiffUploader uploads a new release of a source as the
+difference with the release already stored in its collection.
+
+Instead of loading the whole release into a temporary collection and
+switching collections, the parsed documents are compared with the
+current collection (see ReleaseDiff) and only the inserts, updates and
+deletes are written to it, once the whole release was parsed.  Each
+change is recorded with its operation in the '<collection>_changeset'
+collection, which is replaced on every diff upload, and a summary of
+the changeset is registered with the upload job in src_dump so that
+builds can apply it incrementally.  The summary is removed when an
+upload starts and registered again when it succeeded.
+
+The first upload, or any upload with RELEASE_DIFF_UPLOADS set to False
+in the hub config, is a regular full load, pipelined with UPLOAD_PIPELINE.
+Diff uploads always run in a worker process.
+
+Source Project:   biothings.interactions
+"""
+import datetime
+import itertools
+import logging
+
+import biothings, config
+biothings.config_for_app(config)
+
+from biothings.utils.mongo import get_src_db
+from functools import partial
+from pymongo import DeleteOne, ReplaceOne
+from hub.dataload.BiointeractUploader import BiointeractUploader
+from hub.dataload.ReleaseDiff import ReleaseDiff
+
+
+def apply_changes(collection, changes, batch_size):
+    """
+    Apply staged changes to a collection.  Inserts and updates are upserts, so
+    that the changes of an interrupted apply can be applied again.
+    :param collection: the collection of the source
+    :param changes: iterable of {'_id', 'op', 'doc'} changes
+    :param batch_size: number of writes per bulk request
+    :return:
+    """
+    requests = []
+    for change in changes:
+        if change['op'] == ReleaseDiff.DELETE:
+            requests.append(DeleteOne({'_id': change['_id']}))
+        else:
+            requests.append(ReplaceOne({'_id': change['_id']}, change['doc'], upsert=True))
+        if len(requests) >= batch_size:
+            collection.bulk_write(requests, ordered=False)
+            requests = []
+    if requests:
+        collection.bulk_write(requests, ordered=False)
+
+
+def combine_changes(staged, changes):
+    """
+    Combine a batch of changes with the staged changes of the same documents
+    (see ReleaseDiff.combine), reading and writing the staged changes in bulk.
+    :param staged: the collection of the staged changes
+    :param changes: list of {'_id', 'op', 'doc'} changes
+    :return:
+    """
+    previous = dict((c['_id'], c['op']) for c in staged.find({'_id': {'$in': [c['_id'] for c in changes]}},
+                                                             {'op': 1}))
+    requests = []
+    for change in changes:
+        op = ReleaseDiff.combine(previous[change['_id']], change['op']) \
+            if change['_id'] in previous else change['op']
+        if op is None:
+            requests.append(DeleteOne({'_id': change['_id']}))
+        else:
+            change['op'] = op
+            requests.append(ReplaceOne({'_id': change['_id']}, change, upsert=True))
+    staged.bulk_write(requests, ordered=False)
+
+
+def diff_worker(name, loaddata_func, col_name, changeset_col_name, batch_size, *args):
+    """
+    Pickable job applying the difference between the document batches returned
+    by loaddata_func and the documents of col_name to col_name.
+
+    The changes are first written to '<changeset>_tmp' while the release is
+    parsed, the collection is left untouched until the parse succeeded.  The
+    changes are then staged in '<changeset>_staged', applied to the collection
+    and published as the changeset.  A staged collection left by an interrupted
+    apply is applied before the diff, and its changes are combined with the
+    changes of the diff, so that the changeset still covers them.
+    :return: dictionary of the number of inserts, updates and deletes
+    """
+    db = get_src_db()
+    collection = db[col_name]
+    tmp = db[changeset_col_name + '_tmp']
+    staged = db[changeset_col_name + '_staged']
+    tmp.drop()
+
+    resumed = staged.count() > 0
+    if resumed:
+        logging.warning("Applying the changes of an interrupted upload of '%s' before the diff" % name)
+        apply_changes(collection, staged.find(), batch_size)
+
+    diff = ReleaseDiff()
+    for doc in collection.find():
+        diff.add_previous(doc)
+
+    changes = []
+    for (op, doc) in diff.diff(itertools.chain.from_iterable(loaddata_func(*args))):
+        change = {'_id': doc['_id'], 'op': op}
+        if op != ReleaseDiff.DELETE:
+            change['doc'] = doc
+        changes.append(change)
+        if len(changes) >= batch_size:
+            tmp.insert_many(changes, ordered=False)
+            changes = []
+    if changes:
+        tmp.insert_many(changes, ordered=False)
+
+    # the release is parsed, stage its changes
+    if not resumed:
+        if tmp.count() > 0:
+            tmp.rename(staged.name, dropTarget=True)
+    else:
+        batch = []
+        for change in tmp.find():
+            batch.append(change)
+            if len(batch) >= batch_size:
+                combine_changes(staged, batch)
+                batch = []
+        if batch:
+            combine_changes(staged, batch)
+        tmp.drop()
+
+    apply_changes(collection, staged.find(), batch_size)
+    counts = dict((op, staged.count({'op': op}))
+                  for op in (ReleaseDiff.INSERT, ReleaseDiff.UPDATE, ReleaseDiff.DELETE))
+    counts['unchanged'] = diff.unchanged
+    if staged.count() > 0:
+        staged.aggregate([{'$project': {'op': 1}}, {'$out': changeset_col_name}])
+    else:
+        db[changeset_col_name].drop()
+    staged.drop()
+    return counts
+
+
+class ReleaseDiffUploader(BiointeractUploader):
+
+    # Upload new releases as a diff with the stored release
+    diff_upload = True
+
+    @property
+    def changeset_collection_name(self):
+        return self.collection_name + '_changeset'
+
+    def use_diff(self):
+        """
+        A diff upload is done when enabled and a previous release is stored.
+        :return:
+        """
+        if not getattr(config, 'RELEASE_DIFF_UPLOADS', self.diff_upload):
+            return False
+        return self.collection_name in self.db.collection_names() and self.collection.count() > 0
+
+    async def update_data(self, batch_size, job_manager):
+        """
+        Iterate over load_data() and apply the difference with the stored release
+        to the collection, or load it into a new collection if no release is stored.
+        """
+        # the changeset of the last upload no longer describes the collection
+        self.src_dump.update_one({"_id": self.main_source},
+                                 {"$unset": {"upload.jobs.%s.changeset" % self.name: ""}})
+        if not self.use_diff():
+            # a full load has no changeset with the previous release
+            await super(ReleaseDiffUploader, self).update_data(batch_size, job_manager)
+            return
+        if self.use_pipeline():
+            self.logger.warning("UPLOAD_PIPELINE is ignored for the diff upload of '%s', "
+                                "the diff runs in a worker process" % self.name)
+
+        previous_release = self.src_doc.get('upload', {}).get('jobs', {}).get(self.name, {}).get('release')
+        release = self.src_doc.get('download', {}).get('release') or self.src_doc.get('release')
+        self.logger.info("Uploading release '%s' of '%s' as a diff with release '%s'"
+                         % (release, self.name, previous_release))
+
+        pinfo = self.get_pinfo()
+        pinfo["step"] = "update_data"
+        self.unprepare()
+        job = await job_manager.defer_to_process(
+            pinfo,
+            partial(diff_worker,
+                    self.fullname,
+                    self.load_data,
+                    self.collection_name,
+                    self.changeset_collection_name,
+                    batch_size,
+                    self.data_folder))
+        counts = await job
+
+        self.logger.info("Release diff of '%s': %s" % (self.name, counts))
+        changeset = {
+            'collection': self.changeset_collection_name,
+            'release': release,
+            'previous_release': previous_release,
+            'timestamp': datetime.datetime.now()
+        }
+        changeset.update(counts)
+        self.src_dump.update_one({"_id": self.main_source},
+                                 {"$set": {"upload.jobs.%s.changeset" % self.name: changeset}})
@@ -0,0 +1,176 @@
+"""
+UploadPipeline overlaps the parsing and the storage of an upload.
+
+The document batches are produced by a parser running in an executor
+thread and put on a bounded asyncio queue; writer coroutines on the hub
+event loop take them off the queue and store them, each insert running
+in a writer thread so that the loop is never blocked.  While a batch is
+written the next one is parsed, so an upload takes about the longer of
+the parse and write times instead of their sum.  The parser waits when
+the queue is full, which bounds the memory held by parsed batches.
+
+The pipeline reports the time spent parsing and writing, the time the
+parser waited on a full queue (producer stall, the storage is the
+bottleneck) and the time the writers waited on an empty queue (consumer
+stall, the parser is the bottleneck), and the queue depth seen by the
+writers.
+
+Source Project:   biothings.interactions
+"""
+import asyncio
+import concurrent.futures
+import logging
+import time
+
+
+class UploadPipeline(object):
+
+    # Default number of batches held by the queue
+    QUEUE_SIZE = 4
+
+    def __init__(self, produce, store, writers=1, queue_size=None, loop=None, logger=logging):
+        """
+        Create a pipeline.
+        :param produce: function returning an iterable of document batches, run in an executor
+        :param store: function storing a batch and returning the number of stored documents
+        :param writers: number of concurrent writers
+        :param queue_size: maximum number of batches waiting for a writer
+        :param loop: the event loop (the current loop if None)
+        :param logger: the logger
+        """
+        self.produce = produce
+        self.store = store
+        self.writers = writers or 1
+        self.queue_size = queue_size or UploadPipeline.QUEUE_SIZE
+        self.loop = loop
+        self.logger = logger
+        self.error = None
+        self.batches = 0
+        self.docs = 0
+        self.parse_s = 0.0
+        self.write_s = 0.0
+        self.producer_stall_s = 0.0
+        self.consumer_stall_s = 0.0
+        self.depth_samples = 0
+        self.depth_total = 0
+        self.max_depth = 0
+        self.wall_s = 0.0
+
+    async def run(self, defer=None):
+        """
+        Run the pipeline until all batches were stored.
+        :param defer: optional coroutine function deferring the producer function to
+                      a thread and returning its future, e.g. a partial of
+                      JobManager.defer_to_thread; an executor thread is used if None
+        :return: the number of stored documents
+        """
+        self.loop = self.loop or asyncio.get_event_loop()
+        queue = asyncio.Queue(maxsize=self.queue_size)
+        t0 = time.time()
+        with concurrent.futures.ThreadPoolExecutor(max_workers=self.writers + 1) as executor:
+            consumers = [asyncio.ensure_future(self.consume(queue, executor)) for _ in range(self.writers)]
+            producer = lambda: self.produce_batches(queue)
+            try:
+                if defer:
+                    await (await defer(producer))
+                else:
+                    await self.loop.run_in_executor(executor, producer)
+            except Exception:
+                # the writers may not have received their end marker
+                for c in consumers:
+                    c.cancel()
+                raise
+            counts = await asyncio.gather(*consumers)
+        self.wall_s = time.time() - t0
+        if self.error:
+            raise self.error
+        return sum(counts)
+
+    def put(self, queue, item):
+        """
+        Put an item on the queue from the producer thread, waiting while it is full.
+        """
+        asyncio.run_coroutine_threadsafe(queue.put(item), self.loop).result()
+
+    def produce_batches(self, queue):
+        """
+        Read the batches of the parser and put them on the queue.  Runs in the
+        producer thread, ending with one None marker per writer.
+        :param queue: the batch queue
+        :return: the number of batches produced
+        """
+        count = 0
+        batches = None
+        try:
+            batches = iter(self.produce())
+            while not self.error:
+                t0 = time.time()
+                try:
+                    batch = next(batches)
+                except StopIteration:
+                    break
+                t1 = time.time()
+                self.put(queue, batch)
+                self.parse_s += t1 - t0
+                self.producer_stall_s += time.time() - t1
+                count += 1
+        finally:
+            # stop a parser left unfinished after a failed write, removing its temporary files
+            if self.error and hasattr(batches, 'close'):
+                batches.close()
+            for _ in range(self.writers):
+                self.put(queue, None)
+        return count
+
+    async def consume(self, queue, executor):
+        """
+        Take batches off the queue and store them until the None marker.  After
+        a failed write the remaining batches are discarded and the parser stops.
+        :param queue: the batch queue
+        :param executor: the executor running the writes
+        :return: the number of stored documents
+        """
+        total = 0
+        while True:
+            depth = queue.qsize()
+            self.depth_samples += 1
+            self.depth_total += depth
+            self.max_depth = max(self.max_depth, depth)
+            t0 = time.time()
+            batch = await queue.get()
+            self.consumer_stall_s += time.time() - t0
+            if batch is None:
+                break
+            if self.error:
+                continue
+            t0 = time.time()
+            try:
+                count = await self.loop.run_in_executor(executor, self.store, batch)
+            except Exception as e:
+                self.logger.error("Failed to store a batch: %s" % e)
+                self.error = self.error or e
+                continue
+            self.write_s += time.time() - t0
+            self.batches += 1
+            self.docs += count
+            total += count
+        return total
+
+    def metrics(self):
+        """
+        Return the pipeline metrics, times in seconds.
+        :return: dictionary of metrics
+        """
+        return {
+            'batches': self.batches,
+            'docs': self.docs,
+            'writers': self.writers,
+            'queue_size': self.queue_size,
+            'wall_s': round(self.wall_s, 3),
+            'parse_s': round(self.parse_s, 3),
+            'write_s': round(self.write_s, 3),
+            'producer_stall_s': round(self.producer_stall_s, 3),
+            'consumer_stall_s': round(self.consumer_stall_s, 3),
+            'max_queue_depth': self.max_depth,
+            'mean_queue_depth': round(self.depth_total / self.depth_samples, 2) if self.depth_samples else 0.0
+        }
@@ -8,6 +8,7 @@ Author:  Greg Taylor:  greg.k.taylor@gmail.com
 import hashlib
 import re
 from hub.dataload.BiointeractParser import BiointeractParser
+from hub.dataload.LineReader import LineReader
 
 
 class CPDParser(BiointeractParser):
@@ -75,6 +76,25 @@ class CPDParser(BiointeractParser):
 
         return new_record
 
+    @staticmethod
+    def get_schema(header):
+        """
+        Compile the record schema for a ConsensusPathDB file.  All columns are
+        stored under the 'cpd' group.
+        :param header: list of column names from the header line
+        :return: a RecordSchema
+        """
+        return CPDParser.compile_schema(
+            header,
+            empty_field=CPDParser.EMPTY_FIELD,
+            float_fields=['interaction_confidence'],
+            converters={
+                'interaction_participants': CPDParser.parse_interaction_participants,
+                'interaction_publications': CPDParser.parse_interaction_publications,
+                'source_databases': CPDParser.parse_source_databases
+            },
+            default_group='cpd')
+
     @staticmethod
     def parse_cpd_tsv_file(f):
         """
@@ -82,23 +102,26 @@ class CPDParser(BiointeractParser):
         :param f: file opened for reading in binary mode
         :return: yields a generator of parsed objects
         """
-        for (i, line) in enumerate(f):
-            line = line.strip('\n')
-
-            # The first commented line is the database description
-
-            # The second commented line contains the column headers
-            if i == 1:
-                line = line.replace("#  ", '')  # Delete the comment prefix
-                header_dict = dict(enumerate(line.split('\t')))
-                print(header_dict)
-
-            # All subsequent lines contain row data
-            elif i > 1:
-                _r = {}
-                for (pos, val) in enumerate(line.split('\t')):
-                    _r[header_dict[pos]] = val
-                yield CPDParser.parse_cpd_tsv_line(_r)
+        compute_id = CPDParser.profiled('set_id', CPDParser.compute_id)
+
+        # The first commented line is the database description
+        reader = LineReader(f)
+        reader.skip(1)
+        header = reader.readline()
+        if header is None:
+            return
+
+        # The second commented line contains the column headers
+        header = header.replace("#  ", '')  # Delete the comment prefix
+        schema = CPDParser.get_schema(header.split('\t'))
+        build = CPDParser.profiled('build', schema.build)
+
+        # All subsequent lines contain row data
+        for batch in reader.batches():
+            for cols in batch:
+                r = build(cols)
+                r['_id'] = compute_id(r['cpd']['interaction_participants'])
+                yield r
 
     @staticmethod
     def compute_id(participate_lst):
@@ -4,11 +4,13 @@ import gzip
 import biothings, config
 biothings.config_for_app(config)
 
-import biothings.hub.dataload.uploader as uploader
+from config import DATA_ARCHIVE_ROOT
+from hub.dataload.ParseCache import ParseCache
+from hub.dataload.BiointeractUploader import BiointeractUploader
 from .parser import CPDParser
 
 
-class ConsensusPathDBUploader(uploader.BaseSourceUploader):
+class ConsensusPathDBUploader(BiointeractUploader):
 
     # main_source = "ConsensusPathDB"
     name = "ConsensusPathDB"
@@ -19,4 +21,26 @@ class ConsensusPathDBUploader(uploader.BaseSourceUploader):
     def load_data(self, data_folder):
         consensus_file = os.path.join(data_folder, self.zip_file_name)
         self.logger.info("Load data from file '%s'" % consensus_file)
-        return CPDParser.parse_cpd_tsv_file(gzip.open(consensus_file, mode='rt'))
+        # Documents of an unchanged file are replayed from the parse cache
+        cache = ParseCache(getattr(config, 'PARSE_CACHE_DIR', os.path.join(DATA_ARCHIVE_ROOT, 'parse_cache')),
+                           self.name)
+        parse = lambda: CPDParser.parse_cpd_tsv_file(gzip.open(consensus_file, mode='rt'))
+        return self.instrument(cache.load(consensus_file, CPDParser, parse))
+
+    @classmethod
+    def get_mapping(cls):
+        """
+        The parser stores the participants, publications and databases as lists and
+        the confidence as a float, index them typed so that the web api returns the
+        documents as stored.
+        """
+        return {
+            "cpd": {
+                "properties": {
+                    "interaction_confidence": {"type": "float"},
+                    "interaction_participants": {"type": "keyword"},
+                    "interaction_publications": {"type": "integer"},
+                    "source_databases": {"type": "keyword"}
+                }
+            }
+        }
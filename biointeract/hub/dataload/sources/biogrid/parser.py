@@ -10,16 +10,23 @@ https://wiki.thebiogrid.org/doku.php/biogrid_tab_version_2.0
 Source Project:   biothings.interactions
 Author:  Greg Taylor:  greg.k.taylor@gmail.com
 """
+import concurrent.futures
+import io
+import os
 import re
 import operator
+import shutil
+import tempfile
 
 from hub.dataload.BiointeractParser import BiointeractParser
+from hub.dataload.LineReader import LineReader
 from biothings.utils.dataload import dict_sweep
 
 class BiogridParser(BiointeractParser):
     # Static Constants
     EMPTY_FIELD = '-'
     SEPARATOR = '|'
+    MERGE_INTERACTORS = True
 
     rename_map = {
         'Entrez Gene Interactor A': 'entrezgene_interactor_a',
@@ -41,6 +48,15 @@ class BiogridParser(BiointeractParser):
         'taxid_interactor_a',
         'taxid_interactor_b'
     ]
+    float_fields = [
+        'score'
+    ]
+    list_fields = [
+        'synonyms_interactor_a',
+        'synonyms_interactor_b',
+        'phenotypes',
+        'qualifications'
+    ]
     ###############################################################
     # Fields to be grouped into single documents within each record
     ###############################################################
@@ -71,43 +87,146 @@ class BiogridParser(BiointeractParser):
     }
 
     @staticmethod
-    def parse_biogrid_tsv_file(f):
+    def get_schema(header):
         """
-        Parse a tab-separated biogrid file opened in binary mode.
+        Compile the record schema for a biogrid file.
+        :param header: list of column names from the header line
+        :return: a RecordSchema
+        """
+        return BiogridParser.compile_schema(
+            header,
+            empty_field=BiogridParser.EMPTY_FIELD,
+            separator=BiogridParser.SEPARATOR,
+            rename_map=BiogridParser.rename_map,
+            int_fields=BiogridParser.int_fields,
+            float_fields=BiogridParser.float_fields,
+            list_fields=BiogridParser.list_fields,
+            groups=[
+                ('interactor_a', BiogridParser.interactor_A_fields),
+                ('interactor_b', BiogridParser.interactor_B_fields),
+                ('citation', BiogridParser.citation_fields),
+                ('experiment', BiogridParser.experiment_fields)
+            ])
+
+    @staticmethod
+    def parse_biogrid_tsv_file(f, max_records=None, tmp_dir=None):
+        """
+        Parse a tab-separated biogrid file opened in binary mode.  Records are
+        grouped by id with an external sort, so at most 'max_records' parsed
+        records are held in memory.
         :param f: file opened for reading in binary mode
+        :param max_records: in-memory record budget for the duplicate collapse
+        :param tmp_dir: directory used to spill sorted runs
         :return: yields a generator of parsed objects
         """
+        records = BiogridParser.parse_biogrid_tsv_records(f)
+        for r in BiogridParser.collapse_duplicate_keys_external(records, 'biogrid', max_records, tmp_dir,
+                                                                dedup=BiogridParser.DEDUP_EVIDENCE,
+                                                                merge_interactors=BiogridParser.MERGE_INTERACTORS):
+            yield r
 
-        result = []
-
-        for (i, line) in enumerate(f):
-            # If the line returned is byptes instead
-            # of a a string then it needs to be decoded
-            if isinstance(line, (bytes, bytearray)):
-                line = line.decode("utf-8")
-            line = line.strip('\n')
+    @staticmethod
+    def parse_biogrid_tsv_file_parallel(f, workers, partitions=None, chunk_size=8 * 1024 * 1024, tmp_dir=None):
+        """
+        Parse a tab-separated biogrid file in several worker processes.  The
+        file is split into line-aligned chunks that are parsed by
+        parse_biogrid_chunk.  Each worker hash-partitions its records by id,
+        so duplicate keys are collapsed one partition at a time.  The same
+        documents as parse_biogrid_tsv_file are returned, grouped by partition.
+        :param f: file opened for reading in binary mode
+        :param workers: number of worker processes
+        :param partitions: number of id partitions (4 per worker if None)
+        :param chunk_size: approximate size of each chunk sent to a worker
+        :param tmp_dir: directory used to store the partition files
+        :return: yields a generator of parsed objects
+        """
+        partitions = partitions or 4 * workers
+        work_dir = tempfile.mkdtemp(prefix='biogrid_', dir=tmp_dir)
+        header = f.readline()
+        if isinstance(header, (bytes, bytearray)):
+            header = header.decode("utf-8")
 
-            # The first commented line contains the column headers
-            if i == 0:
-                line = line.replace("#", '')  # Delete the comment prefix
-                header_dict = dict(enumerate(line.split('\t')))
+        try:
+            chunk_files = []
+            with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor:
+                pending = set()
+                for (chunk_num, chunk) in enumerate(BiogridParser.read_line_chunks(f, chunk_size)):
+                    # Limit the number of chunks held in memory while waiting for a worker
+                    if len(pending) >= 2 * workers:
+                        done, pending = concurrent.futures.wait(
+                            pending, return_when=concurrent.futures.FIRST_COMPLETED)
+                        chunk_files.extend([d.result() for d in done])
+                    pending.add(executor.submit(BiogridParser.parse_biogrid_chunk, header, chunk,
+                                                chunk_num, work_dir, partitions))
+                chunk_files.extend([d.result() for d in concurrent.futures.as_completed(pending)])
 
-            # All subsequent lines contain row data
-            elif i > 0:
-                _r = {}
-                for (pos, val) in enumerate(line.split('\t')):
-                    _r[header_dict[pos]] = val
-                id, r = BiogridParser.parse_biogrid_tsv_line(i, _r)
-                if r:
-                    result.append(r)
+            # Chunk files are collapsed in file order so that evidence keeps the serial order
+            chunk_files.sort(key=operator.itemgetter(0))
+            for p in range(partitions):
+                paths = [files[p] for (chunk_num, files) in chunk_files if p in files]
+                records = BiogridParser.read_partition(paths)
+                for r in BiogridParser.collapse_duplicate_keys(records, 'biogrid',
+                                                               dedup=BiogridParser.DEDUP_EVIDENCE,
+                                                               merge_interactors=BiogridParser.MERGE_INTERACTORS):
+                    yield r
+        finally:
+            shutil.rmtree(work_dir, ignore_errors=True)
 
-        result = BiogridParser.extract_interactors(result, 'biogrid')
-        result = BiogridParser.collapse_duplicate_keys(result, 'biogrid')
+    @staticmethod
+    def parse_biogrid_chunk(header, chunk, chunk_num, work_dir, partitions):
+        """
+        Parse a chunk of biogrid lines and write the records to partition files.
+        Run in a worker process by parse_biogrid_tsv_file_parallel.
+        :param header: the header line of the biogrid file
+        :param chunk: a chunk of complete biogrid lines
+        :param chunk_num: the position of the chunk in the file
+        :param work_dir: directory to write the partition files to
+        :param partitions: the number of partitions
+        :return: tuple of the chunk number and the partition files written
+        """
+        reader = LineReader(io.BytesIO(chunk) if isinstance(chunk, (bytes, bytearray)) else io.StringIO(chunk))
+        records = BiogridParser.parse_biogrid_rows(header.strip('\n'), reader.batches())
+        path_format = os.path.join(work_dir, 'part-{}-%d' % chunk_num)
+        return chunk_num, BiogridParser.write_partitions(records, partitions, path_format)
 
-        # return the results
-        for r in result:
+    @staticmethod
+    def parse_biogrid_tsv_records(f):
+        """
+        Parse a tab-separated biogrid file line by line, without collapsing
+        duplicate keys.
+        :param f: file opened for reading in binary mode
+        :return: yields a record with extracted interactors for each valid line
+        """
+        reader = LineReader(f)
+        header = reader.readline()
+        if header is None:
+            return
+        for r in BiogridParser.parse_biogrid_rows(header, reader.batches()):
             yield r
 
+    @staticmethod
+    def parse_biogrid_rows(header, batches):
+        """
+        Parse the rows of a biogrid file.
+        :param header: the header line
+        :param batches: iterable of lists of row column lists
+        :return: yields a record with extracted interactors for each valid row
+        """
+        set_id = BiogridParser.profiled('set_id', BiogridParser.set_id)
+        extract_interactor = BiogridParser.profiled('extract_interactor', BiogridParser.extract_interactor)
+
+        # The first commented line contains the column headers
+        header = header.replace("#", '')  # Delete the comment prefix
+        schema = BiogridParser.get_schema(header.split('\t'))
+        build = BiogridParser.profiled('build', schema.build)
+
+        # All subsequent lines contain row data
+        for batch in batches:
+            for cols in batch:
+                id, r = set_id(build(cols))
+                if r:
+                    yield extract_interactor(r, 'biogrid')
+
     @staticmethod
     def parse_biogrid_tsv_line(line_num, line_dict):
         """
@@ -4,11 +4,13 @@ from zipfile import ZipFile
 import biothings, config
 biothings.config_for_app(config)
 
-import biothings.hub.dataload.uploader as uploader
+from config import DATA_ARCHIVE_ROOT
+from hub.dataload.ParseCache import ParseCache
+from hub.dataload.ReleaseDiffUploader import ReleaseDiffUploader
 from .parser import BiogridParser
 
 
-class BiogridUploader(uploader.BaseSourceUploader):
+class BiogridUploader(ReleaseDiffUploader):
 
     # main_source = "biogrid"
     name = "biogrid"
@@ -24,8 +26,30 @@ class BiogridUploader(uploader.BaseSourceUploader):
 
         self.logger.info("Load biogrid data from file '%s'" % consensus_file)
 
+        # Documents of an unchanged file are replayed from the parse cache
+        cache = ParseCache(getattr(config, 'PARSE_CACHE_DIR', os.path.join(DATA_ARCHIVE_ROOT, 'parse_cache')),
+                           self.name)
+        # the parallel parse returns the documents in partition order
+        options = {'parallel': not self.is_sorted_by_id()}
+        return self.instrument(cache.load(consensus_file, BiogridParser, lambda: self.parse_file(consensus_file),
+                                          options))
+
+    def is_sorted_by_id(self):
+        # the parallel parser returns the documents grouped by id partition
+        return getattr(config, 'BIOGRID_PARSE_WORKERS', 1) <= 1
+
+    def parse_file(self, consensus_file):
         # Open the first file in the zip file - assuming that it is the data file
         zip = ZipFile(consensus_file)
         tab_file = zip.open(zip.namelist()[0], mode='r')
 
-        return BiogridParser.parse_biogrid_tsv_file(tab_file)
+        # Parse in several processes when BIOGRID_PARSE_WORKERS is set in the hub config
+        workers = getattr(config, 'BIOGRID_PARSE_WORKERS', 1)
+        if workers > 1:
+            self.logger.info("Parsing biogrid data with %d worker processes" % workers)
+            return BiogridParser.parse_biogrid_tsv_file_parallel(tab_file, workers,
+                                                                 tmp_dir=getattr(config, 'SORT_TMP_DIR', None))
+
+        return BiogridParser.parse_biogrid_tsv_file(tab_file,
+                                                    max_records=self.sort_buffer_size(),
+                                                    tmp_dir=getattr(config, 'SORT_TMP_DIR', None))
@@ -10,12 +10,13 @@ http://ctdbase.org/downloads/;jsessionid=0BD8D8C07B7661002359C02D7C0275F8
 Source Project:   biothings.interactions
 Author:  Greg Taylor:  greg.k.taylor@gmail.com
 """
-import json
 import logging
 import operator
 import re
 
-from hub.dataload.BiointeractParser import BiointeractParser
+from hub.dataload.BiointeractParser import BiointeractParser, InteractorAccumulator
+from hub.dataload.LineReader import LineReader
+from hub.dataload.ExternalSortGrouper import ExternalSortGrouper
 from biothings.utils.dataload import dict_sweep
 
 class CTDChemGeneParser(BiointeractParser):
@@ -35,6 +36,13 @@ class CTDChemGeneParser(BiointeractParser):
         'taxid',
         'geneid'
     ]
+    list_fields = [
+        'geneforms',
+        'interactionactions'
+    ]
+    int_list_fields = [
+        'pubmed'
+    ]
     ###############################################################
     # Fields to be grouped into single documents within each record
     ###############################################################
@@ -50,41 +58,108 @@ class CTDChemGeneParser(BiointeractParser):
     }
 
     @staticmethod
-    def parse_tsv_file(f):
+    def get_schema(header):
+        """
+        Compile the record schema for a CTD file.
+        :param header: list of column names from the header line
+        :return: a RecordSchema
+        """
+        return CTDChemGeneParser.compile_schema(
+            header,
+            empty_field=CTDChemGeneParser.EMPTY_FIELD,
+            separator=CTDChemGeneParser.SEPARATOR,
+            rename_map=CTDChemGeneParser.rename_map,
+            int_fields=CTDChemGeneParser.int_fields,
+            list_fields=CTDChemGeneParser.list_fields,
+            int_list_fields=CTDChemGeneParser.int_list_fields,
+            groups=[
+                ('interactor_a', CTDChemGeneParser.interactor_A_fields),
+                ('interactor_b', CTDChemGeneParser.interactor_B_fields)
+            ])
+
+    @staticmethod
+    def parse_tsv_file(f, spill=False, max_records=None, tmp_dir=None):
         """
-        Parse a tab-separated CTD file opened in binary mode.
+        Parse a tab-separated CTD file opened in binary mode.  By default the
+        records are grouped by id in memory; in spill mode they are grouped
+        with an external sort, holding at most 'max_records' records in memory.
         :param f: file opened for reading in binary mode
+        :param spill: group the records with an external sort
+        :param max_records: in-memory record budget of the external sort
+        :param tmp_dir: directory used to spill sorted runs
         :return: yields a generator of parsed objects
         """
+        records = CTDChemGeneParser.parse_tsv_records(f)
+        if spill:
+            return CTDChemGeneParser.collapse_external(records, max_records, tmp_dir)
+        return CTDChemGeneParser.collapse_in_memory(records)
 
+    @staticmethod
+    def collapse_in_memory(records):
+        """
+        Group all records by id in memory and collapse them.
+        :param records: iterable of (id, record) tuples
+        :return: yields collapsed records
+        """
         cache = {}
+        for (id, r) in records:
+            # Add the id and record to the cache
+            if id not in cache.keys():
+                cache[id] = [r]
+            else:
+                cache[id] = [r] + cache[id]
+
+        for r in CTDChemGeneParser.profiled_iter('collapse', CTDChemGeneParser.collapse_cache(cache)):
+            yield r
 
-        for (i, line) in enumerate(f):
-            # If the line returned is byptes instead
-            # of a a string then it needs to be decoded
-            if isinstance(line, (bytes, bytearray)):
-                line = line.decode("utf-8")
-            line = line.strip('\n')
-
-            # The following commented line contains the column headers
-            if i == 27:
-                line = line.replace("# ", '')  # Delete the comment prefix
-                header_dict = dict(enumerate(line.split('\t')))
-
-            # subsequent lines contain row data
-            elif i >= 29:
-                _r = {}
-                for (pos, val) in enumerate(line.split('\t')):
-                    _r[header_dict[pos]] = val
-                id, r = CTDChemGeneParser.parse_tsv_line(i, _r)
-
-                # Add the id and record to the cache
-                if id not in cache.keys():
-                    cache[id] = [r]
-                else:
-                    cache[id] = [r] + cache[id]
-
-        return CTDChemGeneParser.collapse_cache(cache)
+    @staticmethod
+    def parse_tsv_records(f):
+        """
+        Parse a tab-separated CTD file line by line, without grouping records by id.
+        :param f: file opened for reading in binary mode
+        :return: yields (id, record) tuples
+        """
+        set_id = CTDChemGeneParser.profiled('set_id', CTDChemGeneParser.set_id)
+
+        reader = LineReader(f)
+        reader.skip(27)
+        header = reader.readline()
+        if header is None:
+            return
+
+        # The following commented line contains the column headers
+        header = header.replace("# ", '')  # Delete the comment prefix
+        schema = CTDChemGeneParser.get_schema(header.split('\t'))
+        build = CTDChemGeneParser.profiled('build', schema.build)
+        reader.skip(1)
+
+        # subsequent lines contain row data
+        for batch in reader.batches():
+            for cols in batch:
+                yield set_id(build(cols))
+
+    @staticmethod
+    def collapse_external(records, max_records=None, tmp_dir=None):
+        """
+        Group records by id with an external sort and collapse each group as
+        collapse_cache does.
+        :param records: iterable of (id, record) tuples
+        :param max_records: in-memory record budget of the external sort
+        :param tmp_dir: directory used to spill sorted runs
+        :return: yields collapsed records
+        """
+        grouper = ExternalSortGrouper(max_records=max_records, tmp_dir=tmp_dir)
+        for (id, r) in records:
+            r['_id'] = id
+            grouper.add(r)
+        for group in CTDChemGeneParser.profiled_iter('merge_runs', grouper.groups()):
+            id = group[0]['_id']
+            for r in group:
+                r.pop('_id')
+            # the in-memory cache holds the records of an id in reverse file order
+            group.reverse()
+            for r in CTDChemGeneParser.collapse_cache({id: group}):
+                yield r
 
     @staticmethod
     def collapse_cache(cache):
@@ -100,32 +175,28 @@ class CTDChemGeneParser(BiointeractParser):
             r = {}
             r['_id'] = k
             abbreviated_cache = []
-            abbreviated_cache_repr = []
+            abbreviated_cache_seen = set()
 
-            # lists for interactors a and b that will be collapased
-            int_a_list = []
-            int_b_list = []
+            # accumulators for interactors a and b that will be collapased
+            int_a = InteractorAccumulator()
+            int_b = InteractorAccumulator()
 
             for c in cache[k]:
                 if 'interactor_a' in c.keys() and 'interactor_b' in c.keys() and 'direction' in c.keys():
                     if c['direction'] == 'A->B':
-                        int_a_list.append(c['interactor_a'])
-                        int_b_list.append(c['interactor_b'])
-                        c.pop('interactor_a')
-                        c.pop('interactor_b')
+                        int_a.add(c.pop('interactor_a'))
+                        int_b.add(c.pop('interactor_b'))
                     if c['direction'] == 'B->A':
-                        int_a_list.append(c['interactor_b'])
-                        int_b_list.append(c['interactor_a'])
-                        c.pop('interactor_a')
-                        c.pop('interactor_b')
+                        int_a.add(c.pop('interactor_b'))
+                        int_b.add(c.pop('interactor_a'))
 
                     if isinstance(c['interactionactions'], list):
                         continue
 
-                    c_repr = json.dumps(c, sort_keys=True)
-                    if c_repr not in abbreviated_cache_repr:
+                    c_key = CTDChemGeneParser.freeze(c)
+                    if c_key not in abbreviated_cache_seen:
                         abbreviated_cache.append(c)
-                        abbreviated_cache_repr.append(c_repr)
+                        abbreviated_cache_seen.add(c_key)
                     else:
                         # The following block looks for duplicates in the dataset and
                         # logs an error if it finds them
@@ -133,17 +204,9 @@ class CTDChemGeneParser(BiointeractParser):
 
             r['ctd'] = abbreviated_cache
 
-            # collapse int_a_list and int_b_list dictionaries
-            int_a = int_a_list[0]
-            for a in int_a_list:
-                if a != int_a:
-                    int_a = CTDChemGeneParser.combine_interactions(int_a, a)
-            int_b = int_b_list[0]
-            for b in int_b_list:
-                if b != int_b:
-                    int_b = CTDChemGeneParser.combine_interactions(int_b, b)
-            r['interactor_a'] = int_a
-            r['interactor_b'] = int_b
+            # collapse the interactor a and b dictionaries
+            r['interactor_a'] = int_a.emit()
+            r['interactor_b'] = int_b.emit()
 
             if not r['ctd']:
                 continue
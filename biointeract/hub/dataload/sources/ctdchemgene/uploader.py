@@ -4,11 +4,13 @@ import gzip
 import biothings, config
 biothings.config_for_app(config)
 
-import biothings.hub.dataload.uploader as uploader
+from config import DATA_ARCHIVE_ROOT
+from hub.dataload.ParseCache import ParseCache
+from hub.dataload.ReleaseDiffUploader import ReleaseDiffUploader
 from .parser import CTDChemGeneParser
 
 
-class CTDChemGeneUploader(uploader.BaseSourceUploader):
+class CTDChemGeneUploader(ReleaseDiffUploader):
 
     # main_source = "ConsensusPathDB"
     name = "CTD_chem_gene_ixns"
@@ -19,4 +21,14 @@ class CTDChemGeneUploader(uploader.BaseSourceUploader):
     def load_data(self, data_folder):
         downloaded_file = os.path.join(data_folder, self.zip_file_name)
         self.logger.info("Load data from file '%s'" % downloaded_file)
-        return CTDChemGeneParser.parse_tsv_file(gzip.open(downloaded_file, mode='rt'))
+        # Documents of an unchanged file are replayed from the parse cache
+        cache = ParseCache(getattr(config, 'PARSE_CACHE_DIR', os.path.join(DATA_ARCHIVE_ROOT, 'parse_cache')),
+                           self.name)
+        # Records are grouped on disk when the memory budget of the source would be exceeded
+        spill = self.spill_to_disk(downloaded_file)
+        parse = lambda: CTDChemGeneParser.parse_tsv_file(gzip.open(downloaded_file, mode='rt'),
+                                                         spill=spill,
+                                                         max_records=self.sort_buffer_size(),
+                                                         tmp_dir=getattr(config, 'SORT_TMP_DIR', None))
+        # the spilled parse returns the documents in another order
+        return self.instrument(cache.load(downloaded_file, CTDChemGeneParser, parse, {'spill': spill}))
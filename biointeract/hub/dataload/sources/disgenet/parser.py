@@ -11,6 +11,7 @@ import operator
 import re
 
 from hub.dataload.BiointeractParser import BiointeractParser
+from hub.dataload.LineReader import LineReader
 from biothings.utils.dataload import dict_sweep
 
 class DisGeNETParser(BiointeractParser):
@@ -23,6 +24,9 @@ class DisGeNETParser(BiointeractParser):
         'nofsnps',
         'geneid'
     ]
+    float_fields = [
+        'score'
+    ]
 
     ###############################################################
     # Fields to be grouped into single documents within each record
@@ -37,46 +41,70 @@ class DisGeNETParser(BiointeractParser):
     }
 
     @staticmethod
-    def parse_tsv_file(f):
+    def get_schema(header):
+        """
+        Compile the record schema for a DisGeNET file.
+        :param header: list of column names from the header line
+        :return: a RecordSchema
         """
-        Parse a tab-separated DisGeNET file opened in binary mode.
+        return DisGeNETParser.compile_schema(
+            header,
+            rename_map=DisGeNETParser.rename_map,
+            int_fields=DisGeNETParser.int_fields,
+            float_fields=DisGeNETParser.float_fields,
+            groups=[
+                ('interactor_a', DisGeNETParser.interactor_A_fields),
+                ('interactor_b', DisGeNETParser.interactor_B_fields)
+            ])
+
+    @staticmethod
+    def parse_tsv_file(f, max_records=None, tmp_dir=None):
+        """
+        Parse a tab-separated DisGeNET file opened in binary mode.  Records are
+        grouped by id with an external sort, so at most 'max_records' parsed
+        records are held in memory.
         :param f: file opened for reading in binary mode
+        :param max_records: in-memory record budget for the duplicate collapse
+        :param tmp_dir: directory used to spill sorted runs
         :return: yields a generator of parsed objects
         """
+        records = DisGeNETParser.parse_tsv_records(f)
+        for r in DisGeNETParser.collapse_duplicate_keys_external(records, 'disgenet', max_records, tmp_dir,
+                                                                 dedup=DisGeNETParser.DEDUP_EVIDENCE,
+                                                                 merge_interactors=DisGeNETParser.MERGE_INTERACTORS):
+            yield r
 
-        result = []
+    @staticmethod
+    def parse_tsv_records(f):
+        """
+        Parse a tab-separated DisGeNET file line by line, without collapsing
+        duplicate keys.
+        :param f: file opened for reading in binary mode
+        :return: yields a record with extracted interactors for each line
+        """
+        set_id = DisGeNETParser.profiled('set_id', DisGeNETParser.set_id)
+        extract_interactor = DisGeNETParser.profiled('extract_interactor', DisGeNETParser.extract_interactor)
 
-        for (i, line) in enumerate(f):
-            # If the line returned is byptes instead
-            # of a a string then it needs to be decoded
-            if isinstance(line, (bytes, bytearray)):
-                line = line.decode("utf-8")
-            line = line.strip('\n')
+        reader = LineReader(f)
+        header = reader.readline()
+        if header is None:
+            return
 
-            # The following commented line contains the column headers
-            if i == 0:
-                line = line.replace("# ", '')  # Delete the comment prefix
-                header_dict = dict(enumerate(line.split('\t')))
+        # The following commented line contains the column headers
+        header = header.replace("# ", '')  # Delete the comment prefix
+        schema = DisGeNETParser.get_schema(header.split('\t'))
+        build = DisGeNETParser.profiled('build', schema.build)
 
-            # subsequent lines contain row data
-            elif i >= 1:
-                _r = {}
-                for (pos, val) in enumerate(line.split('\t')):
-                    _r[header_dict[pos]] = val
-                id, r = DisGeNETParser.parse_tsv_line(i, _r)
+        # subsequent lines contain row data
+        for batch in reader.batches():
+            for cols in batch:
+                id, r = set_id(build(cols))
 
                 # Add the id and record to the result list
                 if not '_id' in r:
                     print(r)
                     raise ValueError
-                result.append(r)
-
-        result = DisGeNETParser.extract_interactors(result, 'disgenet')
-        result = DisGeNETParser.collapse_duplicate_keys(result, 'disgenet')
-
-        # return the results
-        for r in result:
-            yield r
+                yield extract_interactor(r, 'disgenet')
 
     @staticmethod
     def parse_tsv_line(line_num, line_dict):
@@ -4,19 +4,23 @@ import gzip
 import biothings, config
 biothings.config_for_app(config)
 
-import biothings.hub.dataload.uploader as uploader
+from hub.dataload.BiointeractUploader import BiointeractUploader
 from .parser import DisGeNETParser
 
 
-class DisGeNETUploader(uploader.BaseSourceUploader):
+class DisGeNETUploader(BiointeractUploader):
 
     # main_source = "ConsensusPathDB"
     name = "disgenet"
     collection_name = "disgenet"
     zip_file_name = "curated_gene_disease_associations.tsv.gz"
     # __metadata__ = {"mapper": 'consensuspathdb_mapper'}
+    # the external sort of the parser returns the documents in '_id' order
+    sorted_by_id = True
 
     def load_data(self, data_folder):
         downloaded_file = os.path.join(data_folder, self.zip_file_name)
         self.logger.info("Load data from file '%s'" % downloaded_file)
-        return DisGeNETParser.parse_tsv_file(gzip.open(downloaded_file, mode='rt'))
+        return self.instrument(DisGeNETParser.parse_tsv_file(gzip.open(downloaded_file, mode='rt'),
+                                                             max_records=self.sort_buffer_size(),
+                                                             tmp_dir=getattr(config, 'SORT_TMP_DIR', None)))
@@ -13,14 +13,16 @@ Author:  Greg Taylor:  greg.k.taylor@gmail.com
 import re
 import operator
 
+from hub.dataload.AsyncIdentifierResolver import AsyncIdentifierResolver
 from hub.dataload.BiointeractParser import BiointeractParser
-import biothings_client
+from hub.dataload.LineReader import LineReader
 
 
 class HiNTParser(BiointeractParser):
     # Static Constants
     EMPTY_FIELD = '-'
     SEPARATOR = '|'
+    MERGE_INTERACTORS = True
 
     rename_map = {
     }
@@ -46,42 +48,119 @@ class HiNTParser(BiointeractParser):
     }
 
     @staticmethod
-    def parse_tsv_file(f):
+    def get_schema(header):
         """
-        Parse a tab-separated hint file opened in binary mode.
-        :param f: file opened for reading in binary mode
+        Compile the record schema for a HiNT file.  The evidence column is
+        converted with parse_evidence_list and stored as 'evidence'.
+        :param header: list of column names from the header line
+        :return: a RecordSchema
+        """
+        rename_map = dict(HiNTParser.rename_map)
+        rename_map['pmid:method:quality'] = 'evidence'
+        return HiNTParser.compile_schema(
+            header,
+            empty_field=HiNTParser.EMPTY_FIELD,
+            rename_map=rename_map,
+            int_fields=HiNTParser.int_fields,
+            converters={'evidence': HiNTParser.parse_evidence_list},
+            groups=[
+                ('interactor_a', HiNTParser.interactor_A_fields),
+                ('interactor_b', HiNTParser.interactor_B_fields)
+            ])
+
+    @staticmethod
+    def parse_tsv_file(f, max_records=None, tmp_dir=None, id_cache=None, offline=False, resolver=None):
+        """
+        Parse a tab-separated hint file opened in binary mode.  The file is read
+        twice: the first pass submits the uniprot identifiers to translate to an
+        AsyncIdentifierResolver as they are found, the second pass parses the
+        records, waiting only for the batch holding their identifiers, and groups
+        them by id with an external sort, so at most 'max_records' parsed records
+        are held in memory.
+        :param f: seekable file opened for reading in binary mode
+        :param max_records: in-memory record budget for the duplicate collapse
+        :param tmp_dir: directory used to spill sorted runs
+        :param id_cache: optional IdentifierCache of uniprot to entrezgene mappings
+        :param offline: only use the id_cache, do not query MyGene.info
+        :param resolver: optional AsyncIdentifierResolver, overrides id_cache and offline
         :return: yields a generator of parsed objects
         """
+        if not resolver:
+            resolver = AsyncIdentifierResolver(id_cache=id_cache, offline=offline)
+        try:
+            submit = HiNTParser.profiled('resolve_submit', resolver.submit)
+            for uniprots in HiNTParser.read_line_uniprots(f):
+                submit(uniprots)
+            resolver.flush()
 
-        result = []
+            f.seek(0)
+            records = HiNTParser.replace_uniprot_entrez(HiNTParser.parse_tsv_records(f), resolver)
 
-        for (i, line) in enumerate(f):
-            # If the line returned is byptes instead
-            # of a a string then it needs to be decoded
-            if isinstance(line, (bytes, bytearray)):
-                line = line.decode("utf-8")
-            line = line.strip('\n')
+            # Finally, return the result
+            for r in HiNTParser.collapse_duplicate_keys_external(records, 'hint', max_records, tmp_dir,
+                                                                 dedup=HiNTParser.DEDUP_EVIDENCE,
+                                                                 merge_interactors=HiNTParser.MERGE_INTERACTORS):
+                yield r
+        finally:
+            resolver.close()
 
-            # The first commented line contains the column headers
-            if i == 0:
-                line = line.replace("#", '')  # Delete the comment prefix
-                header_dict = dict(enumerate(line.split('\t')))
+    @staticmethod
+    def read_lines(f):
+        """
+        Read the lines of a hint file, returning the header and row columns.
+        :param f: file opened for reading in binary mode
+        :return: tuple of the header column list and an iterator of lists of
+                 row column lists
+        """
+        reader = LineReader(f)
+        # The first commented line contains the column headers
+        header = (reader.readline() or '').replace("#", '')  # Delete the comment prefix
+        return header.split('\t'), reader.batches()
 
-            # All subsequent lines contain row data
-            elif i > 0:
-                _r = {}
-                for (pos, val) in enumerate(line.split('\t')):
-                    _r[header_dict[pos]] = val
-                id, r = HiNTParser.parse_tsv_line(i, _r)
-                result.append(r)
+    @staticmethod
+    def read_uniprots(f):
+        """
+        Collect the uniprot identifiers of both interactors without parsing
+        the complete records.
+        :param f: file opened for reading in binary mode
+        :return: set of uniprot identifiers
+        """
+        uniprots = set()
+        for line_uniprots in HiNTParser.read_line_uniprots(f):
+            uniprots.update(line_uniprots)
+        return uniprots
+
+    @staticmethod
+    def read_line_uniprots(f):
+        """
+        Read the uniprot identifiers of both interactors line by line.
+        :param f: file opened for reading in binary mode
+        :return: yields a list of uniprot identifiers for each row
+        """
+        (header, batches) = HiNTParser.read_lines(f)
+        schema = HiNTParser.get_schema(header)
+        positions = [pos for (pos, (group_name, key, convert)) in enumerate(schema.columns)
+                     if key == 'uniprot']
+        for batch in batches:
+            for cols in batch:
+                yield [cols[pos] for pos in positions
+                       if pos < len(cols) and cols[pos] != HiNTParser.EMPTY_FIELD]
 
-        result = HiNTParser.extract_interactors(result, 'hint')
-        result = HiNTParser.replace_uniprot_entrez(result)
-        result = HiNTParser.collapse_duplicate_keys(result, 'hint')
+    @staticmethod
+    def parse_tsv_records(f):
+        """
+        Parse a tab-separated hint file line by line, without translating
+        identifiers or collapsing duplicate keys.
+        :param f: file opened for reading in binary mode
+        :return: yields a record with extracted interactors for each line
+        """
+        extract_interactor = HiNTParser.profiled('extract_interactor', HiNTParser.extract_interactor)
 
-        # Finally, return the result
-        for r in result:
-            yield r
+        (header, batches) = HiNTParser.read_lines(f)
+        build = HiNTParser.profiled('build', HiNTParser.get_schema(header).build)
+        for batch in batches:
+            for cols in batch:
+                yield extract_interactor(build(cols), 'hint')
 
     @staticmethod
     def parse_tsv_line(line_num, line_dict):
@@ -103,9 +182,14 @@ class HiNTParser(BiointeractParser):
         return None, r
 
     @staticmethod
-    def parse_evidence(r):
+    def parse_evidence_list(entry):
+        """
+        Parse a 'pmid:method:quality' entry into a list of evidence records.
+        :param entry: the evidence entry string from the tsv file
+        :return: list of evidence dictionaries
+        """
         evidence = []
-        for e in r['pmid:method:quality'].split(HiNTParser.SEPARATOR):
+        for e in entry.split(HiNTParser.SEPARATOR):
             pubmed = e.split(':')
             evidence_record = {
                 'pmid': HiNTParser.safe_int(pubmed[0]),
@@ -113,7 +197,11 @@ class HiNTParser(BiointeractParser):
                 'quality': pubmed[2]
             }
             evidence.append(evidence_record)
-        r['evidence'] = evidence
+        return evidence
+
+    @staticmethod
+    def parse_evidence(r):
+        r['evidence'] = HiNTParser.parse_evidence_list(r['pmid:method:quality'])
         r.pop('pmid:method:quality')
         return r
 
@@ -126,9 +214,9 @@ class HiNTParser(BiointeractParser):
         :return:
         """
         curie_a = 'entrezgene'
-        id_a = r['interactor_a']['entrezgene']
+        id_a = HiNTParser.safe_int(r['interactor_a']['entrezgene'])
         curie_b = 'entrezgene'
-        id_b = r['interactor_b']['entrezgene']
+        id_b = HiNTParser.safe_int(r['interactor_b']['entrezgene'])
 
         r['interactor_a']['entrezgene'] = id_a
         r['interactor_b']['entrezgene'] = id_b
@@ -145,45 +233,42 @@ class HiNTParser(BiointeractParser):
         return id, r
 
     @staticmethod
-    def build_entrezgenes(result_list):
+    def build_entrezgenes(uniprots, id_cache=None, offline=False):
         """
-        Build a dictionary of entrezgenes for each uniprot
-        :param uniprots:
+        Build a dictionary of entrezgenes for each uniprot.  When an identifier
+        cache is given, only the uniprots missing from it are sent to MyGene.info
+        and the results, including uniprots without an entrezgene, are stored back.
+        :param uniprots: iterable of uniprot identifiers
+        :param id_cache: optional IdentifierCache of uniprot to entrezgene mappings
+        :param offline: only use the id_cache, do not query MyGene.info
         :return:
         """
-        # Build the set of Uniprot entries to query
-        uniprots = set()
-        for r in result_list:
-            uniprots.add(r['interactor_a']['uniprot'])
-            uniprots.add(r['interactor_b']['uniprot'])
-
-        # Query MyGene.info
-        mg = biothings_client.get_client('gene')
-        qr = mg.querymany(list(uniprots), scopes='uniprot', species='human', as_generator=True)
-
-        # Build the Entrezgene dictionary to return
-        entrezgenes = {}
-        for q in qr:
-            if 'query' in q and 'entrezgene' in q:
-                entrezgenes[q['query']] = q['entrezgene']
-        return entrezgenes
+        resolver = AsyncIdentifierResolver(id_cache=id_cache, offline=offline)
+        try:
+            resolver.submit(uniprots)
+            return resolver.resolve_all()
+        finally:
+            resolver.close()
 
     @staticmethod
-    def replace_uniprot_entrez(result_list):
+    def replace_uniprot_entrez(records, entrezgenes):
         """
-        Analyze the result set for uniprot ids that will be translated to
-        entrezgene ids.
-        :param result_list:
-        :return:
+        Translate the uniprot ids of each record to entrezgene ids.  Records
+        for which either id can not be translated are dropped.
+        :param records: iterable of records with extracted interactors
+        :param entrezgenes: uniprot to entrezgene dictionary or AsyncIdentifierResolver
+        :return: yields records with their id set
         """
-        entrezgenes = HiNTParser.build_entrezgenes(result_list)
-        pruned_result = []
-        for r in result_list:
+        resolve = HiNTParser.profiled('resolve', entrezgenes.get)
+        set_id = HiNTParser.profiled('set_id', HiNTParser.set_id)
+
+        for r in records:
             # Entrezgene entries must be available for both interactor_a and interactor_b
-            if r['interactor_a']['uniprot'] in entrezgenes:
-                if r['interactor_b']['uniprot'] in entrezgenes:
-                    r['interactor_a']['entrezgene'] = entrezgenes[r['interactor_a']['uniprot']]
-                    r['interactor_b']['entrezgene'] = entrezgenes[r['interactor_b']['uniprot']]
-                    id, r = HiNTParser.set_id(r)
-                    pruned_result.append(r)
-        return pruned_result
+            entrezgene_a = resolve(r['interactor_a']['uniprot'])
+            if entrezgene_a is not None:
+                entrezgene_b = resolve(r['interactor_b']['uniprot'])
+                if entrezgene_b is not None:
+                    r['interactor_a']['entrezgene'] = entrezgene_a
+                    r['interactor_b']['entrezgene'] = entrezgene_b
+                    id, r = set_id(r)
+                    yield r
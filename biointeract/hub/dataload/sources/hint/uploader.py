@@ -4,18 +4,49 @@ from zipfile import ZipFile
 import biothings, config
 biothings.config_for_app(config)
 
-import biothings.hub.dataload.uploader as uploader
+from config import DATA_ARCHIVE_ROOT
+from hub.dataload.AsyncIdentifierResolver import AsyncIdentifierResolver
+from hub.dataload.IdentifierCache import IdentifierCache
+from hub.dataload.BiointeractUploader import BiointeractUploader
 from .parser import HiNTParser
 
 
-class HiNTUploader(uploader.BaseSourceUploader):
+class HiNTUploader(BiointeractUploader):
 
     name = "hint"
     collection_name = "hint"
     # tab_file = "HomoSapiens_htb_hq.txt"
     tab_file = "hq"
     # __metadata__ = {"mapper": 'hint_mapper'}
+    # the external sort of the parser returns the documents in '_id' order
+    sorted_by_id = True
+
+    # uniprot to entrezgene identifier cache, kept across releases
+    id_cache_file = "uniprot_entrezgene.sqlite"
 
     def load_data(self, data_folder):
         file = os.path.join(data_folder, self.tab_file)
-        return HiNTParser.parse_tsv_file(open(file, 'r'))
+
+        # The identifier cache can be seeded from a bulk mapping file (e.g. the UniProt
+        # idmapping file) and used without remote queries by setting HINT_ID_OFFLINE
+        id_cache = IdentifierCache(getattr(config, 'HINT_ID_CACHE',
+                                           os.path.join(DATA_ARCHIVE_ROOT, self.name, self.id_cache_file)),
+                                   'uniprot:entrezgene')
+        mapping_file = getattr(config, 'HINT_ID_MAPPING_FILE', None)
+        if mapping_file:
+            self.logger.info("Load uniprot to entrezgene mappings from file '%s'" % mapping_file)
+            id_cache.load_mapping_file(mapping_file, id_type='GeneID')
+
+        # Cache misses are resolved in concurrent batches against a MyGene.info
+        # compatible querymany endpoint while the file is parsed
+        resolver = AsyncIdentifierResolver(url=getattr(config, 'HINT_ID_RESOLVER_URL', None),
+                                           batch_size=getattr(config, 'HINT_ID_RESOLVER_BATCH_SIZE', None),
+                                           max_in_flight=getattr(config, 'HINT_ID_RESOLVER_MAX_IN_FLIGHT', None),
+                                           retries=getattr(config, 'HINT_ID_RESOLVER_RETRIES', None),
+                                           id_cache=id_cache,
+                                           offline=getattr(config, 'HINT_ID_OFFLINE', False))
+
+        return self.instrument(HiNTParser.parse_tsv_file(open(file, 'r'),
+                                                         max_records=self.sort_buffer_size(),
+                                                         tmp_dir=getattr(config, 'SORT_TMP_DIR', None),
+                                                         resolver=resolver))
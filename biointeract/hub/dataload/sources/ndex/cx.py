@@ -0,0 +1,149 @@
+"""
+CXReader incrementally reads an nDEX CX document.
+
+A CX document is a JSON array of aspect fragments, each of them an
+object mapping an aspect name ('nodes', 'edges', 'nodeAttributes', ...)
+to a list of aspect elements.  The reader walks this structure from a
+file in fixed-size blocks and decodes one aspect element at a time, so
+the document is never loaded into memory as a whole.
+
+For a description of the CX format see the following link:
+
+http://www.home.ndexbio.org/data-model/
+
+Source Project:   biothings.interactions
+"""
+import codecs
+import json
+
+
+class CXReader(object):
+
+    # Number of characters read from the file at a time
+    BUFFER_SIZE = 64 * 1024
+    WHITESPACE = ' \t\n\r'
+
+    def __init__(self, f, buffer_size=None):
+        """
+        Create a reader for a CX file.
+        :param f: file opened for reading in text or binary mode
+        :param buffer_size: number of characters read from the file at a time
+        """
+        self.f = f
+        self.buffer_size = buffer_size or CXReader.BUFFER_SIZE
+        self.decoder = json.JSONDecoder()
+        self.utf8 = codecs.getincrementaldecoder('utf-8')()
+        self.buf = ''
+        self.pos = 0
+        self.eof = False
+
+    def _fill(self):
+        """
+        Append the next block of the file to the buffer, dropping the consumed part.
+        :return: False if the end of the file was reached
+        """
+        while True:
+            raw = self.f.read(self.buffer_size)
+            data = raw
+            if isinstance(raw, (bytes, bytearray)):
+                data = self.utf8.decode(raw, final=not raw)
+            # a block may end in the middle of a multi-byte character
+            if data or not raw:
+                break
+        if not data:
+            self.eof = True
+            return False
+        self.buf = self.buf[self.pos:] + data
+        self.pos = 0
+        return True
+
+    def _peek(self):
+        """
+        Skip whitespace and return the next character without consuming it.
+        :return: the next character or '' at the end of the file
+        """
+        while True:
+            while self.pos < len(self.buf) and self.buf[self.pos] in CXReader.WHITESPACE:
+                self.pos += 1
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if not self._fill():
+                return ''
+
+    def _expect(self, c):
+        """
+        Consume the next non-whitespace character, which must be 'c'.
+        :param c: the expected character
+        :return:
+        """
+        if self._peek() != c:
+            raise ValueError("Malformed CX document: expected '%s' at position %d" % (c, self.pos))
+        self.pos += 1
+
+    def _value(self):
+        """
+        Decode the next JSON value, reading more of the file as needed.
+        :return: the decoded value
+        """
+        self._peek()
+        while True:
+            try:
+                obj, end = self.decoder.raw_decode(self.buf, self.pos)
+                # a number at the end of the buffer may continue in the next block
+                if end < len(self.buf) or self.eof or not self._fill():
+                    self.pos = end
+                    return obj
+            except json.JSONDecodeError:
+                if self.eof or not self._fill():
+                    raise
+
+    def _elements(self):
+        """
+        Decode the elements of a JSON array one at a time.
+        :return: yields the array elements
+        """
+        self._expect('[')
+        while True:
+            c = self._peek()
+            if c == ']':
+                self.pos += 1
+                return
+            elif c == ',':
+                self.pos += 1
+            else:
+                yield self._value()
+
+    def aspects(self):
+        """
+        Walk the aspect fragments of the CX document.  Each aspect is returned
+        with a generator over its elements, which must be consumed before the
+        next aspect is read; elements that were not read are skipped.
+        :return: yields (aspect name, element generator) tuples
+        """
+        self._expect('[')
+        while True:
+            c = self._peek()
+            if c == ']' or c == '':
+                return
+            elif c == ',':
+                self.pos += 1
+                continue
+
+            self._expect('{')
+            while True:
+                c = self._peek()
+                if c == '}':
+                    self.pos += 1
+                    break
+                elif c == ',':
+                    self.pos += 1
+                    continue
+                name = self._value()
+                self._expect(':')
+                if self._peek() == '[':
+                    elements = self._elements()
+                else:
+                    elements = iter([self._value()])
+                yield name, elements
+                for _ in elements:
+                    pass
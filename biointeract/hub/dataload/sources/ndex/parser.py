@@ -5,70 +5,73 @@ a generated dictionary of record values.
 Source Project:   biothings.interactions
 Author:  Greg Taylor:  greg.k.taylor@gmail.com
 """
-import json
 import re
 import operator
 
 from hub.dataload.BiointeractParser import BiointeractParser
+from .cx import CXReader
 
 
 class nDEXParser(BiointeractParser):
 
-    # nDEX Index Constants
-    NODES = 5
-    EDGES = 6
-    NODEATTRIBUTES = 8
-    EDGEATTRIBUTES = 9
+    # nDEX Aspect Names
+    NODES = 'nodes'
+    EDGES = 'edges'
+    NODEATTRIBUTES = 'nodeAttributes'
+    EDGEATTRIBUTES = 'edgeAttributes'
 
     @staticmethod
     def parse_ndex_file(f):
         """
-        Parse an nDEX CX file opened in binary mode.
-        :param f: file opened for reading in binary mode
+        Parse an nDEX CX file opened in binary mode.  The file is streamed twice:
+        the first pass indexes the nodes and node attributes, the second pass
+        reads the edges and yields an interaction for each of them.  Aspects
+        are found by name, so their order in the file does not matter.
+        :param f: seekable file opened for reading in binary mode
         :return: yields a generator of parsed objects
         """
-
-        cache = {}
-
-        j = json.loads(f.read())
-
         # read nodes and nodeAttributes
-        n = nDEXParser.read_nodes(j)
-        na = nDEXParser.read_node_attributes(j)
+        n = {}
+        na = {}
+        for (name, elements) in CXReader(f).aspects():
+            if name == nDEXParser.NODES:
+                nDEXParser.read_nodes(elements, n)
+            elif name == nDEXParser.NODEATTRIBUTES:
+                nDEXParser.read_node_attributes(elements, na)
 
         # assemble the information
-        edge_types = set()
-        complex_count = 0
-        interactions = []
-        for i in range(len(j[nDEXParser.EDGES]['edges'])):
-            edge_types.add(j[nDEXParser.EDGES]['edges'][i]['i'])
-            if j[nDEXParser.EDGES]['edges'][i]['i'] == 'in-complex-with':
-                complex_count = complex_count + 1
-                try:
-                    interaction = {
-                        'interactor_a': {
-                            'ndex': n[j[nDEXParser.EDGES]['edges'][i]['s']]['@id']
-                        },
-                        'interactor_b': {
-                            'ndex': n[j[nDEXParser.EDGES]['edges'][i]['t']]['@id']
-                        },
-                        'ndex': {
-                            'cx_edge_id': j[nDEXParser.EDGES]['edges'][i]['@id'],
-                            'edge': j[nDEXParser.EDGES]['edges'][i],
-                            's': n[j[nDEXParser.EDGES]['edges'][i]['s']],
-                            'sa': na[j[nDEXParser.EDGES]['edges'][i]['s']],
-                            't': n[j[nDEXParser.EDGES]['edges'][i]['t']],
-                            'ta': na[j[nDEXParser.EDGES]['edges'][i]['t']],
+        set_id = nDEXParser.profiled('set_id', nDEXParser.set_id)
+        f.seek(0)
+        for (name, elements) in CXReader(f).aspects():
+            if name != nDEXParser.EDGES:
+                continue
+            for edge in nDEXParser.profiled_iter('decode', elements):
+                if edge['i'] == 'in-complex-with':
+                    try:
+                        interaction = {
+                            'interactor_a': {
+                                'ndex': n[edge['s']]['@id']
+                            },
+                            'interactor_b': {
+                                'ndex': n[edge['t']]['@id']
+                            },
+                            'ndex': {
+                                'cx_edge_id': edge['@id'],
+                                'edge': edge,
+                                's': n[edge['s']],
+                                'sa': na[edge['s']],
+                                't': n[edge['t']],
+                                'ta': na[edge['t']],
+                            }
                         }
-                    }
 
-                    id, interaction = nDEXParser.set_id(interaction)
-                    interaction['_id'] = id
+                        id, interaction = set_id(interaction)
+                        interaction['_id'] = id
 
-                    yield interaction
+                        yield interaction
 
-                except KeyError:
-                    pass
+                    except KeyError:
+                        pass
 
     @staticmethod
     def set_id(r):
@@ -90,28 +93,33 @@ class nDEXParser(BiointeractParser):
 
         return id, r
 
-    def read_nodes(j):
+    @staticmethod
+    def read_nodes(nodes, n=None):
         """
-        read Nodes from the nDEX CS file
-        :return:
+        read Nodes from the nDEX CX file
+        :param nodes: iterable of node aspect elements
+        :param n: dictionary of nodes by id to add to
+        :return: dictionary of nodes by id
         """
-        n = {}
-        for i in range(len(j[nDEXParser.NODES]['nodes'])):
-            n[j[nDEXParser.NODES]['nodes'][i]['@id']] = j[nDEXParser.NODES]['nodes'][i]
+        n = {} if n is None else n
+        for node in nodes:
+            n[node['@id']] = node
         return n
 
-    def read_node_attributes(j):
+    @staticmethod
+    def read_node_attributes(attributes, a=None):
         """
-        read Node Attributes from the nDEX CS file
-        :return:
+        read Node Attributes from the nDEX CX file
+        :param attributes: iterable of nodeAttributes aspect elements
+        :param a: dictionary of attribute lists by node id to add to
+        :return: dictionary of attribute lists by node id
         """
-        a = {}
-        for i in range(len(j[nDEXParser.NODEATTRIBUTES]['nodeAttributes'])):
-            attr = j[nDEXParser.NODEATTRIBUTES]['nodeAttributes'][i]
-            key = j[nDEXParser.NODEATTRIBUTES]['nodeAttributes'][i]['po']
+        a = {} if a is None else a
+        for attr in attributes:
+            key = attr['po']
 
             if attr and key:
-                if key in a.keys():
+                if key in a:
                     a[key].append(attr)
                 else:
                     a[key] = [attr]
@@ -4,11 +4,11 @@ import gzip
 import biothings, config
 biothings.config_for_app(config)
 
-import biothings.hub.dataload.uploader as uploader
+from hub.dataload.BiointeractUploader import BiointeractUploader
 from .parser import nDEXParser
 
 
-class nDEXUploader(uploader.BaseSourceUploader):
+class nDEXUploader(BiointeractUploader):
 
     # main_source = "ConsensusPathDB"
     name = "ndex"
@@ -19,4 +19,4 @@ class nDEXUploader(uploader.BaseSourceUploader):
     def load_data(self, data_folder):
         downloaded_file = os.path.join(data_folder, self.file_name)
         self.logger.info("Load data from file '%s'" % downloaded_file)
-        return nDEXParser.parse_ndex_file(open(downloaded_file, mode='rt'))
+        return self.instrument(nDEXParser.parse_ndex_file(open(downloaded_file, mode='rt')))
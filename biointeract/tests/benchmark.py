@@ -0,0 +1,154 @@
+# -*- coding: utf-8 -*-
+"""
+Parser benchmark on synthetic source files.
+
+For each source a synthetic file is generated (see SyntheticData) and
+parsed in a spawned child process, reporting the parse time, rows and
+documents per second, the peak resident memory of the child and its
+growth during the parse.  HiNT identifiers
+are resolved offline from an identifier cache seeded with the synthetic
+UniProt mapping.  Run from the biointeract directory, e.g.:
+
+    python -m tests.benchmark --rows 1000000 --sources biogrid,hint --profile
+
+Source Project:   biothings.interactions
+"""
+import argparse
+import multiprocessing
+import os
+import resource
+import shutil
+import sys
+import tempfile
+import time
+
+from hub.dataload.AsyncIdentifierResolver import AsyncIdentifierResolver
+from hub.dataload.BiointeractParser import BiointeractParser
+from hub.dataload.IdentifierCache import IdentifierCache
+from hub.dataload.ParseProfiler import ParseProfiler
+from hub.dataload.sources.biogrid.parser import BiogridParser
+from hub.dataload.sources.ConsensusPathDB.parser import CPDParser
+from hub.dataload.sources.ctdchemgene.parser import CTDChemGeneParser
+from hub.dataload.sources.disgenet.parser import DisGeNETParser
+from hub.dataload.sources.hint.parser import HiNTParser
+from hub.dataload.sources.ndex.parser import nDEXParser
+from .synthetic import SyntheticData
+
+SOURCES = ['biogrid', 'hint', 'ctd', 'disgenet', 'cpd', 'ndex']
+
+
+def parse_source(source, path, work_dir, max_records=None):
+    """
+    Return the document generator of the parser of a source.
+    :param source: the source name
+    :param path: path of the synthetic file
+    :param work_dir: directory for spilled runs and the identifier cache
+    :param max_records: in-memory record budget of the external sort
+    :return:
+    """
+    if source == 'biogrid':
+        return BiogridParser.parse_biogrid_tsv_file(open(path, 'rb'), max_records=max_records, tmp_dir=work_dir)
+    elif source == 'hint':
+        id_cache = IdentifierCache(os.path.join(work_dir, 'hint_ids.sqlite'), 'uniprot:entrezgene')
+        resolver = AsyncIdentifierResolver(id_cache=id_cache, offline=True)
+        return HiNTParser.parse_tsv_file(open(path, 'rb'), max_records=max_records, tmp_dir=work_dir,
+                                         resolver=resolver)
+    elif source == 'ctd':
+        return CTDChemGeneParser.parse_tsv_file(open(path, 'r'))
+    elif source == 'disgenet':
+        return DisGeNETParser.parse_tsv_file(open(path, 'rb'), max_records=max_records, tmp_dir=work_dir)
+    elif source == 'cpd':
+        return CPDParser.parse_cpd_tsv_file(open(path, 'r'))
+    elif source == 'ndex':
+        return nDEXParser.parse_ndex_file(open(path, 'rb'))
+    raise ValueError("Unknown source '%s'" % source)
+
+
+def run_parser(source, path, work_dir, max_records, profile, results):
+    """
+    Parse a file and put the measurements on the results queue.  Runs in a
+    spawned child process, which does not share the pages of the benchmark
+    process, so that the peak memory is that of a single parse.
+    """
+    rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    profiler = BiointeractParser.enable_profiling() if profile else None
+    t0 = time.time()
+    docs = 0
+    for _ in parse_source(source, path, work_dir, max_records):
+        docs += 1
+    seconds = time.time() - t0
+    # ru_maxrss is in kilobytes on Linux
+    rss_peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    results.put({
+        'docs': docs,
+        'seconds': seconds,
+        'peak_mb': rss_peak / 1024.0,
+        'start_mb': rss_before / 1024.0,
+        'parse_mb': (rss_peak - rss_before) / 1024.0,
+        'profile': profiler.report() if profiler else None
+    })
+
+
+def benchmark(sources, rows, duplicate_rate=0.1, hub_skew=1.0, genes=None, seed=0, max_records=None,
+              tmp_dir=None, profile=False, out=sys.stdout):
+    """
+    Generate and parse a synthetic file per source.
+    :return: list of result dictionaries
+    """
+    context = multiprocessing.get_context('spawn')
+    data = SyntheticData(rows, duplicate_rate=duplicate_rate, hub_skew=hub_skew, genes=genes, seed=seed)
+    work_dir = tempfile.mkdtemp(dir=tmp_dir)
+    results = []
+    try:
+        for source in sources:
+            path = os.path.join(work_dir, source + '.txt')
+            with open(path, 'w') as f:
+                data.write_source(source, f)
+            if source == 'hint':
+                mapping = os.path.join(work_dir, 'idmapping.dat')
+                with open(mapping, 'w') as f:
+                    SyntheticData.write(f, data.uniprot_mapping_lines())
+                id_cache = IdentifierCache(os.path.join(work_dir, 'hint_ids.sqlite'), 'uniprot:entrezgene')
+                id_cache.load_mapping_file(mapping, id_type='GeneID')
+                id_cache.close()
+
+            queue = context.Queue()
+            p = context.Process(target=run_parser, args=(source, path, work_dir, max_records, profile, queue))
+            p.start()
+            r = queue.get()
+            p.join()
+            r.update({'source': source, 'rows': rows, 'file_mb': os.path.getsize(path) / 1024.0 / 1024.0})
+            results.append(r)
+
+            out.write('%-10s %10d rows %10d docs %8.2f s %12.0f rows/s %9.1f MB peak %9.1f MB parse '
+                      '(%.1f MB file)\n' % (source, rows, r['docs'], r['seconds'], rows / r['seconds'],
+                                             r['peak_mb'], r['parse_mb'], r['file_mb']))
+            if r['profile']:
+                out.write(ParseProfiler.format_report(r['profile']) + '\n\n')
+            out.flush()
+            os.remove(path)
+    finally:
+        shutil.rmtree(work_dir)
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark the source parsers on synthetic data.')
+    parser.add_argument('--rows', type=int, default=100000, help='number of rows per source file')
+    parser.add_argument('--sources', default=','.join(SOURCES), help='comma-separated sources to benchmark')
+    parser.add_argument('--duplicate-rate', type=float, default=0.1, help='fraction of duplicate pairs')
+    parser.add_argument('--hub-skew', type=float, default=1.0, help='Zipf exponent of the gene popularity')
+    parser.add_argument('--genes', type=int, default=None, help='number of distinct genes')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--max-records', type=int, default=None, help='in-memory record budget of the sort')
+    parser.add_argument('--tmp-dir', default=None, help='directory for the generated files')
+    parser.add_argument('--profile', action='store_true', help='report the parse stages')
+    args = parser.parse_args(argv)
+
+    benchmark(args.sources.split(','), args.rows, duplicate_rate=args.duplicate_rate, hub_skew=args.hub_skew,
+              genes=args.genes, seed=args.seed, max_records=args.max_records, tmp_dir=args.tmp_dir,
+              profile=args.profile)
+
+
+if __name__ == '__main__':
+    main()
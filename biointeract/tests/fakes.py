@@ -0,0 +1,74 @@
+# -*- coding: utf-8 -*-
+"""
+In-process stand-ins for the mongo collections and Elasticsearch indices
+used by the tests.
+
+Source Project:   biothings.interactions
+"""
+import threading
+import time
+
+
+class StandInCollection(object):
+    """
+    Collection over a list of documents, answering '_id' queries and recording
+    the inserts and the number of concurrent inserts.
+    """
+
+    def __init__(self, docs=None, delay=0, fail_on=None):
+        """
+        Create a collection.
+        :param docs: the documents of the collection
+        :param delay: seconds an insert takes
+        :param fail_on: '_id' of a document whose insert fails
+        """
+        self.docs = list(docs or [])
+        self.delay = delay
+        self.fail_on = fail_on
+        self.queries = 0
+        self.inserts = 0
+        self.running = 0
+        self.max_running = 0
+        self.lock = threading.Lock()
+
+    def find(self, query=None, projection=None):
+        self.queries += 1
+        ids = (query or {}).get('_id', {}).get('$in')
+        docs = [d for d in self.docs if ids is None or d['_id'] in ids]
+        if projection:
+            docs = [dict((k, v) for (k, v) in d.items() if k == '_id' or projection.get(k)) for d in docs]
+        return docs
+
+    def insert_many(self, docs, ordered=True):
+        with self.lock:
+            self.running += 1
+            self.max_running = max(self.max_running, self.running)
+        try:
+            time.sleep(self.delay)
+            if self.fail_on is not None and any(d['_id'] == self.fail_on for d in docs):
+                raise ValueError("insert failed")
+            with self.lock:
+                self.docs.extend(docs)
+                self.inserts += 1
+        finally:
+            with self.lock:
+                self.running -= 1
+
+
+class StandInIndex(object):
+    """
+    Index answering search_after searches sorted on _id over a list of documents.
+    """
+
+    def __init__(self, ids):
+        self.ids = sorted(ids)
+        self.bodies = []
+
+    def search(self, body):
+        self.bodies.append(dict(body))
+        after = body.get('search_after', [''])[0]
+        ids = [i for i in self.ids if i > after][:body['size']]
+        res = {'hits': {'hits': [{'_id': i, '_source': {'biogrid': {}}, 'sort': [i]} for i in ids]}}
+        if 'pit' in body:
+            res['pit_id'] = 'pit-{}'.format(len(self.bodies))
+        return res
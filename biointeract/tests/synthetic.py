@@ -0,0 +1,238 @@
+# -*- coding: utf-8 -*-
+"""
+Synthetic source files for tests and benchmarks.
+
+SyntheticData generates interaction pairs between a fixed set of genes
+and writes them in the file formats of the BioGRID tab2, HiNT, CTD
+chem-gene, DisGeNET, ConsensusPathDB and nDEX CX sources.  Files are
+written line by line, so any number of rows can be generated.
+
+Gene popularity follows a Zipf distribution with exponent 'hub_skew'
+(0 for uniform), which makes a few hub genes take part in many pairs.
+A fraction 'duplicate_rate' of the rows repeats a recently generated
+pair, half of them with the interactors swapped, to exercise the
+duplicate key collapse.  The same seed always generates the same files.
+
+Source Project:   biothings.interactions
+"""
+import itertools
+import json
+import random
+
+
+class SyntheticData(object):
+
+    # Number of recent pairs duplicates are drawn from
+    RECENT_PAIRS = 10000
+    EXPERIMENTAL_SYSTEMS = [('Two-hybrid', 'physical'), ('Affinity Capture-MS', 'physical'),
+                            ('Synthetic Lethality', 'genetic'), ('Dosage Rescue', 'genetic')]
+    INTERACTION_ACTIONS = ['increases^expression', 'decreases^expression', 'affects^binding',
+                           'increases^phosphorylation']
+    SOURCE_DATABASES = ['Reactome', 'IntAct', 'MINT', 'HPRD', 'BIND']
+
+    def __init__(self, rows, duplicate_rate=0.1, hub_skew=1.0, genes=None, seed=0):
+        """
+        Configure the generated data.
+        :param rows: number of data rows per file
+        :param duplicate_rate: fraction of rows repeating a previous pair
+        :param hub_skew: Zipf exponent of the gene popularity, 0 for uniform
+        :param genes: number of distinct genes (and chemicals, diseases)
+        :param seed: random seed
+        """
+        self.rows = rows
+        self.duplicate_rate = duplicate_rate
+        self.hub_skew = hub_skew
+        self.genes = genes or max(100, rows // 5)
+        self.seed = seed
+
+    def pairs(self):
+        """
+        Generate the interaction pairs of the data rows.
+        :return: yields (row number, index a, index b) tuples, a and b are never equal
+        """
+        rnd = random.Random(self.seed)
+        cum_weights = list(itertools.accumulate(1.0 / (k + 1) ** self.hub_skew for k in range(self.genes)))
+        population = range(self.genes)
+        recent = []
+        i = 0
+        while i < self.rows:
+            # draw gene indices in blocks to amortize the weighted sampling
+            block = rnd.choices(population, cum_weights=cum_weights, k=2 * min(1024, self.rows - i))
+            for j in range(0, len(block), 2):
+                if recent and rnd.random() < self.duplicate_rate:
+                    (a, b) = recent[rnd.randrange(len(recent))]
+                    if rnd.random() < 0.5:
+                        (a, b) = (b, a)
+                else:
+                    (a, b) = (block[j], block[j + 1])
+                    if a == b:
+                        b = (b + 1) % self.genes
+                    if len(recent) < SyntheticData.RECENT_PAIRS:
+                        recent.append((a, b))
+                    else:
+                        recent[rnd.randrange(SyntheticData.RECENT_PAIRS)] = (a, b)
+                yield i, a, b
+                i += 1
+
+    @staticmethod
+    def entrezgene(k):
+        return 1000 + k
+
+    @staticmethod
+    def symbol(k):
+        return 'GENE{0}'.format(k)
+
+    @staticmethod
+    def uniprot(k):
+        return 'P{0:05d}'.format(k)
+
+    @staticmethod
+    def mesh(k):
+        return 'D{0:06d}'.format(k)
+
+    @staticmethod
+    def write(f, lines):
+        """
+        Write lines to a text file.
+        :param f: file opened for writing in text mode
+        :param lines: iterable of lines without line terminator
+        :return: number of lines written
+        """
+        count = 0
+        for line in lines:
+            f.write(line)
+            f.write('\n')
+            count += 1
+        return count
+
+    def biogrid_lines(self):
+        """
+        Lines of a BioGRID tab2 file.
+        :return: yields lines
+        """
+        yield '#' + '\t'.join([
+            'BioGRID Interaction ID', 'Entrez Gene Interactor A', 'Entrez Gene Interactor B',
+            'BioGRID ID Interactor A', 'BioGRID ID Interactor B', 'Systematic Name Interactor A',
+            'Systematic Name Interactor B', 'Official Symbol Interactor A', 'Official Symbol Interactor B',
+            'Synonyms Interactor A', 'Synonyms Interactor B', 'Experimental System', 'Experimental System Type',
+            'Author', 'Pubmed ID', 'Organism Interactor A', 'Organism Interactor B', 'Throughput', 'Score',
+            'Modification', 'Phenotypes', 'Qualifications', 'Tags', 'Source Database'])
+        for (i, a, b) in self.pairs():
+            (system, system_type) = SyntheticData.EXPERIMENTAL_SYSTEMS[i % len(SyntheticData.EXPERIMENTAL_SYSTEMS)]
+            yield '\t'.join([
+                str(i + 1), str(SyntheticData.entrezgene(a)), str(SyntheticData.entrezgene(b)),
+                str(100000 + a), str(100000 + b), '-', '-', SyntheticData.symbol(a), SyntheticData.symbol(b),
+                '{0}A|{0}B'.format(SyntheticData.symbol(a)), '-' if b % 3 else SyntheticData.symbol(b) + 'X',
+                system, system_type, 'Author{0} A (2017)'.format(i % 97), str(10000000 + i % 50000),
+                '9606', '9606', 'Low Throughput' if i % 4 else 'High Throughput',
+                '-' if i % 5 else '0.{0}'.format(i % 10), '-', '-', '-', '-', 'BIOGRID'])
+
+    def hint_lines(self):
+        """
+        Lines of a HiNT binary interaction file.  Uniprot ids map to entrezgenes
+        as given by uniprot_mapping_lines.
+        :return: yields lines
+        """
+        yield '\t'.join(['Uniprot_A', 'Uniprot_B', 'Gene_A', 'Gene_B', 'ORF_A', 'ORF_B', 'Alias_A', 'Alias_B',
+                         'pmid:method:quality'])
+        for (i, a, b) in self.pairs():
+            evidence = '|'.join('{0}:{1}:{2}'.format(10000000 + (i + e) % 50000, 18 + e, 'LC' if e else 'HT')
+                                for e in range(1 + i % 3))
+            yield '\t'.join([SyntheticData.uniprot(a), SyntheticData.uniprot(b), SyntheticData.symbol(a),
+                             SyntheticData.symbol(b), '-', '-', '{0}|ALIAS{1}'.format(SyntheticData.symbol(a), a),
+                             '-', evidence])
+
+    def uniprot_mapping_lines(self):
+        """
+        Lines of a UniProt idmapping file for the uniprot ids of hint_lines.
+        :return: yields lines
+        """
+        for k in range(self.genes):
+            yield '{0}\tGeneID\t{1}'.format(SyntheticData.uniprot(k), SyntheticData.entrezgene(k))
+            yield '{0}\tGene_Name\t{1}'.format(SyntheticData.uniprot(k), SyntheticData.symbol(k))
+
+    def ctd_lines(self):
+        """
+        Lines of a CTD chem-gene interactions file, pairs are (chemical, gene).
+        :return: yields lines
+        """
+        for k in range(27):
+            yield '# Comparative Toxicogenomics Database, synthetic header line {0}'.format(k)
+        yield '# ' + '\t'.join(['ChemicalName', 'ChemicalID', 'CasRN', 'GeneSymbol', 'GeneID', 'GeneForms',
+                                'Organism', 'OrganismID', 'Interaction', 'InteractionActions', 'PubMedIDs'])
+        yield '#'
+        for (i, a, b) in self.pairs():
+            action = SyntheticData.INTERACTION_ACTIONS[i % len(SyntheticData.INTERACTION_ACTIONS)]
+            yield '\t'.join(['Chemical {0}'.format(a), SyntheticData.mesh(a), '{0}-00-{1}'.format(a, a % 10),
+                             SyntheticData.symbol(b), str(SyntheticData.entrezgene(b)), 'protein|mRNA' if i % 2
+                             else 'protein', 'Homo sapiens', '9606',
+                             'Chemical {0} results in {1} of {2}'.format(a, action, SyntheticData.symbol(b)),
+                             action, '|'.join(str(10000000 + (i + p) % 50000) for p in range(1 + i % 2))])
+
+    def disgenet_lines(self):
+        """
+        Lines of a DisGeNET gene-disease associations file, pairs are (gene, disease).
+        :return: yields lines
+        """
+        yield '\t'.join(['geneId', 'geneSymbol', 'diseaseId', 'diseaseName', 'score', 'NofPmids', 'NofSnps',
+                         'source'])
+        for (i, a, b) in self.pairs():
+            yield '\t'.join([str(SyntheticData.entrezgene(a)), SyntheticData.symbol(a), 'C{0:07d}'.format(b),
+                             'Disease {0}'.format(b), '0.{0:03d}'.format(i % 1000), str(i % 20), str(i % 7),
+                             'CURATED'])
+
+    def cpd_lines(self):
+        """
+        Lines of a ConsensusPathDB human PPI file.
+        :return: yields lines
+        """
+        yield '# ConsensusPathDB synthetic human protein-protein interactions'
+        yield '#  ' + '\t'.join(['source_databases', 'interaction_publications', 'interaction_participants',
+                                 'interaction_confidence'])
+        for (i, a, b) in self.pairs():
+            databases = SyntheticData.SOURCE_DATABASES[:1 + i % len(SyntheticData.SOURCE_DATABASES)]
+            yield '\t'.join([','.join(databases), ','.join(str(10000000 + (i + p) % 50000) for p in range(1 + i % 3)),
+                             '{0}_HUMAN,{1}_HUMAN'.format(SyntheticData.symbol(a), SyntheticData.symbol(b)),
+                             'NA' if i % 6 == 0 else '0.{0:03d}'.format(i % 1000)])
+
+    def write_cx(self, f):
+        """
+        Write an nDEX CX document with one edge per row, three out of four are
+        'in-complex-with' edges.  Node ids start at 1, gene k is node k + 1.
+        :param f: file opened for writing in text mode
+        :return: number of edges written
+        """
+        f.write('[{"numberVerification": [{"longNumber": 281474976710655}]},\n{"nodes": [')
+        for k in range(self.genes):
+            f.write((',' if k else '') + json.dumps({'@id': k + 1, 'n': SyntheticData.symbol(k),
+                                                     'r': 'uniprot:' + SyntheticData.uniprot(k)}))
+        f.write(']},\n{"nodeAttributes": [')
+        for k in range(self.genes):
+            f.write((',' if k else '') + json.dumps({'po': k + 1, 'n': 'alias', 'v': ['ncbigene:{0}'.format(
+                SyntheticData.entrezgene(k))], 'd': 'list_of_string'}))
+        f.write(']},\n{"edges": [')
+        count = 0
+        for (i, a, b) in self.pairs():
+            f.write((',' if i else '') + json.dumps({'@id': self.genes + i + 1, 's': a + 1, 't': b + 1,
+                                                     'i': 'in-complex-with' if i % 4 else 'controls-state-change-of'}))
+            count += 1
+        f.write(']},\n{"status": [{"error": "", "success": true}]}]\n')
+        return count
+
+    def write_source(self, source, f):
+        """
+        Write the file of a source.
+        :param source: one of 'biogrid', 'hint', 'ctd', 'disgenet', 'cpd' or 'ndex'
+        :param f: file opened for writing in text mode
+        :return: number of lines (or CX edges) written
+        """
+        if source == 'ndex':
+            return self.write_cx(f)
+        lines = {
+            'biogrid': self.biogrid_lines,
+            'hint': self.hint_lines,
+            'ctd': self.ctd_lines,
+            'disgenet': self.disgenet_lines,
+            'cpd': self.cpd_lines
+        }[source]
+        return SyntheticData.write(f, lines())
@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+"""
+Test classes for the batch lookups of the web api.
+
+Source Project:   biothings.interactions
+"""
+import json
+import unittest
+
+from www.api import batch
+
+
+class TestBatch(unittest.TestCase):
+
+    def test_split(self):
+        self.assertEqual(batch.split_genes('1017, 1018\n1019;;'), ['1017', '1018', '1019'])
+        self.assertEqual(batch.split_genes([1017, ' 1018 ']), ['1017', '1018'])
+        self.assertEqual(batch.split_pairs('1017,1018;\n1017,mesh:D003920\n'), ['1017,1018', '1017,mesh:D003920'])
+        self.assertEqual(batch.split_pairs([[1017, 1018], '1017,1019']), ['1017,1018', '1017,1019'])
+        self.assertEqual(batch.chunked(list(range(5)), 2), [[0, 1], [2, 3], [4]])
+        self.assertEqual(batch.split_genes(None), [])
+        # a JSON number or object is a client error
+        self.assertRaises(ValueError, batch.split_genes, 5)
+        self.assertRaises(ValueError, batch.split_pairs, {'a': 1017})
+
+    def test_hit_size(self):
+        self.assertEqual(batch.hit_size(None, 1000), 100)
+        self.assertEqual(batch.hit_size('', 50), 50)
+        self.assertEqual(batch.hit_size('10', 1000), 10)
+        self.assertEqual(batch.hit_size(0, 1000), 0)
+        self.assertEqual(batch.hit_size(1000000, 1000), 1000)
+        for size in ('-1', -1, '1.5', 1.5, 'ten', True, [10]):
+            self.assertRaises(ValueError, batch.hit_size, size, 1000)
+
+    def test_msearch_body(self):
+        """
+        One header and query line per valid gene
+        :return:
+        """
+        lines = batch.msearch_body(['1017', 'CDK2', '1018'], 10, ['biogrid']).splitlines()
+        self.assertEqual(len(lines), 4)
+        self.assertEqual(lines[0], '{}')
+        query = json.loads(lines[1])
+        self.assertEqual(query['size'], 10)
+        self.assertEqual(query['_source'], ['biogrid'])
+        self.assertEqual(query['query']['bool']['should'][1], {'term': {'interactor_b.entrezgene': 1017}})
+        self.assertEqual(json.loads(lines[3])['query']['bool']['should'][0],
+                         {'term': {'interactor_a.entrezgene': 1018}})
+
+    def test_neighborhood_results(self):
+        responses = [
+            {'hits': {'total': 1, 'hits': [{'_id': 'entrezgene:1017-entrezgene:1018', '_source': {'biogrid': {}}}]}},
+            {'error': {'type': 'search_phase_execution_exception'}}
+        ]
+        results = batch.neighborhood_results(['1017', 'CDK2', '1018'], responses)
+        self.assertEqual(results[0], {'query': '1017', 'total': 1,
+                                      'hits': [{'_id': 'entrezgene:1017-entrezgene:1018', 'biogrid': {}}]})
+        self.assertTrue(results[1]['notfound'])
+        self.assertEqual(results[2]['query'], '1018')
+        self.assertIn('error', results[2])
+
+    def test_pair_results(self):
+        docs = [{'_id': 'entrezgene:1017-entrezgene:1018', 'found': True, '_source': {'hint': {}}},
+                {'_id': 'entrezgene:1017-entrezgene:1019', 'found': False}]
+        results = batch.pair_results(['1018,1017', 'x', '1017,1019'],
+                                     ['entrezgene:1017-entrezgene:1018', None, 'entrezgene:1017-entrezgene:1019'],
+                                     docs)
+        self.assertEqual(results[0], {'query': '1018,1017', '_id': 'entrezgene:1017-entrezgene:1018', 'hint': {}})
+        self.assertEqual(results[1]['error'], "Invalid pair")
+        self.assertTrue(results[2]['notfound'])
+
+        lines = batch.ndjson(results).splitlines()
+        self.assertEqual([json.loads(line)['query'] for line in lines], ['1018,1017', 'x', '1017,1019'])
+
+
+if __name__ == '__main__':
+    unittest.main()
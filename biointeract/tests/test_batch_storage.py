@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+"""
+Test classes for the batch storage of the uploaders, run against an
+in-process stand-in for a mongo collection (see fakes).
+
+Source Project:   biothings.interactions
+"""
+import unittest
+
+import config
+from hub.dataload.BatchStorage import BatchStorage
+from .fakes import StandInCollection
+
+
+class TestBatchStorage(unittest.TestCase):
+
+    def _batches(self, count, size=10, produced=None):
+        for b in range(count):
+            if produced is not None:
+                produced.append(b)
+            yield [{'_id': '%d-%d' % (b, i)} for i in range(size)]
+
+    def test_serial(self):
+        collection = StandInCollection()
+        storage = BatchStorage({'col': collection}, 'col', writers=1, max_pending=2)
+        self.assertEqual(storage.process(self._batches(5), 1000), 50)
+        self.assertEqual(collection.inserts, 5)
+        self.assertEqual(collection.max_running, 1)
+
+    def test_parallel(self):
+        """
+        Batches are inserted concurrently, with the parser held back while all writers are busy
+        :return:
+        """
+        collection = StandInCollection(delay=0.01)
+        storage = BatchStorage({'col': collection}, 'col', writers=4, max_pending=4)
+        produced = []
+
+        def batches():
+            for batch in self._batches(40, produced=produced):
+                # batches read ahead of the completed inserts are bounded
+                self.assertLessEqual(len(produced) - collection.inserts, storage.max_pending + 1)
+                yield batch
+
+        self.assertEqual(storage.process(batches()), 400)
+        self.assertEqual(sorted(d['_id'] for d in collection.docs),
+                         sorted('%d-%d' % (b, i) for b in range(40) for i in range(10)))
+        self.assertGreater(collection.max_running, 1)
+        self.assertLessEqual(collection.max_running, 4)
+
+    def test_parallel_failure(self):
+        """
+        A failed insert is raised by process
+        :return:
+        """
+        collection = StandInCollection(delay=0.01, fail_on='3-0')
+        storage = BatchStorage({'col': collection}, 'col', writers=2, max_pending=4)
+        with self.assertRaises(ValueError):
+            storage.process(self._batches(20))
+
+    def test_writers_by_collection(self):
+        """
+        Writers configured by collection name apply to the temporary collection of an upload
+        :return:
+        """
+        col_name = 'CTD_chem_gene_ixns_temp_f8Kc2hAq'
+        self.assertEqual(BatchStorage.collection_name(col_name), 'CTD_chem_gene_ixns')
+        config.UPLOAD_WRITERS = {'CTD_chem_gene_ixns': 3}
+        try:
+            storage = BatchStorage({col_name: StandInCollection()}, col_name, max_pending=4)
+        finally:
+            del config.UPLOAD_WRITERS
+        self.assertEqual(storage.writers, 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
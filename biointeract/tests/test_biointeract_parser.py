@@ -0,0 +1,344 @@
+# -*- coding: utf-8 -*-
+"""
+Test classes for the generic parser functions shared by all sources.
+
+Source Project:   biothings.interactions
+"""
+import io
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+
+from .bitest import BITest
+from hub.dataload.BiointeractParser import InteractorAccumulator
+from hub.dataload.ExternalSortGrouper import ExternalSortGrouper
+from hub.dataload.LineReader import LineReader
+from hub.dataload.ParseCache import ParseCache
+from hub.dataload.ParseProfiler import ParseProfiler
+from hub.dataload.ReleaseDiff import ReleaseDiff
+from hub.dataload.sources.biogrid.parser import BiogridParser
+from hub.dataload.sources.disgenet.parser import DisGeNETParser
+from hub.dataload.sources.hint.parser import HiNTParser
+from hub.dataload.sources.ndex.parser import nDEXParser
+
+
+class TestBiointeractParserMethods(BITest):
+    """
+    Test class for BiointeractParser functions.  The static methods are called on a
+    small inline BioGRID dataset.
+    """
+
+    biogrid_header = ['BioGRID Interaction ID', 'Entrez Gene Interactor A', 'Entrez Gene Interactor B',
+                      'BioGRID ID Interactor A', 'BioGRID ID Interactor B', 'Systematic Name Interactor A',
+                      'Systematic Name Interactor B', 'Official Symbol Interactor A',
+                      'Official Symbol Interactor B', 'Synonyms Interactor A', 'Synonyms Interactor B',
+                      'Experimental System', 'Experimental System Type', 'Author', 'Pubmed ID',
+                      'Organism Interactor A', 'Organism Interactor B', 'Throughput', 'Score',
+                      'Modification', 'Phenotypes', 'Qualifications', 'Tags', 'Source Database']
+    biogrid_lines = [
+        ['103', '6416', '2318', '112315', '108607', '-', '-', 'MAP2K4', 'FLNC', 'JNKK|MEK4', 'ABPA|FLN2',
+         'Two-hybrid', 'physical', 'Marti A (1997)', '9006895', '9606', '9606', 'Low Throughput', '-', '-',
+         '-', '-', '-', 'BIOGRID'],
+        ['117', '84665', '88', '124185', '106603', '-', '-', 'MYPN', 'ACTN2', '-', 'CMD1AA',
+         'Two-hybrid', 'physical', 'Bang ML (2001)', '11309420', '9606', '9606', 'Low Throughput', '0.5',
+         'Phosphorylation', 'p1|p2', 'q1', '-', 'BIOGRID']
+    ]
+
+    def test_compiled_schema(self):
+        """
+        Records built with a compiled schema match those built from header-keyed dictionaries
+        :return:
+        """
+        schema = BiogridParser.get_schema(self.biogrid_header)
+        for (i, line) in enumerate(self.biogrid_lines):
+            expected = BiogridParser.parse_biogrid_tsv_line(i, dict(zip(self.biogrid_header, line)))
+            self.assertEqual(BiogridParser.set_id(schema.build(line)), expected)
+
+        r = schema.build(self.biogrid_lines[0])
+        self.assertEqual(r['interactor_a']['synonyms'], ['JNKK', 'MEK4'])
+        self.assertEqual(r['citation']['pubmed'], 9006895)
+        self.assertNotIn('score', r)
+        self.assertNotIn('systematic_name', r['interactor_a'])
+
+    def test_collapse_duplicate_keys_external(self):
+        """
+        The external sort collapse spills to disk and matches the in-memory collapse
+        :return:
+        """
+        def records():
+            for i in range(500):
+                yield {'_id': 'entrezgene:{0}-entrezgene:{1}'.format(i % 37, 100 + i % 11),
+                       'interactor_a': {'entrezgene': i % 37},
+                       'interactor_b': {'entrezgene': 100 + i % 11},
+                       'biogrid': [{'biogrid_interaction_id': i}]}
+
+        expected = BiogridParser.collapse_duplicate_keys(list(records()), 'biogrid')
+        result = list(BiogridParser.collapse_duplicate_keys_external(records(), 'biogrid', max_records=50))
+
+        self.assertEqual(len(result), len(expected))
+        self.assertEqual(result, sorted(expected, key=lambda r: r['_id']))
+
+        self.assertEqual(self._list_count(result, 'biogrid', 'biogrid_interaction_id'), 500)
+
+    def test_external_sort_merge_passes(self):
+        """
+        More runs than the fan-in are merged in passes, keeping the order of the records
+        of an id, and the run files are removed once read
+        :return:
+        """
+        tmp_dir = tempfile.mkdtemp()
+        try:
+            grouper = ExternalSortGrouper(max_records=10, tmp_dir=tmp_dir, max_fan_in=3)
+            records = [{'_id': 'id{:02d}'.format(i * 7 % 23), 'n': i} for i in range(200)]
+            for r in records:
+                grouper.add(r)
+            self.assertEqual(len(grouper.runs), 20)
+            self.assertEqual(len(os.listdir(tmp_dir)), 1)
+            result = list(grouper.sorted_records())
+            self.assertEqual(result, sorted(records, key=lambda r: r['_id']))
+            self.assertEqual(os.listdir(tmp_dir), [])
+        finally:
+            shutil.rmtree(tmp_dir)
+
+    def test_unique_evidence(self):
+        """
+        Exact-duplicate evidence is dropped regardless of the key order of nested records
+        :return:
+        """
+        entries = [
+            {'pubmed': [1, 2], 'experiment': {'system': 'Two-hybrid', 'throughput': 'Low'}},
+            {'experiment': {'throughput': 'Low', 'system': 'Two-hybrid'}, 'pubmed': [1, 2]},
+            {'pubmed': [2, 1], 'experiment': {'system': 'Two-hybrid', 'throughput': 'Low'}},
+            {'pubmed': [1, 2]}
+        ]
+        self.assertEqual(BiogridParser.fingerprint(entries[0]), BiogridParser.fingerprint(entries[1]))
+        # values of different types are distinct evidence, even when equal in Python
+        self.assertEqual(len(set(BiogridParser.freeze({'score': v}) for v in (1, 1.0, True, '1'))), 4)
+        self.assertEqual(BiogridParser.unique_evidence([{'score': 1}, {'score': True}, {'score': 1}]),
+                         [{'score': 1}, {'score': True}])
+        self.assertEqual(BiogridParser.unique_evidence(entries), [entries[0], entries[2], entries[3]])
+
+        records = [{'_id': 'x', 'biogrid': [entries[0]]}, {'_id': 'x', 'biogrid': [entries[1], entries[3]]}]
+        r = BiogridParser.collapse_duplicate_keys(records, 'biogrid', dedup=True)
+        self.assertEqual(r[0]['biogrid'], [entries[0], entries[3]])
+
+    def test_interactor_accumulator(self):
+        """
+        Interactor attributes are merged into insertion-ordered sets
+        :return:
+        """
+        acc = InteractorAccumulator()
+        acc.add({'entrezgene': 6416, 'symbol': 'MAP2K4', 'synonyms': ['JNKK', 'MEK4']})
+        acc.add({'entrezgene': 6416, 'symbol': 'MAP2K4', 'synonyms': 'MKK4'})
+        acc.add({'entrezgene': 6416, 'synonyms': ['MEK4', 'SERK1'], 'taxid': 9606})
+        self.assertEqual(acc.emit(), {'entrezgene': 6416, 'symbol': 'MAP2K4',
+                                      'synonyms': ['JNKK', 'MEK4', 'MKK4', 'SERK1'], 'taxid': 9606})
+
+        # records in the opposite direction contribute their interactors swapped
+        records = [
+            {'_id': 'x', 'interactor_a': {'entrezgene': 1, 'synonyms': 'a'},
+             'interactor_b': {'entrezgene': 2}, 'biogrid': [{'direction': 'A->B'}]},
+            {'_id': 'x', 'interactor_a': {'entrezgene': 2, 'synonyms': 'b'},
+             'interactor_b': {'entrezgene': 1, 'synonyms': 'c'}, 'biogrid': [{'direction': 'B->A'}]}
+        ]
+        r = BiogridParser.collapse_duplicate_keys(records, 'biogrid', merge_interactors=True)[0]
+        self.assertEqual(r['interactor_a'], {'entrezgene': 1, 'synonyms': ['a', 'c']})
+        self.assertEqual(r['interactor_b'], {'entrezgene': 2, 'synonyms': 'b'})
+
+        # a single record is left as parsed, its interactors are put in _id order by the build
+        single = {'_id': 'entrezgene:1-entrezgene:2', 'interactor_a': {'entrezgene': 2, 'synonyms': ['b', 'b']},
+                  'interactor_b': {'entrezgene': 1}, 'direction': 'B->A', 'hint': [{'pmid': 1}]}
+        r = BiogridParser.collapse_duplicate_keys([dict(single)], 'hint', merge_interactors=True)[0]
+        self.assertEqual(r, single)
+
+    def test_biogrid_parse_parallel(self):
+        """
+        The parallel biogrid parser returns the same documents as the serial parser
+        :return:
+        """
+        lines = ['#' + '\t'.join(self.biogrid_header)]
+        for i in range(200):
+            for line in self.biogrid_lines:
+                line = list(line)
+                line[0] = str(i)
+                line[1] = str(int(line[1]) + i % 7)
+                lines.append('\t'.join(line))
+        data = ('\n'.join(lines) + '\n').encode('utf-8')
+
+        serial = list(BiogridParser.parse_biogrid_tsv_file(io.BytesIO(data)))
+        parallel = list(BiogridParser.parse_biogrid_tsv_file_parallel(io.BytesIO(data), 2, chunk_size=1024))
+
+        self.assertEqual(len(serial), 14)
+        self.assertEqual(sorted(parallel, key=lambda r: r['_id']), serial)
+
+    def test_parse_cache(self):
+        """
+        Parsed documents are stored while they are read and replayed for an unchanged file
+        :return:
+        """
+        tmp_dir = tempfile.mkdtemp()
+        try:
+            source = os.path.join(tmp_dir, 'biogrid.tab2.txt')
+            lines = ['#' + '\t'.join(self.biogrid_header)] + ['\t'.join(line) for line in self.biogrid_lines]
+            with open(source, 'w') as f:
+                f.write('\n'.join(lines) + '\n')
+
+            parsed = []
+
+            def parse():
+                for r in BiogridParser.parse_biogrid_tsv_file(open(source, 'rb')):
+                    parsed.append(r['_id'])
+                    yield r
+
+            cache = ParseCache(os.path.join(tmp_dir, 'cache'), 'biogrid', chunk_size=1)
+
+            # an interrupted read does not create an entry
+            next(cache.load(source, BiogridParser, parse)).clear()
+            self.assertEqual(len(os.listdir(cache.cache_dir)), 0)
+
+            # documents modified by the consumer are cached as parsed
+            expected = list(BiogridParser.parse_biogrid_tsv_file(open(source, 'rb')))
+            self.assertEqual([r.clear() for r in cache.load(source, BiogridParser, parse)], [None, None])
+            count = len(parsed)
+            self.assertEqual(list(cache.load(source, BiogridParser, parse)), expected)
+            self.assertEqual(len(parsed), count)
+
+            # a new file replaces the entry
+            with open(source, 'a') as f:
+                f.write('\t'.join(self.biogrid_lines[0]) + '\n')
+            expected = list(BiogridParser.parse_biogrid_tsv_file(open(source, 'rb')))
+            self.assertEqual(list(cache.load(source, BiogridParser, parse)), expected)
+            self.assertEqual(len(parsed), count + 2)
+            self.assertEqual(len(os.listdir(cache.cache_dir)), 1)
+
+            # documents parsed with other options, e.g. in partition order, are not replayed
+            self.assertNotEqual(ParseCache.key(source, BiogridParser, {'parallel': True}),
+                                ParseCache.key(source, BiogridParser, {'parallel': False}))
+            self.assertEqual(list(cache.load(source, BiogridParser, parse, {'parallel': True})), expected)
+            self.assertEqual(len(parsed), count + 4)
+        finally:
+            shutil.rmtree(tmp_dir)
+
+    def test_release_diff(self):
+        """
+        Releases are compared by id and content, independent of dictionary key order
+        :return:
+        """
+        diff = ReleaseDiff()
+        diff.add_previous({'_id': 'a', 'biogrid': [{'pubmed': 1, 'throughput': 'Low'}]})
+        diff.add_previous({'_id': 'b', 'biogrid': [{'pubmed': 2}]})
+        diff.add_previous({'_id': 'c', 'biogrid': [{'pubmed': 3}]})
+
+        release = [
+            {'_id': 'a', 'biogrid': [{'throughput': 'Low', 'pubmed': 1}]},
+            {'_id': 'b', 'biogrid': [{'pubmed': 2}, {'pubmed': 4}]},
+            {'_id': 'd', 'biogrid': [{'pubmed': 5}]}
+        ]
+        changes = [(op, doc['_id']) for (op, doc) in diff.diff(release)]
+        self.assertEqual(changes, [(ReleaseDiff.UPDATE, 'b'), (ReleaseDiff.INSERT, 'd'), (ReleaseDiff.DELETE, 'c')])
+        self.assertEqual(diff.counts, {ReleaseDiff.INSERT: 1, ReleaseDiff.UPDATE: 1, ReleaseDiff.DELETE: 1})
+        self.assertEqual(diff.unchanged, 1)
+
+        # operations of successive diffs, e.g. of an interrupted upload and its retry
+        self.assertEqual(ReleaseDiff.combine(ReleaseDiff.INSERT, ReleaseDiff.UPDATE), ReleaseDiff.INSERT)
+        self.assertIsNone(ReleaseDiff.combine(ReleaseDiff.INSERT, ReleaseDiff.DELETE))
+        self.assertEqual(ReleaseDiff.combine(ReleaseDiff.DELETE, ReleaseDiff.INSERT), ReleaseDiff.UPDATE)
+        self.assertEqual(ReleaseDiff.combine(ReleaseDiff.UPDATE, ReleaseDiff.DELETE), ReleaseDiff.DELETE)
+
+    def test_parse_profiler(self):
+        """
+        Parse stages are recorded when profiling is enabled and left untouched otherwise
+        :return:
+        """
+        self.assertIs(BiogridParser.profiled('set_id', BiogridParser.set_id), BiogridParser.set_id)
+
+        lines = ['#' + '\t'.join(self.biogrid_header)] + ['\t'.join(line) for line in self.biogrid_lines]
+        data = ('\n'.join(lines) + '\n').encode('utf-8')
+        profiler = BiogridParser.enable_profiling()
+        try:
+            result = list(BiogridParser.parse_biogrid_tsv_file(io.BytesIO(data)))
+        finally:
+            self.assertIs(BiogridParser.disable_profiling(), profiler)
+
+        # parsers run by other threads are not recorded
+        profiler = BiogridParser.enable_profiling()
+        try:
+            other = threading.Thread(target=lambda: list(BiogridParser.parse_biogrid_tsv_file(io.BytesIO(data))))
+            other.start()
+            other.join()
+            self.assertEqual(profiler.report()['stages'], [])
+            result = list(BiogridParser.parse_biogrid_tsv_file(io.BytesIO(data)))
+        finally:
+            self.assertIs(BiogridParser.disable_profiling(), profiler)
+
+        report = profiler.report()
+        stages = {s['stage']: s for s in report['stages']}
+        self.assertEqual(stages['build']['calls'], 2)
+        self.assertEqual(stages['collapse']['calls'], len(result))
+        self.assertLessEqual(sum(s['self_s'] for s in report['stages']), report['wall_s'] + 0.01)
+        self.assertIn('set_id', ParseProfiler.format_report(report))
+
+    def test_batched(self):
+        """
+        Parsed documents are grouped into lists of the batch size
+        :return:
+        """
+        docs = ({'_id': str(i)} for i in range(25))
+        batches = list(BiogridParser.batched(docs, 10))
+        self.assertEqual([len(b) for b in batches], [10, 10, 5])
+        self.assertEqual([d['_id'] for b in batches for d in b], [str(i) for i in range(25)])
+        self.assertEqual(list(BiogridParser.batched([], 10)), [])
+
+    def test_line_reader(self):
+        """
+        Lines spanning block boundaries, multi-byte characters and a missing final
+        line terminator are read as with line-by-line iteration
+        :return:
+        """
+        text = '# header\na\tb\n\u00e9t\u00e9\tx\n\nlong line \u2013 ' + 'y' * 30 + '\tz\nlast\tline'
+        expected = [line.split('\t') for line in text.split('\n')[1:]]
+        for f in [io.BytesIO(text.encode('utf-8')), io.StringIO(text)]:
+            for block_size in [1, 2, 7, 1024]:
+                f.seek(0)
+                reader = LineReader(f, block_size=block_size)
+                self.assertEqual(reader.readline(), '# header')
+                self.assertEqual(list(reader.rows()), expected)
+                self.assertIsNone(reader.readline())
+
+        reader = LineReader(io.BytesIO(b'1\n2\n3\n4\n'), block_size=4)
+        reader.skip(1)
+        self.assertEqual(reader.readline(), '2')
+        self.assertEqual(list(reader.batches()), [[['3'], ['4']]])
+
+    def test_pair_id(self):
+        """
+        Pair ids are the ids set by the parsers, whatever the order of the identifiers
+        :return:
+        """
+        for (a, b) in [(6416, 2318), (88, 84665), (9, 9)]:
+            (id, _) = BiogridParser.set_id({'interactor_a': {'entrezgene': str(a)}, 'interactor_b': {'entrezgene': str(b)}})
+            self.assertEqual(BiogridParser.pair_id('entrezgene', a, 'entrezgene', b), id)
+            self.assertEqual(BiogridParser.pair_id('entrezgene', str(b), 'entrezgene', str(a)), id)
+
+        # HiNT ids may be resolved as strings, they are ordered as integers all the same
+        (id, _) = HiNTParser.set_id({'interactor_a': {'entrezgene': '10'}, 'interactor_b': {'entrezgene': '9'}})
+        self.assertEqual(id, 'entrezgene:9-entrezgene:10')
+        self.assertEqual(BiogridParser.pair_id('entrezgene', '10', 'entrezgene', '9'), id)
+
+        (id, _) = DisGeNETParser.set_id({'interactor_a': {'entrezgene': '1017'}, 'interactor_b': {'mesh': 'C565123'}})
+        self.assertEqual(BiogridParser.pair_id('mesh', 'C565123', 'entrezgene', '1017'), id)
+        self.assertEqual(BiogridParser.pair_id('entrezgene', '1017', 'mesh', 'C565123'), id)
+
+        (id, _) = nDEXParser.set_id({'interactor_a': {'ndex': 'TP53'}, 'interactor_b': {'ndex': 'MDM2'}})
+        self.assertEqual(BiogridParser.pair_id('ndex', 'TP53', 'ndex', 'MDM2'), id)
+
+        with self.assertRaises(ValueError):
+            BiogridParser.pair_id('entrezgene', '1017', 'ndex', 'MDM2')
+        with self.assertRaises(ValueError):
+            BiogridParser.pair_id('entrezgene', 'CDK2', 'entrezgene', '1017')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,60 @@
+# -*- coding: utf-8 -*-
+"""
+Test classes for the source changesets applied by incremental builds.
+
+Source Project:   biothings.interactions
+"""
+import unittest
+
+from hub.databuild.changeset import changed_ids, existing_ids, source_changeset, target_changes
+from .fakes import StandInCollection
+
+
+class TestChangeset(unittest.TestCase):
+
+    def _src_doc(self, release, changeset):
+        return {'_id': 'biogrid', 'upload': {'jobs': {'biogrid': {'release': release, 'changeset': changeset}}}}
+
+    def test_source_changeset(self):
+        """
+        A changeset applies to the target built from its previous release
+        :return:
+        """
+        changeset = {'collection': 'biogrid_changeset', 'release': '3.4.159', 'previous_release': '3.4.158',
+                     'insert': 1, 'update': 2, 'delete': 0, 'unchanged': 10}
+        self.assertEqual(source_changeset(self._src_doc('3.4.159', changeset), 'biogrid', '3.4.158'), changeset)
+        self.assertIsNone(source_changeset(self._src_doc('3.4.159', changeset), 'biogrid', '3.4.159'))
+
+        # releases uploaded after the build release, or a full load
+        with self.assertRaises(ValueError):
+            source_changeset(self._src_doc('3.4.159', changeset), 'biogrid', '3.4.157')
+        with self.assertRaises(ValueError):
+            source_changeset(self._src_doc('3.4.159', None), 'biogrid', '3.4.158')
+        with self.assertRaises(ValueError):
+            source_changeset(self._src_doc('3.4.160', changeset), 'biogrid', '3.4.158')
+
+    def test_changed_ids(self):
+        db = {'biogrid_changeset': StandInCollection([{'_id': 'c', 'op': 'update'}, {'_id': 'a', 'op': 'insert'}]),
+              'hint_changeset': StandInCollection([{'_id': 'b', 'op': 'delete'}, {'_id': 'a', 'op': 'update'}])}
+        changesets = [{'collection': 'biogrid_changeset'}, {'collection': 'hint_changeset'}]
+        self.assertEqual(changed_ids(db, changesets), ['a', 'b', 'c'])
+        self.assertEqual(changed_ids(db, []), [])
+
+    def test_target_changes(self):
+        """
+        Re-merged _ids are recorded as inserts, updates or deletes of the target
+        :return:
+        """
+        target = StandInCollection([{'_id': _id} for _id in ['a', 'b', 'x']])
+        ids = ['a', 'b', 'c', 'd']
+        before = existing_ids(target, ids, batch_size=3)
+        self.assertEqual(before, {'a', 'b'})
+        self.assertEqual(target.queries, 2)
+
+        after = {'a', 'c'}
+        self.assertEqual(list(target_changes(ids, before, after)),
+                         [{'_id': 'a', 'op': 'update'}, {'_id': 'b', 'op': 'delete'}, {'_id': 'c', 'op': 'insert'}])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+"""
+Test classes for the streaming export of the web api.
+
+Source Project:   biothings.interactions
+"""
+import gzip
+import json
+import unittest
+
+from www.api import export
+from .fakes import StandInIndex
+
+
+class TestExport(unittest.TestCase):
+
+    def test_source_filter(self):
+        self.assertEqual(export.source_filter([]), {'match_all': {}})
+        query = export.source_filter(export.split_list('biogrid, hint'))
+        self.assertEqual(query['bool']['should'], [{'exists': {'field': 'biogrid'}}, {'exists': {'field': 'hint'}}])
+        with self.assertRaises(ValueError):
+            export.source_filter(['biogrid', 'hint}'])
+
+    def test_pages(self):
+        """
+        Every document is exported once, in pages of at most size documents
+        :return:
+        """
+        index = StandInIndex(['id{:02d}'.format(i) for i in range(7)])
+        body = export.export_body({'match_all': {}}, 3, ['biogrid'])
+        pages = list(export.search_after_pages(index.search, body))
+        self.assertEqual([len(p) for p in pages], [3, 3, 1])
+        self.assertEqual([h['_id'] for p in pages for h in p], index.ids)
+        self.assertEqual(index.bodies[1]['search_after'], ['id02'])
+
+        # an exact number of pages ends on an empty page
+        index = StandInIndex(['a', 'b'])
+        pages = list(export.search_after_pages(index.search, export.export_body({'match_all': {}}, 2)))
+        self.assertEqual(len(pages), 1)
+        self.assertEqual(len(index.bodies), 2)
+
+    def test_scroll(self):
+        """
+        A scroll in index order is walked to its end and then cleared
+        :return:
+        """
+        docs = [{'_id': 'id{}'.format(i)} for i in range(5)]
+        body = export.export_body({'match_all': {}}, 2)
+        self.assertEqual(body['sort'], ['_doc'])
+        pages = [docs[0:2], docs[2:4], docs[4:], []]
+        scrolled = []
+        cleared = []
+        search = lambda body: {'_scroll_id': 's0', 'hits': {'hits': pages.pop(0)}}
+
+        def scroll(scroll_id):
+            scrolled.append(scroll_id)
+            return {'_scroll_id': 's{}'.format(len(scrolled)), 'hits': {'hits': pages.pop(0)}}
+        walked = list(export.scroll_pages(search, scroll, cleared.append, body))
+        self.assertEqual([h for p in walked for h in p], docs)
+        self.assertEqual(scrolled, ['s0', 's1', 's2'])
+        self.assertEqual(cleared, ['s3'])
+
+        # an export cut short clears its scroll
+        pages = [docs[0:2], docs[2:4]]
+        walk = export.scroll_pages(search, scroll, cleared.append, body)
+        next(walk)
+        walk.close()
+        self.assertEqual(cleared, ['s3', 's0'])
+
+    def test_point_in_time(self):
+        index = StandInIndex(['a', 'b', 'c'])
+        body = export.export_body({'match_all': {}}, 2, pit={'id': 'pit-0', 'keep_alive': '5m'})
+        self.assertEqual(body['sort'], [{'_shard_doc': 'asc'}])
+        list(export.search_after_pages(index.search, body))
+        self.assertEqual(body['pit'], {'id': 'pit-1', 'keep_alive': '5m'})
+
+    def test_gzip(self):
+        hits = [{'_id': 'a', '_source': {'hint': {}}}, {'_id': 'b', '_source': {}}]
+        stream = export.GzipStream()
+        data = stream.compress(export.ndjson_lines(hits[:1]))
+        self.assertTrue(data)
+        data += stream.compress(export.ndjson_lines(hits[1:])) + stream.finish()
+        lines = gzip.decompress(data).decode('utf-8').splitlines()
+        self.assertEqual([json.loads(line) for line in lines], [{'_id': 'a', 'hint': {}}, {'_id': 'b'}])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -4,10 +4,19 @@ Test classes for parsing protein interaction files.
 
 Author:  Greg Taylor (greg.k.taylor@gmail.com)
 """
+import io
+import json
 import os
+import shutil
+import tempfile
+import threading
 import unittest
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, HTTPServer
 
 from .bitest import BITest
+from hub.dataload.AsyncIdentifierResolver import AsyncIdentifierResolver
+from hub.dataload.IdentifierCache import IdentifierCache
 from hub.dataload.sources.hint.parser import HiNTParser
 
 
@@ -36,3 +45,104 @@ class TestParserMethods(BITest):
 
         self.assertGreater(self._list_average(hint, 'hint', 'evidence'), 2)
 
+    def test_hint_identifier_cache(self):
+        """
+        Cached uniprot to entrezgene mappings are resolved without querying MyGene.info
+        :return:
+        """
+        tmp_dir = tempfile.mkdtemp()
+        try:
+            mapping_file = os.path.join(tmp_dir, 'idmapping.dat')
+            with open(mapping_file, 'w') as f:
+                f.write('P45985\tGeneID\t6416\nP45985\tGene_Name\tMAP2K4\nQ14315\tGeneID\t2318\n')
+
+            cache = IdentifierCache(os.path.join(tmp_dir, 'cache.sqlite'), 'uniprot:entrezgene')
+            self.assertEqual(cache.load_mapping_file(mapping_file, id_type='GeneID'), 2)
+            cache.put_many({}, negatives=['X00000'])
+
+            found, misses = cache.get_many(['P45985', 'Q14315', 'X00000', 'Y00000'])
+            self.assertEqual(found, {'P45985': 6416, 'Q14315': 2318})
+            self.assertEqual(misses, {'Y00000'})
+            self.assertEqual(HiNTParser.build_entrezgenes(['P45985', 'Y00000'], cache, offline=True),
+                             {'P45985': 6416})
+
+            # ids resolved as strings are cached as integers, like the mapping file ids
+            cache.put_many({'P21246': '5764'})
+            found = cache.get_many(['P21246', 'P45985'])[0]
+            self.assertEqual(found, {'P21246': 5764, 'P45985': 6416})
+            r = {'interactor_a': {'entrezgene': found['P21246']}, 'interactor_b': {'entrezgene': '10'}}
+            self.assertEqual(HiNTParser.set_id(r)[0], 'entrezgene:10-entrezgene:5764')
+
+            # expired negative entries are resolved again
+            cache.negative_ttl = -1
+            self.assertEqual(cache.get_many(['X00000'])[1], {'X00000'})
+            cache.close()
+        finally:
+            shutil.rmtree(tmp_dir)
+
+    def test_hint_async_resolver(self):
+        """
+        Identifiers are resolved in batches against a local querymany stand-in server,
+        retrying failed requests
+        :return:
+        """
+        requests = []
+
+        class QueryHandler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                form = urllib.parse.parse_qs(self.rfile.read(int(self.headers['Content-Length'])).decode())
+                requests.append(form['q'][0].split(','))
+                # fail the first request to exercise the retries
+                if len(requests) == 1:
+                    self.send_response(503)
+                    self.end_headers()
+                    return
+                # MyGene.info returns entrezgene ids as strings
+                hits = [{'query': q, 'entrezgene': q[1:]} if q.startswith('P') else
+                        {'query': q, 'notfound': True} for q in requests[-1]]
+                body = json.dumps(hits).encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        server = HTTPServer(('127.0.0.1', 0), QueryHandler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        resolver = AsyncIdentifierResolver(url='http://127.0.0.1:%d/query' % server.server_port,
+                                           batch_size=10, max_in_flight=3, retry_delay=0.01)
+        try:
+            ids = ['P%d' % i for i in range(45)] + ['X1', 'P0']
+            resolver.submit(ids)
+            self.assertEqual(resolver.get('P3'), 3)
+            self.assertIsNone(resolver.get('X1'))
+            results = resolver.resolve_all()
+        finally:
+            resolver.close()
+            server.shutdown()
+            server.server_close()
+
+        self.assertEqual(results, {'P%d' % i: i for i in range(45)})
+        self.assertEqual(resolver.requests, 5)
+        self.assertEqual(len(requests), 6)
+        self.assertEqual(resolver.failures, 0)
+
+    def test_hint_resolver_failure(self):
+        """
+        A batch that fails after its retries fails the parse instead of dropping its interactions
+        :return:
+        """
+        class FailingResolver(AsyncIdentifierResolver):
+            def post(self, batch):
+                raise OSError("service unavailable")
+
+        lines = ['Uniprot_A\tUniprot_B\tGene_A\tGene_B\tORF_A\tORF_B\tAlias_A\tAlias_B\tpmid:method:quality',
+                 'P45985\tQ14315\tMAP2K4\tFLNC\t-\t-\t-\t-\t10000000:18:HT']
+        f = io.BytesIO(('\n'.join(lines) + '\n').encode('utf-8'))
+        resolver = FailingResolver(retries=1, retry_delay=0.01)
+        with self.assertRaises(OSError):
+            list(HiNTParser.parse_tsv_file(f, resolver=resolver))
+        self.assertEqual(resolver.failures, 1)
@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+"""
+Test classes for the memory accounting of the uploads.
+
+Source Project:   biothings.interactions
+"""
+import tracemalloc
+import unittest
+
+from hub.dataload.MemoryTracker import MemoryTracker
+
+
+class TestMemoryTracker(unittest.TestCase):
+
+    docs = [{'_id': '%04d' % i, 'values': list(range(10))} for i in range(250)]
+
+    def test_track(self):
+        """
+        The memory tracker passes documents through and reports a per-document size
+        :return:
+        """
+        tracker = MemoryTracker(trace=True, sample_interval=100)
+        self.assertEqual(list(tracker.track(iter(self.docs))), self.docs)
+        report = tracker.report()
+        self.assertEqual(report['docs'], 250)
+        self.assertEqual(tracker.sampled_docs, 3)
+        self.assertEqual(report['doc_bytes'], MemoryTracker.deep_size(self.docs[0]))
+        self.assertGreater(report['rss_peak_mb'], 0)
+        self.assertGreaterEqual(report['rss_peak_mb'], report['rss_start_mb'])
+        self.assertIsNotNone(report['heap_peak_mb'])
+
+    def test_track_batches(self):
+        batches = [self.docs[i:i + 40] for i in range(0, len(self.docs), 40)]
+        tracker = MemoryTracker(sample_interval=100)
+        self.assertEqual(list(tracker.track_batches(iter(batches))), batches)
+        self.assertEqual(tracker.report()['docs'], 250)
+        # batches starting at documents 0, 120 and 240
+        self.assertEqual(tracker.sampled_docs, 3)
+
+    def test_caller_tracer(self):
+        """
+        A tracer started by the caller is left running
+        :return:
+        """
+        tracemalloc.start()
+        try:
+            tracker = MemoryTracker(trace=True)
+            list(tracker.track(iter(self.docs)))
+            self.assertTrue(tracemalloc.is_tracing())
+        finally:
+            tracemalloc.stop()
+
+    def test_shared_process(self):
+        """
+        Uploads sharing the process only report the per-document size
+        :return:
+        """
+        tracker = MemoryTracker(trace=True, process=False)
+        list(tracker.track(iter(self.docs)))
+        report = tracker.report()
+        self.assertEqual(report['doc_bytes'], MemoryTracker.deep_size(self.docs[0]))
+        self.assertEqual([report[k] for k in ('rss_start_mb', 'rss_peak_mb', 'process_peak_mb', 'heap_peak_mb')],
+                         [None] * 4)
+        self.assertFalse(tracemalloc.is_tracing())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,106 @@
+# -*- coding: utf-8 -*-
+"""
+Test classes for the merge-join of sorted source collections.
+
+Source Project:   biothings.interactions
+"""
+import unittest
+
+from hub.databuild.mergejoin import merge_documents, merge_join
+from hub.dataload.BiointeractParser import BiointeractParser
+
+
+class TestMergeJoin(unittest.TestCase):
+
+    biogrid = [{'_id': 'entrezgene:1-entrezgene:2', 'biogrid': [1]},
+               {'_id': 'entrezgene:1-entrezgene:3', 'biogrid': [2], 'interactor_a': {'symbol': 'A'}},
+               {'_id': 'entrezgene:2-entrezgene:5', 'biogrid': [3]}]
+    hint = [{'_id': 'entrezgene:1-entrezgene:3', 'hint': [4], 'interactor_a': {'entrezgene': 1}},
+            {'_id': 'entrezgene:2-entrezgene:4', 'hint': [5]},
+            {'_id': 'entrezgene:2-entrezgene:5', 'hint': [6]}]
+    disgenet = [{'_id': 'entrezgene:1-mesh:C01', 'disgenet': [7]}]
+
+    def test_merge_join(self):
+        """
+        Documents sharing an _id are joined in source order, all _ids are returned in order
+        :return:
+        """
+        joined = list(merge_join([('biogrid', iter(self.biogrid)), ('hint', iter(self.hint)),
+                                  ('disgenet', iter(self.disgenet))]))
+        self.assertEqual([_id for (_id, group) in joined],
+                         ['entrezgene:1-entrezgene:2', 'entrezgene:1-entrezgene:3', 'entrezgene:1-mesh:C01',
+                          'entrezgene:2-entrezgene:4', 'entrezgene:2-entrezgene:5'])
+        self.assertEqual([[name for (name, doc) in group] for (_id, group) in joined],
+                         [['biogrid'], ['biogrid', 'hint'], ['disgenet'], ['hint'], ['biogrid', 'hint']])
+
+    def test_merge_join_unsorted(self):
+        """
+        A source not sorted by _id is reported
+        :return:
+        """
+        with self.assertRaises(ValueError):
+            list(merge_join([('biogrid', reversed(self.biogrid)), ('hint', iter(self.hint))]))
+
+    def test_merge_documents(self):
+        """
+        Later sources replace top-level keys, or merge them with the merge_struct merger
+        :return:
+        """
+        group = [('biogrid', self.biogrid[1]), ('hint', self.hint[0])]
+        merged = merge_documents(group)
+        self.assertEqual(merged, {'_id': 'entrezgene:1-entrezgene:3', 'biogrid': [2], 'hint': [4],
+                                  'interactor_a': {'entrezgene': 1}})
+
+        group = [('biogrid', dict(self.biogrid[1], interactor_a={'symbol': 'A'})), ('hint', self.hint[0])]
+        merged = merge_documents(group, {'hint': 'merge_struct'})
+        self.assertEqual(merged['interactor_a'], {'symbol': 'A', 'entrezgene': 1})
+        self.assertEqual(merged['hint'], [4])
+
+    def test_merge_canonical_interactors(self):
+        """
+        Interactors of all sources are put in _id order and their attributes unioned
+        :return:
+        """
+        biogrid = {'_id': 'entrezgene:1008-entrezgene:5764',
+                   'interactor_a': {'entrezgene': 1008, 'symbol': 'CDH10', 'synonyms': ['CDH-10']},
+                   'interactor_b': {'entrezgene': 5764, 'symbol': 'PTN'},
+                   'biogrid': [{'biogrid_interaction_id': 270216, 'direction': 'A->B'},
+                               {'biogrid_interaction_id': 270217, 'direction': 'B->A'}]}
+        hint = {'_id': 'entrezgene:1008-entrezgene:5764',
+                'interactor_a': {'entrezgene': 5764, 'uniprot': 'P21246', 'gene': 'PTN'},
+                'interactor_b': {'entrezgene': 1008, 'uniprot': 'Q9Y6N8', 'gene': 'CDH10', 'alias': 'HGNC:1749'},
+                'hint': [{'evidence': [{'pmid': 16169070, 'method': 18, 'quality': 'HT'}]}],
+                'direction': 'B->A'}
+        docs = [BiointeractParser.canonical_interactors(d) for d in [biogrid, hint]]
+        merged = merge_documents(list(zip(['biogrid', 'hint'], docs)), {'hint': 'merge_struct'})
+
+        self.assertEqual(merged['interactor_a'], {'entrezgene': 1008, 'symbol': 'CDH10', 'synonyms': ['CDH-10'],
+                                                  'uniprot': 'Q9Y6N8', 'gene': 'CDH10', 'alias': 'HGNC:1749'})
+        self.assertEqual(merged['interactor_b'], {'entrezgene': 5764, 'symbol': 'PTN', 'uniprot': 'P21246',
+                                                  'gene': 'PTN'})
+        self.assertEqual(merged['direction'], 'A->B')
+        # the evidence keeps the interactor order of its source
+        self.assertEqual([e['direction'] for e in merged['biogrid']], ['A->B', 'B->A'])
+        self.assertEqual(merged['hint'][0]['direction'], 'B->A')
+
+        # canonical records are not swapped again
+        self.assertEqual(BiointeractParser.canonical_interactors(docs[1])['interactor_a']['entrezgene'], 1008)
+
+        # collapsed BioGRID records are already in _id order, whatever the direction of their first evidence
+        biogrid = {'_id': 'entrezgene:1008-entrezgene:5764',
+                   'interactor_a': {'entrezgene': 1008, 'symbol': 'CDH10'},
+                   'interactor_b': {'entrezgene': 5764, 'symbol': 'PTN'},
+                   'biogrid': [{'biogrid_interaction_id': 270217, 'direction': 'B->A'},
+                               {'biogrid_interaction_id': 270216, 'direction': 'A->B'}]}
+        doc = BiointeractParser.canonical_interactors(biogrid)
+        self.assertEqual(doc['interactor_a']['symbol'], 'CDH10')
+        self.assertEqual([e['direction'] for e in doc['biogrid']], ['B->A', 'A->B'])
+
+        # merged interactors may hold a list of identifiers
+        ndex = {'_id': 'ndex:CDH10-ndex:PTN', 'interactor_a': {'ndex': 'PTN'},
+                'interactor_b': {'ndex': ['CDH10', 'CDH-10']}, 'direction': 'B->A'}
+        self.assertEqual(BiointeractParser.canonical_interactors(ndex)['interactor_a'], {'ndex': ['CDH10', 'CDH-10']})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -4,6 +4,8 @@ Test classes for parsing protein interaction files.
 
 Author:  Greg Taylor (greg.k.taylor@gmail.com)
 """
+import io
+import json
 import os
 import unittest
 
@@ -36,3 +38,24 @@ class TestParserMethods(BITest):
 
         # Rudimentary check on the number of interactions
         self.assertGreater(len(ndex), 6500)
+
+    def test_ndex_aspect_order(self):
+        """
+        Parse a small CX document with the aspects in an unusual order
+        :return:
+        """
+        cx = [
+            {'nodeAttributes': [{'po': 1, 'n': 'type', 'v': 'protein'}, {'po': 2, 'n': 'type', 'v': 'protein'}]},
+            {'edges': [{'@id': 10, 's': 1, 't': 2, 'i': 'in-complex-with'},
+                       {'@id': 11, 's': 2, 't': 3, 'i': 'in-complex-with'},
+                       {'@id': 12, 's': 1, 't': 2, 'i': 'controls-state-change-of'}]},
+            {'numberVerification': [{'longNumber': 281474976710655}]},
+            {'nodes': [{'@id': 1, 'n': 'CDK2'}, {'@id': 2, 'n': 'CCNA2'}, {'@id': 3, 'n': 'CCNB1'}]}
+        ]
+        test_file = io.BytesIO(json.dumps(cx, indent=2).encode('utf-8'))
+        ndex = list(nDEXParser.parse_ndex_file(test_file))
+
+        # node 3 has no attributes, so only the first edge is kept
+        self.assertEqual(len(ndex), 1)
+        self.assertEqual(ndex[0]['_id'], 'ndex:1-ndex:2')
+        self.assertEqual(ndex[0]['ndex']['t'], {'@id': 2, 'n': 'CCNA2'})
@@ -0,0 +1,134 @@
+# -*- coding: utf-8 -*-
+"""
+Test classes for the response cache of the web api.
+
+Source Project:   biothings.interactions
+"""
+import unittest
+from concurrent.futures import Future
+
+from www.api.cache import IndexNames, ResponseCache
+
+
+class Clock(object):
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestResponseCache(unittest.TestCase):
+
+    def test_key(self):
+        """
+        Equivalent requests share a key
+        :return:
+        """
+        key = ResponseCache.make_key('QueryHandler', (), {'q': [b' CDK2 '], 'fields': [b'biogrid']})
+        self.assertEqual(key, ResponseCache.make_key('QueryHandler', (), {'fields': ['biogrid'], 'q': ['CDK2']}))
+        self.assertNotEqual(key, ResponseCache.make_key('Human_PpiHandler', (), {'fields': ['biogrid'], 'q': ['CDK2']}))
+        self.assertNotEqual(key, ResponseCache.make_key('QueryHandler', (), {'q': ['CDK2']}))
+
+    def test_lru(self):
+        cache = ResponseCache(max_size=2, ttl=60)
+        cache.put('a', 1)
+        cache.put('b', 2)
+        self.assertEqual(cache.get('a'), 1)
+        cache.put('c', 3)
+        # 'b' is the least recently used
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(cache.get('a'), 1)
+        self.assertEqual(cache.get('c'), 3)
+
+        metrics = cache.metrics()
+        self.assertEqual((metrics['hits'], metrics['misses'], metrics['evictions'], metrics['size']), (3, 1, 1, 2))
+        self.assertEqual(metrics['hit_ratio'], 0.75)
+
+    def test_ttl(self):
+        clock = Clock()
+        cache = ResponseCache(max_size=10, ttl=60, clock=clock)
+        cache.put('a', 1)
+        clock.now = 59
+        self.assertEqual(cache.get('a'), 1)
+        clock.now = 60
+        self.assertIsNone(cache.get('a'))
+        self.assertEqual(cache.metrics()['expirations'], 1)
+        self.assertEqual(cache.metrics()['size'], 0)
+
+    def test_disabled(self):
+        cache = ResponseCache(max_size=0)
+        cache.put('a', 1)
+        self.assertIsNone(cache.get('a'))
+
+    def test_generation(self):
+        """
+        The cache is cleared when the activated index changes, checked at most once per interval
+        :return:
+        """
+        clock = Clock()
+        cache = ResponseCache(max_size=10, ttl=600, clock=clock)
+        indices = ['interactions_20181001']
+        checks = []
+
+        def get_generation():
+            checks.append(clock.now)
+            return list(indices)
+
+        cache.check_generation(get_generation, 30)
+        cache.put('a', 1)
+        indices[0] = 'interactions_20181015'
+        clock.now = 10
+        cache.check_generation(get_generation, 30)
+        self.assertEqual(cache.get('a'), 1)
+
+        clock.now = 30
+        cache.check_generation(get_generation, 30)
+        self.assertIsNone(cache.get('a'))
+        self.assertEqual(checks, [0, 30])
+        self.assertEqual(cache.metrics()['invalidations'], 1)
+
+        # a failed check keeps the cached responses
+        def failed():
+            raise IOError("no connection")
+        cache.put('b', 2)
+        clock.now = 60
+        cache.check_generation(failed, 30)
+        self.assertEqual(cache.get('b'), 2)
+
+    def test_index_names(self):
+        """
+        Index names are looked up in the background at most once per ttl, the
+        names of the last lookup are returned meanwhile
+        :return:
+        """
+        clock = Clock()
+        futures = []
+
+        def submit(fn):
+            futures.append((Future(), fn))
+            return futures[-1][0]
+
+        names = IndexNames(lambda: ['interactions_20181001'], 30, submit, clock=clock)
+        self.assertIsNone(names.get())
+        self.assertIsNone(names.get())
+        self.assertEqual(len(futures), 1)
+        (future, fn) = futures[0]
+        future.set_result(fn())
+        self.assertEqual(names.get(), ['interactions_20181001'])
+
+        clock.now = 30
+        self.assertEqual(names.get(), ['interactions_20181001'])
+        self.assertEqual(len(futures), 2)
+        # a failed lookup keeps the last names
+        futures[1][0].set_exception(IOError("no connection"))
+        self.assertEqual(names.get(), ['interactions_20181001'])
+        self.assertEqual(len(futures), 2)
+        clock.now = 60
+        names.get()
+        self.assertEqual(len(futures), 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,120 @@
+# -*- coding: utf-8 -*-
+"""
+Test classes for parsing synthetic source files.
+
+Source Project:   biothings.interactions
+"""
+import io
+import os
+import shutil
+import tempfile
+
+from .bitest import BITest
+from hub.dataload.IdentifierCache import IdentifierCache
+from hub.dataload.sources.ctdchemgene.parser import CTDChemGeneParser
+from .benchmark import benchmark, parse_source
+from .synthetic import SyntheticData
+
+
+class TestSyntheticData(BITest):
+    """
+    Test class parsing the synthetic files of every source.  The number of
+    parsed documents is checked against the generated pairs.
+    """
+
+    data = SyntheticData(3000, duplicate_rate=0.2, hub_skew=1.2, genes=200, seed=7)
+
+    def _parse(self, source):
+        work_dir = tempfile.mkdtemp()
+        try:
+            path = os.path.join(work_dir, source + '.txt')
+            with open(path, 'w') as f:
+                self.data.write_source(source, f)
+            return list(parse_source(source, path, work_dir, max_records=500))
+        finally:
+            shutil.rmtree(work_dir)
+
+    def test_synthetic_pairs(self):
+        """
+        Generated pairs are reproducible, skewed towards hub genes and include duplicates
+        :return:
+        """
+        pairs = list(self.data.pairs())
+        self.assertEqual(pairs, list(self.data.pairs()))
+        self.assertEqual(len(pairs), 3000)
+        self.assertTrue(all(a != b for (i, a, b) in pairs))
+        self.assertLess(len(set((a, b) for (i, a, b) in pairs)), 2700)
+
+        genes = [a for (i, a, b) in pairs] + [b for (i, a, b) in pairs]
+        self.assertGreater(genes.count(0), 10 * genes.count(199))
+
+    def test_synthetic_biogrid(self):
+        result = self._parse('biogrid')
+        self.assertEqual(len(result), len(set(frozenset((a, b)) for (i, a, b) in self.data.pairs())))
+        self.assertEqual(self._list_count(result, 'biogrid', 'biogrid_interaction_id'), 3000)
+
+    def test_synthetic_hint(self):
+        work_dir = tempfile.mkdtemp()
+        try:
+            # seed the identifier cache used by parse_source from a synthetic idmapping file
+            mapping = os.path.join(work_dir, 'idmapping.dat')
+            with open(mapping, 'w') as f:
+                SyntheticData.write(f, self.data.uniprot_mapping_lines())
+            id_cache = IdentifierCache(os.path.join(work_dir, 'hint_ids.sqlite'), 'uniprot:entrezgene')
+            self.assertEqual(id_cache.load_mapping_file(mapping, id_type='GeneID'), 200)
+            id_cache.close()
+
+            path = os.path.join(work_dir, 'hint.txt')
+            with open(path, 'w') as f:
+                self.data.write_source('hint', f)
+            result = list(parse_source('hint', path, work_dir))
+        finally:
+            shutil.rmtree(work_dir)
+        self.assertEqual(len(result), len(set(frozenset((a, b)) for (i, a, b) in self.data.pairs())))
+
+    def test_synthetic_ctd(self):
+        result = self._parse('ctd')
+        self.assertEqual(len(result), len(set((a, b) for (i, a, b) in self.data.pairs())))
+
+    def test_synthetic_ctd_spill(self):
+        """
+        The spill mode of the CTD parser groups the records on disk into the same documents
+        :return:
+        """
+        work_dir = tempfile.mkdtemp()
+        try:
+            path = os.path.join(work_dir, 'ctd.txt')
+            with open(path, 'w') as f:
+                self.data.write_source('ctd', f)
+            in_memory = list(CTDChemGeneParser.parse_tsv_file(open(path, 'r')))
+            spilled = list(CTDChemGeneParser.parse_tsv_file(open(path, 'r'), spill=True, max_records=500,
+                                                            tmp_dir=work_dir))
+        finally:
+            shutil.rmtree(work_dir)
+        key = lambda doc: doc['_id']
+        self.assertEqual(sorted(spilled, key=key), sorted(in_memory, key=key))
+
+    def test_synthetic_disgenet(self):
+        result = self._parse('disgenet')
+        self.assertEqual(len(result), len(set((a, b) for (i, a, b) in self.data.pairs())))
+
+    def test_synthetic_cpd(self):
+        result = self._parse('cpd')
+        self.assertEqual(len(result), 3000)
+
+    def test_synthetic_ndex(self):
+        result = self._parse('ndex')
+        self.assertEqual(len(result), len([i for (i, a, b) in self.data.pairs() if i % 4]))
+
+    def test_benchmark(self):
+        """
+        The benchmark reports a measurement for each source
+        :return:
+        """
+        out = io.StringIO()
+        results = benchmark(['disgenet', 'cpd'], 500, out=out)
+        self.assertEqual([r['source'] for r in results], ['disgenet', 'cpd'])
+        self.assertEqual(results[1]['docs'], 500)
+        self.assertGreater(results[0]['peak_mb'], 0)
+        self.assertGreaterEqual(results[0]['parse_mb'], 0)
+        self.assertEqual(len(out.getvalue().splitlines()), 2)
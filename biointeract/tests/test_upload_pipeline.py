@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+"""
+Test classes for the upload pipeline overlapping parsing and storage.
+
+Source Project:   biothings.interactions
+"""
+import asyncio
+import time
+import unittest
+
+from hub.dataload.UploadPipeline import UploadPipeline
+
+
+class TestUploadPipeline(unittest.TestCase):
+
+    def _run(self, pipeline, defer=None):
+        loop = asyncio.new_event_loop()
+        try:
+            pipeline.loop = loop
+            return loop.run_until_complete(pipeline.run(defer=defer))
+        finally:
+            loop.close()
+
+    def _batches(self, count, delay=0.0, size=10):
+        for b in range(count):
+            time.sleep(delay)
+            yield [{'_id': '%d-%d' % (b, i)} for i in range(size)]
+
+    def test_pipeline_overlap(self):
+        """
+        Parsing and writing overlap, the upload takes about the longer of both
+        :return:
+        """
+        stored = []
+
+        def store(batch):
+            time.sleep(0.02)
+            stored.extend(batch)
+            return len(batch)
+
+        pipeline = UploadPipeline(lambda: self._batches(20, delay=0.02), store, queue_size=2)
+        self.assertEqual(self._run(pipeline), 200)
+        self.assertEqual(len(stored), 200)
+
+        metrics = pipeline.metrics()
+        self.assertEqual(metrics['batches'], 20)
+        self.assertEqual(metrics['docs'], 200)
+        self.assertLess(metrics['wall_s'], 0.8 * (metrics['parse_s'] + metrics['write_s']))
+        self.assertLessEqual(metrics['max_queue_depth'], 2)
+
+    def test_pipeline_stalls(self):
+        """
+        A slow storage stalls the parser on a full queue, a slow parser stalls the writers
+        :return:
+        """
+        slow_store = lambda batch: time.sleep(0.02) or len(batch)
+        pipeline = UploadPipeline(lambda: self._batches(10), slow_store, queue_size=2)
+        self._run(pipeline)
+        metrics = pipeline.metrics()
+        self.assertGreater(metrics['producer_stall_s'], metrics['consumer_stall_s'])
+        self.assertGreater(metrics['mean_queue_depth'], 1)
+
+        pipeline = UploadPipeline(lambda: self._batches(10, delay=0.02), len, queue_size=2)
+        self._run(pipeline)
+        metrics = pipeline.metrics()
+        self.assertGreater(metrics['consumer_stall_s'], metrics['producer_stall_s'])
+
+    def test_pipeline_writers(self):
+        """
+        Several writers store all batches, with the producer deferred by the caller
+        :return:
+        """
+        deferred = []
+
+        async def defer(func):
+            deferred.append(func)
+            return asyncio.get_event_loop().run_in_executor(None, func)
+
+        store = lambda batch: time.sleep(0.01) or len(batch)
+        pipeline = UploadPipeline(lambda: self._batches(30), store, writers=3)
+        self.assertEqual(self._run(pipeline, defer=defer), 300)
+        self.assertEqual(len(deferred), 1)
+        self.assertLess(pipeline.metrics()['wall_s'], 30 * 0.01)
+
+    def test_pipeline_failure(self):
+        """
+        A failed write stops the parser and is raised
+        :return:
+        """
+        produced = []
+
+        def produce():
+            for batch in self._batches(100):
+                produced.append(batch)
+                yield batch
+
+        def store(batch):
+            if batch[0]['_id'] == '3-0':
+                raise ValueError("write failed")
+            return len(batch)
+
+        pipeline = UploadPipeline(produce, store, queue_size=2)
+        with self.assertRaises(ValueError):
+            self._run(pipeline)
+        self.assertLess(len(produced), 100)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -50,6 +50,46 @@ class TestCPDStringMethods(unittest.TestCase):
 
         self.assertEqual(len(result_data['hits']['hits'][0]['_source'][ESResultTransformer.PpiFields.DBS]), 6)
 
+    def test_CPD_clean_legacy_response(self):
+        test_data = json.loads(self.test_result_json)
+        transformer = ESResultTransformer.__new__(ESResultTransformer)
+
+        result_data = transformer.clean_query_GET_response(test_data)
+
+        source = result_data['hits']['hits'][0]['_source']
+        self.assertEqual(source[ESResultTransformer.PpiFields.CONF], .82)
+        self.assertEqual(source[ESResultTransformer.PpiFields.PART], ['TRIO', 'BLMH'])
+        self.assertEqual(source[ESResultTransformer.PpiFields.PUBS], [16169070])
+        self.assertEqual(len(source[ESResultTransformer.PpiFields.DBS]), 6)
+
+    def test_CPD_clean_normalized_response(self):
+        # documents indexed by the hub are already typed and returned unchanged
+        test_data = json.loads(self.test_result_json)
+        test_data['hits']['hits'][0]['_source'] = {
+            ESResultTransformer.PpiFields.CONF: .82,
+            ESResultTransformer.PpiFields.PART: ['TRIO', 'BLMH'],
+            ESResultTransformer.PpiFields.PUBS: [16169070],
+            ESResultTransformer.PpiFields.DBS: ['IntAct', 'Biogrid']}
+        expected = json.loads(json.dumps(test_data))
+        transformer = ESResultTransformer.__new__(ESResultTransformer)
+
+        self.assertEqual(transformer.clean_query_GET_response(test_data), expected)
+
+    def test_CPD_clean_mixed_response(self):
+        # every hit is checked, missing fields are set to their default as by the parse_* methods
+        test_data = json.loads(self.test_result_json)
+        legacy = test_data['hits']['hits'][0]
+        typed = dict(legacy, _source={ESResultTransformer.PpiFields.PART: ['TRIO', 'BLMH']})
+        test_data['hits']['hits'] = [typed, legacy]
+        transformer = ESResultTransformer.__new__(ESResultTransformer)
+
+        (typed, legacy) = transformer.clean_query_GET_response(test_data)['hits']['hits']
+        self.assertEqual(typed['_source'], {ESResultTransformer.PpiFields.CONF: None,
+                                            ESResultTransformer.PpiFields.PART: ['TRIO', 'BLMH'],
+                                            ESResultTransformer.PpiFields.PUBS: [],
+                                            ESResultTransformer.PpiFields.DBS: []})
+        self.assertEqual(legacy['_source'][ESResultTransformer.PpiFields.PUBS], [16169070])
+
 
 
 
@@ -0,0 +1,186 @@
+# -*- coding: utf-8 -*-
+"""
+Batch lookups of the interactions of many genes or pairs.
+
+The gene neighborhood queries of a batch are sent as chunks of one
+Elasticsearch msearch each, the pairs as chunks of one mget each (see
+BatchHandler).  These functions build the requests of a chunk and turn
+the Elasticsearch responses into one result per queried gene or pair,
+in the order of the chunk.
+
+Settings (in config_www, all optional):
+    BATCH_MAX_ITEMS: maximum number of genes and pairs of a batch (100000)
+    BATCH_MAX_SIZE: maximum number of interactions returned per gene, larger sizes are
+                    clamped, must not exceed the index.max_result_window of the index (1000)
+    BATCH_MSEARCH_CHUNK: number of gene queries of an msearch (100)
+    BATCH_MGET_CHUNK: number of pairs of an mget (1000)
+    BATCH_CONCURRENCY: chunks of a batch queried at the same time (4)
+    BATCH_THREADS: threads querying Elasticsearch, shared by all batches and exports (8)
+"""
+import json
+import re
+
+# Separators of the genes, and of the pairs, of a batch
+ITEM_SEPARATOR = re.compile('[\\s,;]+')
+PAIR_SEPARATOR = re.compile('[\\n;]')
+# Separator of the identifiers of a pair
+ID_SEPARATOR = ','
+
+
+def check_list(value, name):
+    """
+    Raise ValueError unless a list argument is a string, a list or missing.
+    """
+    if value is not None and not isinstance(value, (str, list)):
+        raise ValueError("'{}' must be a string or a list.".format(name))
+
+
+def split_genes(value):
+    """
+    Split a list of genes given as a string, or return a list as is
+    (raises ValueError on another type).
+    :param value: string of genes separated by commas, semicolons or whitespace, or a list
+    :return: list of gene strings
+    """
+    check_list(value, 'genes')
+    if isinstance(value, list):
+        return [str(v).strip() for v in value if str(v).strip()]
+    return [v for v in ITEM_SEPARATOR.split(value or '') if v]
+
+
+def split_pairs(value):
+    """
+    Split a list of pairs given as a string, or return a list of pairs
+    (raises ValueError on another type).
+    :param value: string of 'a,b' pairs separated by semicolons or newlines, or a list
+                  of 'a,b' strings or [a, b] lists
+    :return: list of 'a,b' pair strings
+    """
+    check_list(value, 'pairs')
+    if isinstance(value, list):
+        pairs = [ID_SEPARATOR.join(map(str, p)) if isinstance(p, list) else str(p) for p in value]
+    else:
+        pairs = PAIR_SEPARATOR.split(value or '')
+    return [p.strip() for p in pairs if p.strip()]
+
+
+def hit_size(value, max_size, default=100):
+    """
+    Return the number of interactions returned per gene, clamped to 'max_size'
+    (raises ValueError on a negative or non-integer size).
+    :param value: the 'size' argument, a string or a number, default if missing
+    :param max_size: the maximum size
+    :return: the size
+    """
+    if value is None or value == '':
+        return min(default, max_size)
+    if isinstance(value, bool) or not isinstance(value, (str, int)) or \
+            (isinstance(value, str) and not value.strip().isdigit()) or int(value) < 0:
+        raise ValueError("'size' must be a non-negative integer.")
+    return min(int(value), max_size)
+
+
+def chunked(items, size):
+    """
+    Split a list into lists of at most 'size' items.
+    """
+    return [items[i:i + size] for i in range(0, len(items), size)]
+
+
+def is_gene(gene):
+    """
+    Return True if a gene is an entrez gene id.
+    """
+    return gene.isdigit()
+
+
+def neighborhood_query(gene, size, fields=None):
+    """
+    Return the search of the interactions of an entrez gene, as either interactor.
+    """
+    query = {
+        'query': {
+            'bool': {
+                'should': [
+                    {'term': {'interactor_a.entrezgene': gene}},
+                    {'term': {'interactor_b.entrezgene': gene}}
+                ]
+            }
+        },
+        'size': size
+    }
+    if fields:
+        query['_source'] = fields
+    return query
+
+
+def msearch_body(genes, size, fields=None):
+    """
+    Return the msearch body of the neighborhood queries of a chunk of genes,
+    invalid genes are skipped.
+    """
+    lines = []
+    for gene in filter(is_gene, genes):
+        lines.extend(['{}', json.dumps(neighborhood_query(int(gene), size, fields))])
+    return '\n'.join(lines) + '\n'
+
+
+def neighborhood_results(genes, responses):
+    """
+    Return the result of each gene of a chunk from the msearch responses.
+    :param genes: the genes of the chunk
+    :param responses: the 'responses' list of the msearch result, one per valid gene
+    :return: list of {'query', 'total', 'hits'} results, or {'query', 'error'}
+    """
+    results = []
+    responses = iter(responses)
+    for gene in genes:
+        if not is_gene(gene):
+            results.append({'query': gene, 'error': "Invalid entrezgene", 'notfound': True})
+            continue
+        response = next(responses)
+        if 'error' in response:
+            results.append({'query': gene, 'error': response['error']})
+            continue
+        hits = [dict(hit.get('_source', {}), _id=hit['_id']) for hit in response['hits']['hits']]
+        total = response['hits']['total']
+        if isinstance(total, dict):
+            total = total['value']
+        results.append({'query': gene, 'total': total, 'hits': hits})
+    return results
+
+
+def pair_results(pairs, ids, docs):
+    """
+    Return the result of each pair of a chunk from the mget documents.
+    :param pairs: the pair strings of the chunk
+    :param ids: the _id of each pair, None for an invalid pair
+    :param docs: the 'docs' list of the mget result
+    :return: list of the found documents with their query, or not found entries
+    """
+    found = dict((doc['_id'], doc.get('_source', {})) for doc in docs if doc.get('found'))
+    results = []
+    for (pair, _id) in zip(pairs, ids):
+        if _id is None:
+            results.append({'query': pair, 'error': "Invalid pair", 'notfound': True})
+        elif _id in found:
+            doc = {'query': pair, '_id': _id}
+            doc.update(found[_id])
+            results.append(doc)
+        else:
+            results.append({'query': pair, '_id': _id, 'notfound': True})
+    return results
+
+
+def ndjson(results):
+    """
+    Serialize results as newline-delimited JSON.
+    """
+    return ''.join(json.dumps(r) + '\n' for r in results)
+
+
+def chunk_errors(queries, error):
+    """
+    Return the error result of each query of a chunk that failed.
+    """
+    return [{'query': query, 'error': "{0}".format(error)} for query in queries]
@@ -0,0 +1,187 @@
+# -*- coding: utf-8 -*-
+"""
+In-process cache of the api responses.
+
+Responses of the annotation and query endpoints are kept in a size-bounded
+LRU cache, keyed by the endpoint and its normalized request arguments, and
+expire after a TTL.  The cache is cleared when the index behind the web
+alias changes, i.e. when a new index build is activated.  The names of
+the indices behind the alias are looked up in the background (see
+IndexNames), so that requests never wait for Elasticsearch to be served
+from the cache.
+
+Settings (in config_www, all optional):
+    RESPONSE_CACHE_SIZE: maximum number of responses, 0 disables the cache (10000)
+    RESPONSE_CACHE_TTL: seconds a response is served from the cache (600)
+    RESPONSE_CACHE_INDEX_CHECK: seconds between lookups of the activated index (30)
+"""
+from collections import OrderedDict
+import logging
+import time
+
+
+class ResponseCache(object):
+
+    # Default maximum number of cached responses
+    MAX_SIZE = 10000
+    # Default time to live of a cached response, in seconds
+    TTL = 600
+
+    def __init__(self, max_size=None, ttl=None, clock=time.monotonic):
+        """
+        Create a cache.
+        :param max_size: maximum number of cached responses
+        :param ttl: seconds a cached response is valid
+        :param clock: function returning the current time in seconds
+        """
+        self.max_size = ResponseCache.MAX_SIZE if max_size is None else max_size
+        self.ttl = ResponseCache.TTL if ttl is None else ttl
+        self.clock = clock
+        self.entries = OrderedDict()
+        self.generation = None
+        self.checked_at = None
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    @staticmethod
+    def make_key(endpoint, path_args, query_arguments):
+        """
+        Build the cache key of a request.  Argument names are sorted and their
+        values stripped, so that equivalent requests share a key.
+        :param endpoint: the handler name
+        :param path_args: tuple of the path arguments, e.g. the annotation id
+        :param query_arguments: dictionary of argument name to list of values (str or bytes)
+        :return: the key
+        """
+        args = []
+        for name in sorted(query_arguments):
+            values = [v.decode('utf-8') if isinstance(v, bytes) else v for v in query_arguments[name]]
+            args.append((name, tuple(v.strip() for v in values)))
+        return endpoint, tuple(a.strip() if isinstance(a, str) else a for a in path_args), tuple(args)
+
+    def get(self, key):
+        """
+        Return the cached response of a key, None if not cached or expired.
+        """
+        entry = self.entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        (expires, response) = entry
+        if self.clock() >= expires:
+            del self.entries[key]
+            self.expirations += 1
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return response
+
+    def put(self, key, response):
+        """
+        Cache the response of a key, evicting the least recently used responses
+        over the maximum size.
+        """
+        if self.max_size <= 0:
+            return
+        self.entries[key] = (self.clock() + self.ttl, response)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+
+    def invalidate(self):
+        """
+        Drop all cached responses.
+        """
+        if self.entries:
+            logging.info("Invalidating {} cached responses".format(len(self.entries)))
+        self.entries.clear()
+        self.invalidations += 1
+
+    def check_generation(self, get_generation, interval):
+        """
+        Invalidate the cache when the generation of the data changes, e.g. the
+        index activated behind the web alias.  The generation is checked at most
+        every 'interval' seconds.
+        :param get_generation: function returning the current generation
+        :param interval: seconds between checks
+        """
+        now = self.clock()
+        if self.checked_at is not None and now - self.checked_at < interval:
+            return
+        self.checked_at = now
+        try:
+            generation = get_generation()
+        except Exception as e:
+            logging.warning("Could not check the activated index: {}".format(e))
+            return
+        if generation != self.generation:
+            if self.generation is not None:
+                self.invalidate()
+            self.generation = generation
+
+    def metrics(self):
+        """
+        Return the cache metrics.
+        :return: dictionary of metrics
+        """
+        requests = self.hits + self.misses
+        return {
+            'size': len(self.entries),
+            'max_size': self.max_size,
+            'ttl': self.ttl,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_ratio': round(self.hits / requests, 4) if requests else 0.0,
+            'evictions': self.evictions,
+            'expirations': self.expirations,
+            'invalidations': self.invalidations
+        }
+
+
+class IndexNames(object):
+    """
+    Names of the indices behind an alias, looked up in the background at most
+    every 'ttl' seconds.  The names of the last lookup are returned meanwhile.
+    """
+
+    def __init__(self, lookup, ttl, submit, clock=time.monotonic):
+        """
+        Create the names of an alias.
+        :param lookup: function returning the names of the indices
+        :param ttl: seconds between lookups
+        :param submit: function running the lookup in the background, returning a
+                       concurrent.futures.Future
+        :param clock: function returning the current time in seconds
+        """
+        self.lookup = lookup
+        self.ttl = ttl
+        self.submit = submit
+        self.clock = clock
+        self.names = None
+        self.looked_up_at = None
+        self.pending = None
+
+    def get(self):
+        """
+        Return the names of the last lookup, None before the first lookup ended,
+        starting a new lookup once the names are older than the ttl.
+        """
+        now = self.clock()
+        if self.pending is None and (self.looked_up_at is None or now - self.looked_up_at >= self.ttl):
+            self.looked_up_at = now
+            self.pending = self.submit(self.lookup)
+            self.pending.add_done_callback(self.done)
+        return self.names
+
+    def done(self, future):
+        try:
+            self.names = future.result()
+        except Exception as e:
+            logging.warning("Could not look up the activated index: {}".format(e))
+        finally:
+            self.pending = None
@@ -0,0 +1,143 @@
+# -*- coding: utf-8 -*-
+"""
+Export of the whole interaction index.
+
+The index is walked in pages with a scroll in index order, or with
+search_after on the shard order of a point in time when the cluster supports
+it (sorting on _id would need fielddata on _id, disabled on recent clusters).
+Only one page is held in memory at a time, so that an export runs in
+constant memory whatever its size (see ExportHandler).
+
+Settings (in config_www, all optional):
+    EXPORT_PAGE_SIZE: documents of a search_after page (1000)
+    EXPORT_POINT_IN_TIME: walk a point in time of the index, Elasticsearch 7.10+ (False)
+    EXPORT_KEEP_ALIVE: keep alive of the scroll or point in time between pages ('5m')
+"""
+import json
+import re
+import zlib
+
+# Source filters are the top-level field of each source in the documents
+SOURCE_NAME = re.compile('^\\w+$')
+
+
+def split_list(value):
+    """
+    Split a comma separated argument.
+    """
+    return [v.strip() for v in (value or '').split(',') if v.strip()]
+
+
+def source_filter(sources):
+    """
+    Return the query of the documents with data from any of the sources
+    (raises ValueError on an invalid source name).
+    :param sources: list of source names, e.g. ['biogrid', 'hint']
+    :return: the query
+    """
+    if not sources:
+        return {'match_all': {}}
+    for source in sources:
+        if not SOURCE_NAME.match(source):
+            raise ValueError("Invalid source '{}'".format(source))
+    return {
+        'bool': {
+            'should': [{'exists': {'field': source}} for source in sources],
+            'minimum_should_match': 1
+        }
+    }
+
+
+def export_body(query, size, fields=None, pit=None):
+    """
+    Return the body of the first search of an export.
+    :param query: the query of the exported documents
+    :param size: documents per page
+    :param fields: list of the fields of the documents, all if None
+    :param pit: {'id', 'keep_alive'} of a point in time, the search is a scroll in index order otherwise
+    :return: the search body
+    """
+    body = {
+        'query': query,
+        'size': size,
+        'sort': [{'_shard_doc': 'asc'}] if pit else ['_doc']
+    }
+    if fields:
+        body['_source'] = fields
+    if pit:
+        body['pit'] = dict(pit)
+    return body
+
+
+def search_after_pages(search, body):
+    """
+    Walk the results of a search page by page.  The body is updated between
+    pages with the sort values of the last hit, and the id of the point in time
+    when the search returns a new one.
+    :param search: function returning the response of a search body
+    :param body: the search body, sorted on a unique key
+    :return: yields the hits of each page
+    """
+    while True:
+        res = search(body)
+        hits = res['hits']['hits']
+        if not hits:
+            return
+        yield hits
+        if len(hits) < body['size']:
+            return
+        body['search_after'] = hits[-1]['sort']
+        if 'pit' in body and res.get('pit_id'):
+            body['pit']['id'] = res['pit_id']
+
+
+def scroll_pages(search, scroll, clear, body):
+    """
+    Walk the results of a scroll page by page.  The scroll is cleared once
+    walked, or when the walk is closed before its end.
+    :param search: function returning the response of the first search of the scroll
+    :param scroll: function returning the next response of a scroll id
+    :param clear: function clearing a scroll id
+    :param body: the search body
+    :return: yields the hits of each page
+    """
+    res = search(body)
+    scroll_id = res.get('_scroll_id')
+    try:
+        while res['hits']['hits']:
+            yield res['hits']['hits']
+            res = scroll(scroll_id)
+            scroll_id = res.get('_scroll_id') or scroll_id
+    finally:
+        if scroll_id:
+            clear(scroll_id)
+
+
+def ndjson_lines(hits):
+    """
+    Serialize the documents of a page as newline-delimited JSON.
+    """
+    return ''.join(json.dumps(dict(hit.get('_source', {}), _id=hit['_id'])) + '\n' for hit in hits)
+
+
+class GzipStream(object):
+    """
+    Incremental gzip compression of a stream of chunks.
+    """
+
+    def __init__(self, level=6):
+        self.compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    def compress(self, data):
+        """
+        Return the compressed bytes available after a chunk, possibly empty.
+        """
+        if isinstance(data, str):
+            data = data.encode('utf-8')
+        return self.compressor.compress(data) + self.compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self):
+        """
+        Return the end of the gzip stream.
+        """
+        return self.compressor.flush(zlib.Z_FINISH)
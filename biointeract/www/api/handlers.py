@@ -1,19 +1,350 @@
 # -*- coding: utf-8 -*-
+from concurrent.futures import ThreadPoolExecutor
 from enum import Enum
+from functools import partial
 
 from biothings.web.api.es.handlers import BiothingHandler
+from biothings.web.api.es.handlers.base_handler import BaseESRequestHandler
 from biothings.web.api.es.handlers import MetadataHandler
 from biothings.web.api.es.handlers import QueryHandler
 from biothings.web.api.es.handlers import StatusHandler
+from hub.dataload.BiointeractParser import BiointeractParser
+from tornado import gen
+from tornado.concurrent import Future, chain_future
+from www.api import batch
+from www.api import export
+from www.api.cache import IndexNames, ResponseCache
+import json
 import logging
 
-class Human_PpiHandler(BiothingHandler):
+# Responses of the annotation and query endpoints, shared by all requests
+response_cache = None
+
+def get_response_cache(web_settings):
+    ''' Return the response cache, created from the web settings on first use. '''
+    global response_cache
+    if response_cache is None:
+        response_cache = ResponseCache(max_size=getattr(web_settings, 'RESPONSE_CACHE_SIZE', None),
+                                       ttl=getattr(web_settings, 'RESPONSE_CACHE_TTL', None))
+    return response_cache
+
+# Threads querying Elasticsearch for the batch and export endpoints, shared by all requests
+batch_executor = None
+
+def get_batch_executor(web_settings):
+    ''' Return the batch executor, created from the web settings on first use. '''
+    global batch_executor
+    if batch_executor is None:
+        batch_executor = ThreadPoolExecutor(max_workers=getattr(web_settings, 'BATCH_THREADS', 8))
+    return batch_executor
+
+def run_in_executor(executor, fn, *args):
+    ''' Run a function in an executor, returning a future the IOLoop can wait for. '''
+    future = Future()
+    chain_future(executor.submit(fn, *args), future)
+    return future
+
+def activated_indices(web_settings):
+    ''' Return the names of the indices behind the web index alias, they change when a build is activated. '''
+    return sorted(web_settings.es_client.indices.get_alias(index=web_settings.ES_INDEX).keys())
+
+# Names of the activated indices, looked up in the batch executor
+index_names = None
+
+def get_index_names(web_settings):
+    ''' Return the activated index names, created from the web settings on first use. '''
+    global index_names
+    if index_names is None:
+        index_names = IndexNames(partial(activated_indices, web_settings),
+                                 getattr(web_settings, 'RESPONSE_CACHE_INDEX_CHECK', 30),
+                                 get_batch_executor(web_settings).submit)
+    return index_names
+
+class CachedResponseMixin(object):
+    ''' Serve GET requests from the response cache, caching successful responses. '''
+    # Requests with these arguments are stateful and never cached
+    uncached_args = ()
+    cache_key = None
+
+    def get(self, *args):
+        cache = get_response_cache(self.web_settings)
+        if cache.max_size <= 0 or any(arg in self.request.query_arguments for arg in self.uncached_args):
+            return super(CachedResponseMixin, self).get(*args)
+
+        # the index names are looked up in the background, comparing them is cheap
+        cache.check_generation(get_index_names(self.web_settings).get, 0)
+        key = cache.make_key(self.__class__.__name__, args, self.request.query_arguments)
+        cached = cache.get(key)
+        if cached is not None:
+            (data, _format) = cached
+            self._return_data_and_track(data, _format=_format)
+            return
+        self.cache_key = key
+        return super(CachedResponseMixin, self).get(*args)
+
+    def return_object(self, data, encode=True, indent=None, status_code=200, _format='json'):
+        if self.cache_key is not None and status_code == 200:
+            get_response_cache(self.web_settings).put(self.cache_key, (data, _format))
+        return super(CachedResponseMixin, self).return_object(data, encode=encode, indent=indent,
+                                                              status_code=status_code, _format=_format)
+
+class Human_PpiHandler(CachedResponseMixin, BiothingHandler):
     ''' This class is for the /human_ppi endpoint. '''
     pass
 
-class QueryHandler(QueryHandler):
+class PairHandler(Human_PpiHandler):
+    ''' This class is for the /pair endpoint, looking up interactions by the _id of a pair of identifiers.
+
+    GET ?a=1017&b=1018 returns the interaction of two identifiers given in any order, with a direct
+    get of its _id.  Identifiers are entrez genes unless given as curies ('mesh:D003920') or with
+    their curie_a/curie_b types.  POST pairs='1017,1018;1017,mesh:D003920' returns the interactions
+    of many pairs, in order, with a single multi-get.
+    '''
+
+    @staticmethod
+    def split_curie(identifier, curie=None):
+        identifier = identifier.strip()
+        if curie:
+            return curie.strip(), identifier
+        if ':' in identifier:
+            return tuple(identifier.split(':', 1))
+        return 'entrezgene', identifier
+
+    @staticmethod
+    def pair_id(a, b, curie_a=None, curie_b=None):
+        ''' Return the _id of the interaction of a pair, as set by the parsers (raises ValueError). '''
+        (curie_a, id_a) = PairHandler.split_curie(a, curie_a)
+        (curie_b, id_b) = PairHandler.split_curie(b, curie_b)
+        return BiointeractParser.pair_id(curie_a, id_a, curie_b, id_b)
+
+    @staticmethod
+    def pair_ids(pairs):
+        ''' Return the _id of each 'a,b' pair, None for an invalid pair. '''
+        ids = []
+        for pair in pairs:
+            try:
+                (a, b) = pair.split(batch.ID_SEPARATOR)
+                ids.append(PairHandler.pair_id(a, b))
+            except ValueError:
+                ids.append(None)
+        return ids
+
+    def get(self):
+        a = self.get_argument('a', None)
+        b = self.get_argument('b', None)
+        if not a or not b:
+            self.return_object({'success': False, 'error': "Parameters 'a' and 'b' are required."}, status_code=400)
+            return
+        try:
+            bid = self.pair_id(a, b, self.get_argument('curie_a', None), self.get_argument('curie_b', None))
+        except ValueError as e:
+            self.return_object({'success': False, 'error': "{0}".format(e)}, status_code=400)
+            return
+        return super(PairHandler, self).get(bid)
+
+    def post(self):
+        pairs = batch.split_pairs(self.get_argument('pairs', ''))
+        max_pairs = getattr(self.web_settings, 'LIST_SIZE_CAP', 1000)
+        if not pairs or len(pairs) > max_pairs:
+            error = "Missing required parameters." if not pairs else \
+                "At most {} pairs are allowed, use /batch for more.".format(max_pairs)
+            self._return_data_and_track({'success': False, 'error': error},
+                                        ga_event_data={'qsize': len(pairs)}, status_code=400)
+            return
+
+        ids = self.pair_ids(pairs)
+        fields = self.get_argument('fields', None)
+        kwargs = {'_source': [f.strip() for f in fields.split(',')] if fields else True}
+        docs = []
+        unique_ids = sorted(set(_id for _id in ids if _id))
+        if unique_ids:
+            res = self.web_settings.es_client.mget(body={'ids': unique_ids}, index=self.web_settings.ES_INDEX,
+                                                   doc_type=self.web_settings.ES_DOC_TYPE, **kwargs)
+            docs = res['docs']
+        self._return_data_and_track(batch.pair_results(pairs, ids, docs), ga_event_data={'qsize': len(pairs)})
+
+class BatchHandler(BaseESRequestHandler):
+    ''' This class is for the /batch endpoint, returning the interactions of many genes or pairs.
+
+    POST genes='1017,1018,...' returns the interactions of each entrez gene (its neighborhood, at
+    most 'size' interactions per gene), POST pairs='1017,1018;1017,1019' the interaction of each
+    pair, or both.  Arguments are form fields or a JSON object with the same keys, genes and pairs
+    may then be lists.  Genes are queried in chunks of one msearch, pairs in chunks of one mget,
+    with a bounded number of chunks in flight.  Results are streamed as newline-delimited JSON,
+    one line per gene or pair with its 'query', in the order the chunks complete.
+    '''
+
+    def batch_arguments(self):
+        ''' Return the arguments of the request, from its JSON body or form (raises ValueError). '''
+        if self.request.headers.get('Content-Type', '').startswith('application/json'):
+            args = json.loads(self.request.body.decode('utf-8'))
+            if not isinstance(args, dict):
+                raise ValueError("The request body must be a JSON object.")
+            return args
+        return dict((name, self.get_argument(name)) for name in ('genes', 'pairs', 'size', 'fields')
+                    if self.get_argument(name, None) is not None)
+
+    def search_genes(self, genes, size, fields):
+        ''' Query the neighborhood of a chunk of genes with one msearch. '''
+        body = batch.msearch_body(genes, size, fields)
+        responses = []
+        if body.strip():
+            responses = self.web_settings.es_client.msearch(body=body, index=self.web_settings.ES_INDEX,
+                                                            doc_type=self.web_settings.ES_DOC_TYPE)['responses']
+        return batch.neighborhood_results(genes, responses)
+
+    def get_pairs(self, pairs, fields):
+        ''' Query the interactions of a chunk of pairs with one mget. '''
+        ids = PairHandler.pair_ids(pairs)
+        docs = []
+        unique_ids = sorted(set(_id for _id in ids if _id))
+        if unique_ids:
+            docs = self.web_settings.es_client.mget(body={'ids': unique_ids}, index=self.web_settings.ES_INDEX,
+                                                    doc_type=self.web_settings.ES_DOC_TYPE,
+                                                    _source=fields or True)['docs']
+        return batch.pair_results(pairs, ids, docs)
+
+    @staticmethod
+    def run_chunk(query, chunk, *args):
+        try:
+            return query(chunk, *args)
+        except Exception as e:
+            logging.warning("Batch chunk failed: {}".format(e))
+            return batch.chunk_errors(chunk, e)
+
+    @gen.coroutine
+    def post(self):
+        try:
+            args = self.batch_arguments()
+            genes = batch.split_genes(args.get('genes'))
+            pairs = batch.split_pairs(args.get('pairs'))
+            size = batch.hit_size(args.get('size'), getattr(self.web_settings, 'BATCH_MAX_SIZE', 1000))
+        except ValueError as e:
+            self._return_data_and_track({'success': False, 'error': "{0}".format(e)},
+                                        ga_event_data={'qsize': 0}, status_code=400)
+            return
+        qsize = len(genes) + len(pairs)
+        max_items = getattr(self.web_settings, 'BATCH_MAX_ITEMS', 100000)
+        if not qsize or qsize > max_items:
+            error = "Missing required parameters." if not qsize else \
+                "At most {} genes and pairs are allowed.".format(max_items)
+            self._return_data_and_track({'success': False, 'error': error},
+                                        ga_event_data={'qsize': qsize}, status_code=400)
+            return
+        fields = args.get('fields')
+        if isinstance(fields, str):
+            fields = [f.strip() for f in fields.split(',') if f.strip()]
+
+        chunks = [partial(self.run_chunk, self.search_genes, chunk, size, fields)
+                  for chunk in batch.chunked(genes, getattr(self.web_settings, 'BATCH_MSEARCH_CHUNK', 100))]
+        chunks += [partial(self.run_chunk, self.get_pairs, chunk, fields)
+                   for chunk in batch.chunked(pairs, getattr(self.web_settings, 'BATCH_MGET_CHUNK', 1000))]
+        chunks.reverse()
+
+        executor = get_batch_executor(self.web_settings)
+        submit = lambda: run_in_executor(executor, chunks.pop())
+        self.set_header('Content-Type', 'application/x-ndjson; charset=UTF-8')
+        pending = [submit() for _ in range(min(getattr(self.web_settings, 'BATCH_CONCURRENCY', 4), len(chunks)))]
+        while pending:
+            waiter = gen.WaitIterator(*pending)
+            results = yield waiter.next()
+            pending.remove(waiter.current_future)
+            if chunks:
+                pending.append(submit())
+            self.write(batch.ndjson(results))
+            yield self.flush()
+        self.ga_track(event=self.ga_event_object({'qsize': qsize}))
+
+class ExportHandler(BaseESRequestHandler):
+    ''' This class is for the /export endpoint, streaming the whole interaction set.
+
+    GET /export returns every document of the index as newline-delimited JSON, walking the index
+    with a scroll, or search_after on a point in time, one page at a time, so that server memory
+    stays constant.  'fields' projects
+    the documents, 'sources=biogrid,hint' keeps the interactions of any of these sources, and
+    'gzip=true' returns the stream gzip-compressed.
+    '''
+
+    def search(self, body, **kwargs):
+        if 'pit' in body:
+            return self.web_settings.es_client.search(body=body)
+        return self.web_settings.es_client.search(body=body, index=self.web_settings.ES_INDEX,
+                                                  doc_type=self.web_settings.ES_DOC_TYPE, **kwargs)
+
+    def scroll(self, scroll_id, keep_alive):
+        return self.web_settings.es_client.scroll(scroll_id=scroll_id, scroll=keep_alive)
+
+    def clear_scroll(self, scroll_id):
+        try:
+            self.web_settings.es_client.clear_scroll(scroll_id=scroll_id)
+        except Exception as e:
+            logging.warning("Could not clear the export scroll: {}".format(e))
+
+    @gen.coroutine
+    def get(self):
+        try:
+            query = export.source_filter(export.split_list(self.get_argument('sources', None)))
+        except ValueError as e:
+            self._return_data_and_track({'success': False, 'error': "{0}".format(e)},
+                                        ga_event_data={'total': 0}, status_code=400)
+            return
+        fields = export.split_list(self.get_argument('fields', None))
+        compress = self.get_argument('gzip', 'false').lower() in ('1', 'true', 'yes')
+
+        es_client = self.web_settings.es_client
+        executor = get_batch_executor(self.web_settings)
+        pit = None
+        keep_alive = getattr(self.web_settings, 'EXPORT_KEEP_ALIVE', '5m')
+        if getattr(self.web_settings, 'EXPORT_POINT_IN_TIME', False):
+            res = yield run_in_executor(executor, partial(es_client.open_point_in_time,
+                                                          index=self.web_settings.ES_INDEX, keep_alive=keep_alive))
+            pit = {'id': res['id'], 'keep_alive': keep_alive}
+        body = export.export_body(query, getattr(self.web_settings, 'EXPORT_PAGE_SIZE', 1000), fields, pit)
+        if pit:
+            pages = export.search_after_pages(self.search, body)
+        else:
+            pages = export.scroll_pages(partial(self.search, scroll=keep_alive),
+                                        partial(self.scroll, keep_alive=keep_alive), self.clear_scroll, body)
+
+        gzip = export.GzipStream() if compress else None
+        if gzip:
+            self.set_header('Content-Type', 'application/gzip')
+            self.set_header('Content-Disposition', 'attachment; filename="interactions.ndjson.gz"')
+        else:
+            self.set_header('Content-Type', 'application/x-ndjson; charset=UTF-8')
+        total = 0
+        try:
+            while True:
+                hits = yield run_in_executor(executor, next, pages, None)
+                if hits is None:
+                    break
+                lines = export.ndjson_lines(hits)
+                self.write(gzip.compress(lines) if gzip else lines)
+                yield self.flush()
+                total += len(hits)
+            if gzip:
+                self.write(gzip.finish())
+        except Exception as e:
+            logging.error("Export failed after {} documents: {}".format(total, e))
+            if not total:
+                self.clear_header('Content-Disposition')
+                self._return_data_and_track({'success': False, 'error': "{0}".format(e)},
+                                            ga_event_data={'total': 0}, status_code=500)
+                return
+            # headers are sent with the first page, the stream can only be cut short
+        finally:
+            # clears the scroll of an export cut short
+            pages.close()
+            if pit:
+                try:
+                    es_client.close_point_in_time(body={'id': body['pit']['id']})
+                except Exception as e:
+                    logging.warning("Could not close the export point in time: {}".format(e))
+        self.ga_track(event=self.ga_event_object({'total': total}))
+
+class QueryHandler(CachedResponseMixin, QueryHandler):
     ''' This class is for the /query endpoint. '''
-    pass
+    uncached_args = ('scroll_id', 'fetch_all')
 
 class StatusHandler(StatusHandler):
     ''' This class is for the /status endpoint. '''
@@ -25,4 +356,9 @@ class StatusHandler(StatusHandler):
 
 class MetadataHandler(MetadataHandler):
     ''' This class is for the /metadata endpoint. '''
-    pass
+
+    def _pre_finish_GET_hook(self, options, res):
+        # hit/miss metrics of the response cache
+        if not self.request.path.endswith('fields') and isinstance(res, dict):
+            res['response_cache'] = get_response_cache(self.web_settings).metrics()
+        return res
@@ -14,14 +14,38 @@ class ESResultTransformer(ESResultTransformer):
         PUBS = 'interaction_publications'
         DBS = 'source_databases'
 
+    # *****************************************************************************
+    # Conversions of the string values of legacy indices, the hub indexes
+    # these fields already typed (see CPDParser)
+    # *****************************************************************************
+    @staticmethod
+    def to_confidence(val):
+        return None if (val == "NA" or val == '') else float(val)
+
+    @staticmethod
+    def to_participants(val):
+        return val.replace("_HUMAN", "").split(',')
+
+    @staticmethod
+    def to_publications(val):
+        pubs_strs = val.split(',')
+        try:
+            return list(map(int, pubs_strs))
+        except ValueError:
+            logging.warning("Publication Entry for this query is not valid - {}".format(pubs_strs))
+            return []
+
+    @staticmethod
+    def to_databases(val):
+        return val.split(',')
+
     # *****************************************************************************
     # Safe parse for interaction_confidence
     # *****************************************************************************
     @staticmethod
     def parse_confidence(res, i, hit):
         if ESResultTransformer.PpiFields.CONF in hit['_source']:
-            val = hit['_source'][ESResultTransformer.PpiFields.CONF]
-            val = None if (val == "NA" or val == '') else float(val)
+            val = ESResultTransformer.to_confidence(hit['_source'][ESResultTransformer.PpiFields.CONF])
             res['hits']['hits'][i]['_source'][ESResultTransformer.PpiFields.CONF] = val
         else:
             logging.warning("Field interaction_confidence not returned for this entry.".format(hit['_source']))
@@ -35,8 +59,8 @@ class ESResultTransformer(ESResultTransformer):
     def parse_participants(res, i, hit):
         # participants - list of strings
         if ESResultTransformer.PpiFields.PART in hit['_source']:
-            val = hit['_source'][ESResultTransformer.PpiFields.PART].replace("_HUMAN", "")
-            res['hits']['hits'][i]['_source'][ESResultTransformer.PpiFields.PART] = [val] if ',' not in val else val.split(',')
+            val = ESResultTransformer.to_participants(hit['_source'][ESResultTransformer.PpiFields.PART])
+            res['hits']['hits'][i]['_source'][ESResultTransformer.PpiFields.PART] = val
         else:
             logging.warning("Field interaction_participants not returned for this entry - {}".format(hit['_source']))
             res['hits']['hits'][i]['_source'][ESResultTransformer.PpiFields.PART] = []
@@ -49,14 +73,8 @@ class ESResultTransformer(ESResultTransformer):
     def parse_publications(res, i, hit):
         # publications - list of integers
         if ESResultTransformer.PpiFields.PUBS in hit['_source']:
-            val = hit['_source'][ESResultTransformer.PpiFields.PUBS]
-            pubs_strs = [val] if ',' not in val else val.split(',')
-            try:
-                pubs_ints = list(map(int, pubs_strs))
-            except ValueError:
-                pubs_ints = []
-                logging.warning("Publication Entry for this query is not valid - {}".format(pubs_strs))
-            res['hits']['hits'][i]['_source'][ESResultTransformer.PpiFields.PUBS] = pubs_ints
+            val = ESResultTransformer.to_publications(hit['_source'][ESResultTransformer.PpiFields.PUBS])
+            res['hits']['hits'][i]['_source'][ESResultTransformer.PpiFields.PUBS] = val
         else:
             logging.warning("Field interaction_publications not returned for this entry - {}".format(hit['_source']))
             res['hits']['hits'][i]['_source'][ESResultTransformer.PpiFields.PUBS] = []
@@ -69,22 +87,63 @@ class ESResultTransformer(ESResultTransformer):
     def parse_databases(res, i, hit):
         # databases - list of strings
         if ESResultTransformer.PpiFields.DBS in hit['_source']:
-            val = hit['_source'][ESResultTransformer.PpiFields.DBS]
-            res['hits']['hits'][i]['_source'][ESResultTransformer.PpiFields.DBS] = [val] if ',' not in val else val.split(',')
+            val = ESResultTransformer.to_databases(hit['_source'][ESResultTransformer.PpiFields.DBS])
+            res['hits']['hits'][i]['_source'][ESResultTransformer.PpiFields.DBS] = val
         else:
             logging.warning("Field source_databases not returned for this entry - {}".format(hit['_source']))
             res['hits']['hits'][i]['_source'][ESResultTransformer.PpiFields.DBS] = []
         return res
 
+    # *****************************************************************************
+    # Per-field conversions of the legacy index, with the value of a missing field
+    # *****************************************************************************
+    LEGACY_FIELDS = [
+        (PpiFields.CONF, 'to_confidence', None),
+        (PpiFields.PART, 'to_participants', []),
+        (PpiFields.PUBS, 'to_publications', []),
+        (PpiFields.DBS, 'to_databases', [])
+    ]
+
+    @staticmethod
+    def is_normalized(hit):
+        """
+        Return True if all the PPI fields of a hit are returned, indexed typed.
+        Hits with a legacy string value or a missing field need normalizing.
+        """
+        source = hit.get('_source', {})
+        return all(field in source and not isinstance(source[field], str)
+                   for (field, _, _) in ESResultTransformer.LEGACY_FIELDS)
+
+    @staticmethod
+    def compile_normalizer():
+        """
+        Return a function converting the PPI fields of a legacy hit source in place.
+        Fields already typed are kept, missing fields are set to their default.
+        """
+        fields = [(field, getattr(ESResultTransformer, name), default)
+                  for (field, name, default) in ESResultTransformer.LEGACY_FIELDS]
+
+        def normalize(source):
+            for (field, convert, default) in fields:
+                val = source.get(field)
+                if isinstance(val, str):
+                    source[field] = convert(val)
+                elif val is None:
+                    source[field] = list(default) if isinstance(default, list) else default
+            return source
+        return normalize
+
     # #############################################################################
     # Add Human_PPI specific result transformations for query results
     # #############################################################################
     def clean_query_GET_response(self, res):
-        logging.info("Query transformation call on {} hits".format(len(res['hits']['hits'])))
+        # documents indexed by the hub with all their fields are returned as stored
+        hits = [hit for hit in res['hits']['hits'] if not self.is_normalized(hit)]
+        if not hits:
+            return res
 
-        for i, hit in enumerate(res['hits']['hits']):
-            res = self.parse_confidence(res, i, hit)
-            res = self.parse_participants(res, i, hit)
-            res = self.parse_publications(res, i, hit)
-            res = self.parse_databases(res, i, hit)
+        logging.info("Query transformation call on {} hits".format(len(hits)))
+        normalize = self.compile_normalizer()
+        for hit in hits:
+            normalize(hit.setdefault('_source', {}))
         return res